@@ -0,0 +1,131 @@
+import ipaddress
+import random
+
+SERVER_TYPES = ['cx11', 'cx21', 'cx31', 'cpx11', 'cpx21', 'cpx31', 'ccx11']
+ROLES = ['web', 'api', 'db', 'worker', 'cache']
+ENVIRONMENTS = ['production', 'staging']
+# Records pointing here match nothing in the fleet (198.18.0.0/15 is
+# reserved for benchmarking).
+UNMATCHED_NETWORK = int(ipaddress.IPv4Address('198.18.0.0'))
+SERVER_NETWORK = int(ipaddress.IPv4Address('10.0.0.0'))
+
+def server_ipv4(index):
+    return str(ipaddress.IPv4Address(SERVER_NETWORK + index + 1))
+
+def server_ipv6_network(index):
+    return f"2001:db8:{index >> 16:x}:{index & 0xffff:x}::/64"
+
+def generate_fleet(servers, records, projects=None, zones=None, unmatched_ratio=0.1, seed=0):
+    # Returns a deterministic synthetic inventory in the shapes the Hetzner and
+    # Cloudflare APIs return:
+    #   projects: {token: {'project_name', 'servers', 'floating_ips', 'load_balancers', 'primary_ips', 'volumes'}}
+    #   zones: [zone, ...]
+    #   dns_records: {zone_id: [record, ...]}
+    # About 90% of records are A records, 5% AAAA into a server's /64 and 5%
+    # CNAMEs to another record of the same zone; unmatched_ratio of the
+    # address records point outside the fleet.
+    rng = random.Random(seed)
+    projects = projects or max(1, servers // 1000)
+    zones = zones or max(1, records // 1000)
+
+    fleet_projects = {}
+    for project in range(projects):
+        fleet_projects[f"token-{project}"] = {
+            'project_name': f"project-{project}",
+            'servers': [],
+            'floating_ips': [],
+            'load_balancers': [],
+            'primary_ips': [],
+            'volumes': [],
+        }
+    tokens = list(fleet_projects)
+
+    for index in range(servers):
+        project = fleet_projects[tokens[index % projects]]
+        project['servers'].append({
+            'id': index + 1,
+            'name': f"server-{index:05d}",
+            'status': 'running' if rng.random() < 0.95 else 'off',
+            'created': f"2024-{index % 12 + 1:02d}-{index % 28 + 1:02d}T00:00:00+00:00",
+            'server_type': {'name': rng.choice(SERVER_TYPES)},
+            'labels': {'role': rng.choice(ROLES), 'env': rng.choice(ENVIRONMENTS)},
+            'outgoing_traffic': rng.randrange(1 << 40),
+            'ingoing_traffic': rng.randrange(1 << 40),
+            'included_traffic': 20 * 10 ** 12,
+            'public_net': {
+                'ipv4': {'ip': server_ipv4(index)},
+                'ipv6': {'ip': server_ipv6_network(index)},
+                'floating_ips': [],
+            },
+        })
+
+    # One floating IP per hundred servers, every other one assigned, a load
+    # balancer per five hundred and a volume per fifty.
+    for index in range(servers // 100):
+        project = fleet_projects[tokens[index % projects]]
+        assigned = project['servers'][index % len(project['servers'])]['id'] if index % 2 == 0 else None
+        project['floating_ips'].append({
+            'id': index + 1,
+            'name': f"floating-{index:04d}",
+            'ip': str(ipaddress.IPv4Address(SERVER_NETWORK + (1 << 20) + index)),
+            'type': 'ipv4',
+            'server': assigned,
+        })
+    for index in range(servers // 500):
+        project = fleet_projects[tokens[index % projects]]
+        project['load_balancers'].append({
+            'id': index + 1,
+            'name': f"lb-{index:03d}",
+            'load_balancer_type': {'name': 'lb11'},
+            'public_net': {
+                'enabled': True,
+                'ipv4': {'ip': str(ipaddress.IPv4Address(SERVER_NETWORK + (1 << 21) + index))},
+                'ipv6': {'ip': f"2001:db8:ffff:{index:x}::1"},
+            },
+        })
+
+    for index in range(servers // 50):
+        project = fleet_projects[tokens[index % projects]]
+        project['volumes'].append({
+            'id': index + 1,
+            'name': f"volume-{index:04d}",
+            'size': rng.choice([10, 50, 100]),
+            'server': project['servers'][index % len(project['servers'])]['id'],
+        })
+
+    fleet_zones = [
+        {'id': f"zone{zone:05d}", 'name': f"example{zone}.com", 'modified_on': '2024-01-01T00:00:00Z'}
+        for zone in range(zones)
+    ]
+    dns_records = {zone['id']: [] for zone in fleet_zones}
+    for index in range(records):
+        zone = fleet_zones[index % zones]
+        zone_records = dns_records[zone['id']]
+        name = f"host{index}.{zone['name']}"
+        kind = rng.random()
+        if kind < 0.05 and zone_records:
+            record_type, content = 'CNAME', rng.choice(zone_records)['name']
+        elif kind < 0.10 and servers:
+            server = rng.randrange(servers)
+            record_type = 'AAAA'
+            content = str(ipaddress.ip_network(server_ipv6_network(server))[rng.randrange(1, 256)])
+        elif rng.random() < unmatched_ratio or not servers:
+            record_type, content = 'A', str(ipaddress.IPv4Address(UNMATCHED_NETWORK + rng.randrange(1 << 16)))
+        else:
+            record_type, content = 'A', server_ipv4(rng.randrange(servers))
+        zone_records.append({
+            'id': f"record{index:06d}",
+            'type': record_type,
+            'name': name,
+            'content': content,
+            'ttl': rng.choice([1, 60, 300, 3600]),
+            'proxied': False,
+        })
+
+    return {'projects': fleet_projects, 'zones': fleet_zones, 'dns_records': dns_records}
+
+def hetzner_projects(fleet):
+    return [
+        {'project_name': project['project_name'], 'api_token': token}
+        for token, project in fleet['projects'].items()
+    ]
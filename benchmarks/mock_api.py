@@ -0,0 +1,237 @@
+import argparse
+import json
+import random
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from benchmarks.fleet import generate_fleet, hetzner_projects
+from cloudmesh.pricing import FALLBACK_PATH
+
+HETZNER_PREFIX = '/v1/'
+CLOUDFLARE_PREFIX = '/client/v4/zones'
+# Default and maximum page sizes of the real APIs.
+PAGE_SIZES = {
+    'hetzner': {'default': 25, 'max': 50},
+    'zones': {'default': 20, 'max': 50},
+    'dns_records': {'default': 100, 'max': 5000},
+}
+HETZNER_RESOURCES = ('servers', 'floating_ips', 'load_balancers', 'primary_ips', 'volumes')
+
+def _new_stats():
+    # max_in_flight holds the most requests seen at once, in total ('all')
+    # and per API.
+    return {
+        'requests': 0, 'throttled': 0, 'bytes': 0, 'first_request_at': None,
+        'in_flight': {'all': 0, 'hetzner': 0, 'cloudflare': 0},
+        'max_in_flight': {'all': 0, 'hetzner': 0, 'cloudflare': 0},
+    }
+
+class MockApi:
+    # Local stand-in for the Hetzner Cloud and Cloudflare APIs, serving a
+    # fleet from generate_fleet() with the real pagination formats. Every
+    # request sleeps `latency` (+ up to `jitter`) seconds; with throttle_every
+    # set, every Nth request is answered 429 with a Retry-After header.
+    def __init__(self, fleet, latency=0.0, jitter=0.0, page_sizes=None, throttle_every=0, retry_after=0.1,
+                 host='127.0.0.1', port=0):
+        self.fleet = fleet
+        self.latency = latency
+        self.jitter = jitter
+        self.page_sizes = {key: dict(value, **(page_sizes or {}).get(key, {})) for key, value in PAGE_SIZES.items()}
+        self.throttle_every = throttle_every
+        self.retry_after = retry_after
+        # /v1/pricing and /v1/server_types answer with the shipped fallback
+        # prices.
+        with open(FALLBACK_PATH) as f:
+            self.pricing = json.load(f)['pricing']
+        self.stats = _new_stats()
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def hetzner_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    @property
+    def cloudflare_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/client/v4"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def reset_stats(self):
+        with self.lock:
+            self.stats = _new_stats()
+
+    def _in_flight(self, path, change):
+        api = 'hetzner' if path.startswith(HETZNER_PREFIX) else 'cloudflare'
+        with self.lock:
+            in_flight, peak = self.stats['in_flight'], self.stats['max_in_flight']
+            for key in ('all', api):
+                in_flight[key] += change
+                peak[key] = max(peak[key], in_flight[key])
+
+    def _count(self):
+        # Returns True when this request is to be throttled.
+        with self.lock:
+            if self.stats['first_request_at'] is None:
+                # Wall clock, comparable with a timestamp from another process.
+                self.stats['first_request_at'] = time.time()
+            self.stats['requests'] += 1
+            throttled = bool(self.throttle_every) and self.stats['requests'] % self.throttle_every == 0
+            if throttled:
+                self.stats['throttled'] += 1
+            return throttled
+
+    def _page(self, kind, items, query):
+        sizes = self.page_sizes[kind]
+        per_page = min(int(query.get('per_page', [sizes['default']])[0]), sizes['max'])
+        page = max(int(query.get('page', ['1'])[0]), 1)
+        last_page = max(1, -(-len(items) // per_page))
+        return items[(page - 1) * per_page:page * per_page], page, per_page, last_page
+
+    def respond(self, path, query, headers):
+        # Returns (status, headers, body).
+        if self.latency or self.jitter:
+            time.sleep(self.latency + random.uniform(0, self.jitter))
+        if self._count():
+            return 429, {'Retry-After': str(self.retry_after)}, b'{"error": "rate_limit_exceeded"}'
+
+        if path.startswith(HETZNER_PREFIX):
+            resource = path[len(HETZNER_PREFIX):]
+            token = headers.get('Authorization', '').replace('Bearer ', '', 1)
+            project = self.fleet['projects'].get(token)
+            is_metrics = resource.startswith('servers/') and resource.endswith('/metrics')
+            if resource not in HETZNER_RESOURCES + ('server_types', 'pricing') and not is_metrics:
+                return 404, {}, b'{"error": {"code": "not_found"}}'
+            if project is None:
+                return 401, {}, b'{"error": {"code": "unauthorized"}}'
+            if is_metrics:
+                body = {'metrics': self._metrics(int(resource.split('/')[1]), query)}
+            elif resource == 'pricing':
+                body = {'pricing': self.pricing}
+            else:
+                resources = self.pricing['server_types'] if resource == 'server_types' else project[resource]
+                items, page, per_page, last_page = self._page('hetzner', resources, query)
+                body = {resource: items, 'meta': {'pagination': {
+                    'page': page, 'per_page': per_page,
+                    'previous_page': page - 1 if page > 1 else None,
+                    'next_page': page + 1 if page < last_page else None,
+                    'last_page': last_page, 'total_entries': len(resources),
+                }}}
+        elif path == CLOUDFLARE_PREFIX:
+            body = self._cloudflare_page('zones', self.fleet['zones'], query)
+        elif path.startswith(CLOUDFLARE_PREFIX + '/') and path.endswith('/dns_records'):
+            zone_id = path[len(CLOUDFLARE_PREFIX) + 1:-len('/dns_records')]
+            if zone_id not in self.fleet['dns_records']:
+                return 404, {}, b'{"success": false, "errors": [{"code": 7003}]}'
+            body = self._cloudflare_page('dns_records', self.fleet['dns_records'][zone_id], query)
+        else:
+            return 404, {}, b'{"error": "not_found"}'
+        return 200, {'Content-Type': 'application/json'}, json.dumps(body).encode()
+
+    def _metrics(self, server_id, query):
+        # A flat, server-dependent load over the requested window.
+        start = datetime.fromisoformat(query['start'][0]).timestamp()
+        end = datetime.fromisoformat(query['end'][0]).timestamp()
+        step = int(query.get('step', ['60'])[0])
+        load = server_id % 100
+        series = {
+            'cpu': load,
+            'disk.0.iops.read': load * 2, 'disk.0.iops.write': load * 3,
+            'disk.0.bandwidth.read': load * 4096, 'disk.0.bandwidth.write': load * 8192,
+            'network.0.pps.in': load * 10, 'network.0.pps.out': load * 12,
+            'network.0.bandwidth.in': load * 1500, 'network.0.bandwidth.out': load * 1800,
+        }
+        timestamps = range(int(start), int(end) + 1, step)
+        return {
+            'start': query['start'][0], 'end': query['end'][0], 'step': step,
+            'time_series': {
+                name: {'values': [[timestamp, str(value)] for timestamp in timestamps]}
+                for name, value in series.items()
+            },
+        }
+
+    def _cloudflare_page(self, kind, items, query):
+        total = len(items)
+        items, page, per_page, last_page = self._page(kind, items, query)
+        return {
+            'success': True, 'errors': [], 'messages': [], 'result': items,
+            'result_info': {
+                'page': page, 'per_page': per_page, 'count': len(items), 'total_count': total,
+                'total_pages': last_page,
+            },
+        }
+
+    def _handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive, like the real APIs, so connection pooling is measured.
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                url = urlsplit(self.path)
+                api._in_flight(url.path, 1)
+                try:
+                    status, headers, body = api.respond(url.path, parse_qs(url.query), self.headers)
+                finally:
+                    api._in_flight(url.path, -1)
+                self.send_response(status)
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                with api.lock:
+                    api.stats['bytes'] += len(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve a synthetic Hetzner/Cloudflare inventory locally.")
+    parser.add_argument('--servers', type=int, default=100)
+    parser.add_argument('--records', type=int, default=500)
+    parser.add_argument('--projects', type=int, default=None)
+    parser.add_argument('--zones', type=int, default=None)
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds added to every response")
+    parser.add_argument('--jitter', type=float, default=0.0, help="Up to this many extra seconds per response")
+    parser.add_argument('--throttle-every', type=int, default=0, metavar='N', help="Answer every Nth request with 429")
+    parser.add_argument('--port', type=int, default=8080)
+    args = parser.parse_args(argv)
+
+    fleet = generate_fleet(args.servers, args.records, args.projects, args.zones)
+    api = MockApi(fleet, args.latency, args.jitter, throttle_every=args.throttle_every, port=args.port)
+    print(f"HETZNER_API_URL={api.hetzner_url}")
+    print(f"CLOUDFLARE_API_URL={api.cloudflare_url}")
+    print("CLOUDFLARE_TOKEN=any")
+    for index, project in enumerate(hetzner_projects(fleet), start=1):
+        print(f"HETZNER_TOKEN_{index}={project['api_token']} HETZNER_PROJECT_NAME_{index}={project['project_name']}")
+    try:
+        api.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
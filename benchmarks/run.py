@@ -0,0 +1,207 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+from benchmarks.fleet import generate_fleet, hetzner_projects
+from benchmarks.mock_api import MockApi
+from cloudmesh import api, client
+from cloudmesh.collector import collect_inventory
+from cloudmesh.mapping import build_mappings
+from cloudmesh.metrics import setup_prometheus_metrics
+from cloudmesh.report import save_reports
+
+# (servers, records) per fleet size.
+SIZES = {
+    'small': (10, 50),
+    'medium': (1000, 5000),
+    'large': (10000, 50000),
+    'xlarge': (50000, 200000),
+}
+BENCHMARKS = ('fetch', 'match', 'report', 'end_to_end')
+DEFAULT_SIZES = ['small', 'medium']
+DEFAULT_REPEAT = 3
+DEFAULT_OUTPUT = 'reports/benchmark.json'
+# A benchmark is reported as a regression when its median wall time or peak
+# memory grows by more than this factor against the baseline.
+DEFAULT_THRESHOLD = 1.25
+REPORT_FORMATS = ['html', 'csv', 'json']
+# Health checks would probe the synthetic (unroutable) addresses.
+HEALTH_CONFIG = {'default': []}
+
+def _fetch(context):
+    context['inventory'] = collect_inventory(['benchmark'], context['projects'], context['limits'])
+
+def _match(context):
+    _, metrics = setup_prometheus_metrics()
+    hetzner_results, zone_records, network_resources = context['inventory']
+    context['mappings'] = build_mappings(
+        hetzner_results, zone_records, metrics, HEALTH_CONFIG, network_resources=network_resources
+    )
+
+def _report(context):
+    result = context['mappings']
+    save_reports(
+        result.mapping_by_domain, result.unique_domains, result.total_a_records, result.matched_server_ips,
+        'benchmark', {'formats': REPORT_FORMATS, 'output_dir': context['output_dir']}, reverse_index=result.reverse_index
+    )
+
+def _end_to_end(context):
+    _fetch(context)
+    _match(context)
+    _report(context)
+
+STEPS = {
+    'fetch': _fetch,
+    'match': _match,
+    'report': _report,
+    'end_to_end': _end_to_end,
+}
+
+def _measure(mock, step, context, repeat, memory):
+    runs = []
+    requests_made = throttled = 0
+    for _ in range(repeat):
+        mock.reset_stats()
+        started = time.perf_counter()
+        step(context)
+        runs.append(time.perf_counter() - started)
+        requests_made, throttled = mock.stats['requests'], mock.stats['throttled']
+
+    peak_memory = None
+    if memory:
+        # A separate pass: tracemalloc slows allocation-heavy code down
+        # considerably, so it must not skew the wall times.
+        tracemalloc.start()
+        try:
+            step(context)
+            peak_memory = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    return {
+        'wall_seconds': {'min': min(runs), 'median': statistics.median(runs), 'runs': runs},
+        'peak_memory_bytes': peak_memory,
+        'requests': requests_made,
+        'throttled': throttled,
+    }
+
+def run_size(size, benchmarks, repeat, memory, mock_options):
+    servers, records = SIZES[size]
+    fleet = generate_fleet(servers, records)
+    results = []
+    with MockApi(fleet, **mock_options) as mock, tempfile.TemporaryDirectory(prefix='cloudmesh-bench-') as output_dir:
+        api.set_api_urls(mock.hetzner_url, mock.cloudflare_url)
+        api.set_cache(None)
+        client.set_client(client.ApiClient())
+        context = {
+            'projects': hetzner_projects(fleet),
+            'limits': None,
+            'output_dir': output_dir,
+        }
+        # match and report work on the output of the previous stages.
+        _fetch(context)
+        _match(context)
+        for name in benchmarks:
+            result = _measure(mock, STEPS[name], context, repeat, memory)
+            result.update(size=size, servers=servers, records=records, benchmark=name)
+            results.append(result)
+            print(f"{size:>7} {name:<11} median {result['wall_seconds']['median']:8.3f}s"
+                  + (f"  peak {result['peak_memory_bytes'] / 2 ** 20:8.1f} MiB" if memory else '')
+                  + f"  {result['requests']:6d} requests ({result['throttled']} throttled)")
+    return results
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    # Returns human-readable regressions of results against a baseline run.
+    previous = {(result['size'], result['benchmark']): result for result in baseline['results']}
+    regressions = []
+    for result in results:
+        before = previous.get((result['size'], result['benchmark']))
+        if before is None:
+            continue
+        checks = [('wall time', result['wall_seconds']['median'], before['wall_seconds']['median'])]
+        if result['peak_memory_bytes'] and before.get('peak_memory_bytes'):
+            checks.append(('peak memory', result['peak_memory_bytes'], before['peak_memory_bytes']))
+        for label, now, then in checks:
+            if then and now / then > threshold:
+                regressions.append(f"{result['size']}/{result['benchmark']}: {label} {now / then:.2f}x the baseline")
+    return regressions
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark CloudMesh against a local Hetzner/Cloudflare stand-in.")
+    parser.add_argument(
+        '--sizes', default=','.join(DEFAULT_SIZES), metavar='LIST',
+        help=f"Comma-separated fleet sizes out of {', '.join(SIZES)} (default: {','.join(DEFAULT_SIZES)})"
+    )
+    parser.add_argument(
+        '--benchmarks', default=','.join(BENCHMARKS), metavar='LIST',
+        help=f"Comma-separated benchmarks out of {', '.join(BENCHMARKS)} (default: all)"
+    )
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help="Timed runs per benchmark")
+    parser.add_argument('--no-memory', action='store_true', help="Skip the tracemalloc pass for peak memory")
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds the mock API adds to every response")
+    parser.add_argument('--jitter', type=float, default=0.0, help="Up to this many extra seconds per response")
+    parser.add_argument(
+        '--throttle-every', type=int, default=0, metavar='N', help="Have the mock API answer every Nth request with 429"
+    )
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help=f"Results file (default: {DEFAULT_OUTPUT})")
+    parser.add_argument('--baseline', default=None, metavar='FILE', help="Compare against a previous results file")
+    parser.add_argument(
+        '--threshold', type=float, default=DEFAULT_THRESHOLD,
+        help=f"Slowdown factor reported as a regression (default: {DEFAULT_THRESHOLD})"
+    )
+    args = parser.parse_args(argv)
+    for value, allowed in ((args.sizes, SIZES), (args.benchmarks, BENCHMARKS)):
+        unknown = [item for item in value.split(',') if item not in allowed]
+        if unknown:
+            parser.error(f"unknown value(s): {', '.join(unknown)}")
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    mock_options = {'latency': args.latency, 'jitter': args.jitter, 'throttle_every': args.throttle_every}
+    results = []
+    for size in args.sizes.split(','):
+        results.extend(run_size(size, args.benchmarks.split(','), args.repeat, not args.no_memory, mock_options))
+
+    document = {
+        'timestamp': datetime.utcnow().isoformat() + 'Z',
+        'git_commit': _git_commit(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'options': dict(mock_options, repeat=args.repeat),
+        'results': results,
+    }
+    directory = os.path.dirname(args.output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(document, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.fleet import generate_fleet, hetzner_projects
+from benchmarks.mock_api import MockApi
+
+# Wall time from spawning `python script.py COMMAND` to the first request
+# reaching the mock API: interpreter start, imports, configuration and client
+# setup. Commands that need the APIs should get there within the target.
+#
+# The 100 ms target is not met. Both commands need requests for their first
+# API call, and the interpreter start plus `import requests` (urllib3,
+# certifi, charset_normalizer, http.client) take about 0.14s on their own on
+# a typical installation. Everything else (prometheus_client, the report
+# and PDF modules, sqlite3) is imported only by the subcommands that use it,
+# after the first request. The floor is measured and printed next to the
+# commands, so what is left above it is cloudmesh's own startup.
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'script.py')
+COMMANDS = ('health', 'collect')
+DEFAULT_REPEAT = 5
+DEFAULT_TARGET = 0.1
+
+def _environment(mock, fleet, directory):
+    env = {key: value for key, value in os.environ.items() if not key.startswith(('HETZNER_', 'CLOUDFLARE_'))}
+    env.update({
+        'HETZNER_API_URL': mock.hetzner_url,
+        'CLOUDFLARE_API_URL': mock.cloudflare_url,
+        'CLOUDFLARE_TOKEN': 'benchmark',
+        # Nothing listens there; the push fails after the measured part.
+        'PUSHGATEWAY_URL': 'http://127.0.0.1:9',
+        'HEALTH_CHECK_TIMEOUT': '0.05',
+        'SHARD_DIR': directory,
+    })
+    for index, project in enumerate(hetzner_projects(fleet), start=1):
+        env[f'HETZNER_TOKEN_{index}'] = project['api_token']
+        env[f'HETZNER_PROJECT_NAME_{index}'] = project['project_name']
+    return env
+
+def _spawn(argv, env, cwd):
+    started = time.time()
+    process = subprocess.run(argv, env=env, cwd=cwd, capture_output=True, text=True)
+    return started, process
+
+def measure(command, mock, env, directory, repeat):
+    runs = []
+    for _ in range(repeat):
+        mock.reset_stats()
+        started, process = _spawn([sys.executable, SCRIPT, command, '--no-cache'], env, directory)
+        if process.returncode != 0:
+            raise RuntimeError(f"{command} failed:\n{process.stdout}{process.stderr}")
+        first_request_at = mock.stats['first_request_at']
+        if first_request_at is None:
+            raise RuntimeError(f"{command} made no API request")
+        runs.append(first_request_at - started)
+    return runs
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Measure CLI startup time up to the first API request.")
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help="Runs per command")
+    parser.add_argument(
+        '--target', type=float, default=DEFAULT_TARGET, metavar='SECONDS',
+        help=f"Exit with status 1 when a command's median is above this (default: {DEFAULT_TARGET})"
+    )
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    fleet = generate_fleet(10, 50)
+    over_target = []
+    with MockApi(fleet) as mock, tempfile.TemporaryDirectory(prefix='cloudmesh-startup-') as directory:
+        env = _environment(mock, fleet, directory)
+        # The interpreter alone, for scale: site-packages and .pth files can
+        # take a good part of the budget on some installations.
+        baseline = []
+        for _ in range(args.repeat):
+            started, _ = _spawn([sys.executable, '-c', 'pass'], env, directory)
+            baseline.append(time.time() - started)
+        baseline = statistics.median(baseline)
+        print(f"{'python':>8} median {baseline:6.3f}s (interpreter start and exit)")
+        floor = []
+        for _ in range(args.repeat):
+            started, _ = _spawn([sys.executable, '-c', 'import requests'], env, directory)
+            floor.append(time.time() - started)
+        floor = statistics.median(floor)
+        print(f"{'requests':>8} median {floor:6.3f}s (interpreter start and import requests, the floor below)")
+        for command in COMMANDS:
+            median = statistics.median(measure(command, mock, env, directory, args.repeat))
+            print(f"{command:>8} median {median:6.3f}s to the first API request "
+                  f"({median - floor:+.3f}s above the floor)")
+            if median > args.target:
+                over_target.append(command)
+    if over_target:
+        print(f"Above the {args.target:.3f}s target: {', '.join(over_target)}")
+        if floor > args.target:
+            print(f"The target is below the {floor:.3f}s it takes to start Python and import requests, which every "
+                  "command needs for its first API request; it cannot be met on this installation.")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from cloudmesh import client, tracing
+from cloudmesh.cache import token_fingerprint
+
+# Default concurrency limits per HTTP request: 'global' caps the requests
+# in flight against all APIs, the provider limits those against a single
+# API. Every request takes a slot, pages of a listing included.
+DEFAULT_LIMITS = {'global': 16, 'hetzner': 4, 'cloudflare': 8}
+# Number of pages of one listing queued at once once the page count is
+# known; how many of them are actually in flight is up to the limits.
+PAGE_WINDOW = 8
+
+# API base URLs, overridable (e.g. to point at a local stand-in) with
+# set_api_urls().
+HETZNER_API_URL = 'https://api.hetzner.cloud/v1'
+CLOUDFLARE_API_URL = 'https://api.cloudflare.com/client/v4'
+
+HETZNER_PER_PAGE = 50
+CLOUDFLARE_ZONES_PER_PAGE = 50
+CLOUDFLARE_DNS_PER_PAGE = 1000
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+# Optional InventoryCache shared by the fetch functions, see set_cache().
+_cache = None
+
+class RequestLimiter:
+    # Slots for HTTP requests in flight, per provider and across all of
+    # them, shared by every thread that calls the APIs.
+    def __init__(self, limits):
+        self.limits = dict(DEFAULT_LIMITS, **limits)
+        self.global_slots = threading.BoundedSemaphore(self.limits['global'])
+        self.provider_slots = {
+            provider: threading.BoundedSemaphore(limit)
+            for provider, limit in self.limits.items() if provider != 'global'
+        }
+
+    @contextmanager
+    def slot(self, provider):
+        # Provider slot first so that requests queued behind a busy provider
+        # do not hold global slots the other provider could use.
+        with self.provider_slots.get(provider, nullcontext()), self.global_slots:
+            yield
+
+_limiter = RequestLimiter(DEFAULT_LIMITS)
+# Thread pools fetching the pages after the first, one per provider, sized to
+# its limit: more threads could only wait for a slot, and pages of a busy
+# provider cannot take the threads of the other one.
+_page_executors = {}
+
+def set_cache(cache):
+    global _cache
+    _cache = cache
+
+def set_api_urls(hetzner_url=None, cloudflare_url=None):
+    global HETZNER_API_URL, CLOUDFLARE_API_URL
+    if hetzner_url:
+        HETZNER_API_URL = hetzner_url.rstrip('/')
+    if cloudflare_url:
+        CLOUDFLARE_API_URL = cloudflare_url.rstrip('/')
+
+def set_limits(limits):
+    # Replaces the request limits; sessions and page threads sized for the
+    # old ones are dropped. Only to be called while no fetch is running.
+    global _limiter
+    limits = dict(DEFAULT_LIMITS, **(limits or {}))
+    if limits == _limiter.limits:
+        return
+    _limiter = RequestLimiter(limits)
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+        for executor in _page_executors.values():
+            executor.shutdown(wait=False)
+        _page_executors.clear()
+
+def _api_urls():
+    return {'hetzner': HETZNER_API_URL, 'cloudflare': CLOUDFLARE_API_URL}
+
+def _provider(url):
+    # 'hetzner' or 'cloudflare' for URLs under the configured API URLs.
+    for provider, base_url in _api_urls().items():
+        if url == base_url or url.startswith(base_url + '/'):
+            return provider
+    return None
+
+def _pool_size(host):
+    # No more connections than requests can be in flight to the host, so
+    # none is discarded when they are returned to the pool.
+    limits = _limiter.limits
+    providers = [provider for provider, base_url in _api_urls().items() if urlsplit(base_url).netloc == host]
+    return min(limits['global'], sum(limits[provider] for provider in providers) or limits['global'])
+
+def get_session(url):
+    host = urlsplit(url).netloc
+    with _sessions_lock:
+        session = _sessions.get(host)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=_pool_size(host))
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _sessions[host] = session
+    return session
+
+def _page_executor(provider):
+    with _sessions_lock:
+        executor = _page_executors.get(provider)
+        if executor is None:
+            workers = _limiter.limits.get(provider, _limiter.limits['global'])
+            executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"pages-{provider}")
+            _page_executors[provider] = executor
+    return executor
+
+def _request(method, url, **kwargs):
+    # Every API call goes through here: it waits for a request slot and
+    # holds it until the response has been read.
+    with _limiter.slot(_provider(url)):
+        return client.request(method, url, session=get_session(url), **kwargs)
+
+def _page_items(data, result_key):
+    if 'result' in data:
+        return data['result']
+    return data[result_key]
+
+def _last_page(data):
+    if 'result_info' in data:
+        return data['result_info'].get('total_pages') or 1
+    if 'meta' in data and 'pagination' in data['meta']:
+        return data['meta']['pagination'].get('last_page') or 1
+    return 1
+
+def _get_page(url, headers, params, page, per_page):
+    page_params = dict(params, page=page, per_page=per_page)
+    response = _request('GET', url, headers=headers, params=page_params)
+    if response.status_code != 304:
+        response.raise_for_status()
+    return response
+
+def fetch_all_conditional(url, headers, params=None, result_key='servers', per_page=50, window=PAGE_WINDOW,
+                          etag=None, last_modified=None):
+    # Returns (results, validators). results is None when the API answered
+    # 304 Not Modified to the If-None-Match / If-Modified-Since validators.
+    base_params = dict(params or {})
+    request_headers = dict(headers)
+    if etag:
+        request_headers['If-None-Match'] = etag
+    if last_modified:
+        request_headers['If-Modified-Since'] = last_modified
+    first = _get_page(url, request_headers, base_params, 1, per_page)
+    validators = {'etag': first.headers.get('ETag'), 'last_modified': first.headers.get('Last-Modified')}
+    if first.status_code == 304:
+        return None, validators
+
+    data = first.json()
+    results = list(_page_items(data, result_key))
+    last_page = _last_page(data)
+    if last_page <= 1:
+        return results, validators
+
+    # Page 1 validators say nothing about the other pages.
+    validators = {'etag': None, 'last_modified': None}
+    executor = _page_executor(_provider(url))
+    get_page = tracing.wrap_context(_get_page)
+    pending = deque()
+    # At most `window` pages queued at a time, collected in page order.
+    for page in range(2, last_page + 1):
+        if len(pending) == window:
+            results.extend(_page_items(pending.popleft().result().json(), result_key))
+        pending.append(executor.submit(get_page, url, headers, base_params, page, per_page))
+    while pending:
+        results.extend(_page_items(pending.popleft().result().json(), result_key))
+    return results, validators
+
+# API fetch functions
+def fetch_all(url, headers, params=None, result_key='servers', per_page=50, window=PAGE_WINDOW):
+    results, _ = fetch_all_conditional(url, headers, params, result_key, per_page, window)
+    return results
+
+def cached_fetch_all(resource, key, url, headers, validator=None, **kwargs):
+    if _cache is None:
+        return fetch_all(url, headers, **kwargs)
+
+    entry = _cache.get(key)
+    if entry is not None and _cache.is_fresh(entry, resource, validator):
+        _cache.count('hits')
+        return entry['value']
+
+    _cache.count('misses')
+    try:
+        results, validators = fetch_all_conditional(
+            url, headers,
+            etag=entry and entry['etag'],
+            last_modified=entry and entry['last_modified'],
+            **kwargs
+        )
+    except requests.RequestException as e:
+        if entry is not None and _cache.is_servable_stale(entry):
+            _cache.count('stale')
+            print(f"Error fetching {resource}, serving cached copy: {e}")
+            return entry['value']
+        raise
+
+    if results is None:
+        _cache.count('not_modified')
+        _cache.touch(key)
+        return entry['value']
+    _cache.put(key, resource, results, validators['etag'], validators['last_modified'], validator)
+    return results
+
+def cached_fetch(resource, key, fetch):
+    # cached_fetch_all for anything that is not a paginated list: fetch() is
+    # called when the cached value is missing or past its TTL.
+    if _cache is None:
+        return fetch()
+
+    entry = _cache.get(key)
+    if entry is not None and _cache.is_fresh(entry, resource):
+        _cache.count('hits')
+        return entry['value']
+
+    _cache.count('misses')
+    try:
+        value = fetch()
+    except requests.RequestException as e:
+        if entry is not None and _cache.is_servable_stale(entry):
+            _cache.count('stale')
+            print(f"Error fetching {resource}, serving cached copy: {e}")
+            return entry['value']
+        raise
+    _cache.put(key, resource, value)
+    return value
+
+def fetch_cloudflare_zones(token):
+    headers = {"Authorization": f"Bearer {token}"}
+    return cached_fetch_all(
+        'zones', f"zones:{token_fingerprint(token)}",
+        f"{CLOUDFLARE_API_URL}/zones", headers,
+        per_page=CLOUDFLARE_ZONES_PER_PAGE
+    )
+
+def fetch_dns_records(token, zone_id, zone_modified_on=None):
+    # zone_modified_on comes from the zone listing. A new value refetches the
+    # records before their TTL is up; an unchanged one does not hold them
+    # past it, since record edits do not always change it.
+    headers = {"Authorization": f"Bearer {token}"}
+    return cached_fetch_all(
+        'dns_records', f"dns_records:{token_fingerprint(token)}:{zone_id}",
+        f"{CLOUDFLARE_API_URL}/zones/{zone_id}/dns_records", headers,
+        validator=zone_modified_on,
+        per_page=CLOUDFLARE_DNS_PER_PAGE
+    )
+
+def fetch_hetzner_servers(token, project_name):
+    headers = {"Authorization": f"Bearer {token}"}
+    servers = cached_fetch_all(
+        'servers', f"servers:{token_fingerprint(token)}",
+        f"{HETZNER_API_URL}/servers", headers,
+        per_page=HETZNER_PER_PAGE
+    )
+    return servers, project_name
+
+def _fetch_hetzner_list(token, resource):
+    headers = {"Authorization": f"Bearer {token}"}
+    return cached_fetch_all(
+        resource, f"{resource}:{token_fingerprint(token)}",
+        f"{HETZNER_API_URL}/{resource}", headers,
+        result_key=resource,
+        per_page=HETZNER_PER_PAGE
+    )
+
+def fetch_hetzner_floating_ips(token):
+    return _fetch_hetzner_list(token, 'floating_ips')
+
+def fetch_hetzner_load_balancers(token):
+    return _fetch_hetzner_list(token, 'load_balancers')
+
+def fetch_hetzner_primary_ips(token):
+    return _fetch_hetzner_list(token, 'primary_ips')
+
+def fetch_hetzner_volumes(token):
+    return _fetch_hetzner_list(token, 'volumes')
+
+def fetch_hetzner_server_metrics(token, server_id, metric_types, start, end, step):
+    # start and end are ISO 8601 timestamps, step is in seconds.
+    headers = {"Authorization": f"Bearer {token}"}
+    url = f"{HETZNER_API_URL}/servers/{server_id}/metrics"
+    params = {'type': ','.join(metric_types), 'start': start, 'end': end, 'step': step}
+    response = _request('GET', url, headers=headers, params=params)
+    response.raise_for_status()
+    return response.json()['metrics']
+
+# Pricing is not kept in the inventory cache, cloudmesh.pricing caches the
+# whole catalog on its own schedule.
+def fetch_hetzner_server_types(token):
+    headers = {"Authorization": f"Bearer {token}"}
+    return fetch_all(
+        f"{HETZNER_API_URL}/server_types", headers, result_key='server_types', per_page=HETZNER_PER_PAGE
+    )
+
+def fetch_hetzner_pricing(token):
+    headers = {"Authorization": f"Bearer {token}"}
+    url = f"{HETZNER_API_URL}/pricing"
+    response = _request('GET', url, headers=headers)
+    response.raise_for_status()
+    return response.json()['pricing']
@@ -0,0 +1,103 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from cloudmesh.defaults import DEFAULT_CACHE_PATH, DEFAULT_MAX_STALENESS
+
+# Seconds a cached resource is served without asking the API again.
+DEFAULT_TTLS = {
+    'servers': 60,
+    'zones': 300,
+    'dns_records': 300,
+    'floating_ips': 300,
+    'load_balancers': 300,
+    'primary_ips': 300,
+    'volumes': 300,
+    'server_metrics': 900,
+}
+
+def token_fingerprint(token):
+    # Cache keys must not contain API tokens.
+    return hashlib.sha256(token.encode()).hexdigest()[:16]
+
+class InventoryCache:
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttls=None, max_staleness=DEFAULT_MAX_STALENESS):
+        self.path = path
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self.max_staleness = max_staleness
+        self.stats = {'hits': 0, 'misses': 0, 'not_modified': 0, 'stale': 0}
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS entries ('
+            ' key TEXT PRIMARY KEY,'
+            ' resource TEXT NOT NULL,'
+            ' value TEXT NOT NULL,'
+            ' etag TEXT,'
+            ' last_modified TEXT,'
+            ' validator TEXT,'
+            ' fetched_at REAL NOT NULL)'
+        )
+        self._conn.commit()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT value, etag, last_modified, validator, fetched_at FROM entries WHERE key = ?',
+                (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        value, etag, last_modified, validator, fetched_at = row
+        return {
+            'value': json.loads(value),
+            'etag': etag,
+            'last_modified': last_modified,
+            'validator': validator,
+            'fetched_at': fetched_at,
+        }
+
+    def put(self, key, resource, value, etag=None, last_modified=None, validator=None):
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO entries (key, resource, value, etag, last_modified, validator, fetched_at)'
+                ' VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (key, resource, json.dumps(value), etag, last_modified, validator, time.time())
+            )
+            self._conn.commit()
+
+    def touch(self, key):
+        with self._lock:
+            self._conn.execute('UPDATE entries SET fetched_at = ? WHERE key = ?', (time.time(), key))
+            self._conn.commit()
+
+    def count(self, stat):
+        with self._lock:
+            self.stats[stat] += 1
+
+    def age(self, entry):
+        return time.time() - entry['fetched_at']
+
+    def is_fresh(self, entry, resource, validator=None):
+        # A validator (e.g. a zone's modified_on) is only a hint that the
+        # data changed: a different one refetches before the TTL is up, the
+        # same one does not keep the entry past it. Cloudflare does not
+        # reliably bump a zone's modified_on when its records change.
+        if validator is not None and entry['validator'] != validator:
+            return False
+        return self.age(entry) < self.ttls.get(resource, 0)
+
+    def is_servable_stale(self, entry):
+        # Only asked when refreshing the entry failed.
+        return self.max_staleness is not None and self.age(entry) < self.max_staleness
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
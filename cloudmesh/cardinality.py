@@ -0,0 +1,94 @@
+# Labels dropped, in order, when a metric has more series than its budget.
+# A dropped label is exported with an empty value, which Prometheus treats
+# the same as an absent label, and the series that collapse into one are
+# aggregated.
+DEFAULT_DROP_ORDER = {
+    'mapping_info_clean': ['subdomain', 'ip', 'server_name'],
+    'dns_ttl': ['subdomain', 'ip'],
+}
+DEFAULT_BUDGETS = {
+    'mapping_info_clean': 10000,
+    'dns_ttl': 10000,
+}
+AGGREGATIONS = {
+    'sum': sum,
+    'min': min,
+    'max': max,
+}
+OVERFLOW_VALUE = '__overflow__'
+
+class CardinalityBudget:
+    def __init__(self, budgets=None, drop_order=None):
+        self.budgets = dict(DEFAULT_BUDGETS, **(budgets or {}))
+        self.drop_order = dict(DEFAULT_DROP_ORDER, **(drop_order or {}))
+        # metric key -> what the last reduce() did to it
+        self.report = {}
+
+    def reduce(self, metric_key, labelnames, series, aggregate='sum'):
+        # series maps label value tuples (in labelnames order) to values.
+        # Returns the series unchanged when within budget, otherwise a smaller
+        # mapping with dropped labels blanked and values aggregated.
+        budget = self.budgets.get(metric_key)
+        before = len(series)
+        self.report[metric_key] = {'series_before': before, 'series_after': before, 'dropped_labels': [], 'overflow': 0}
+        if not budget or before <= budget:
+            return series
+
+        combine = AGGREGATIONS[aggregate]
+        dropped = []
+        for label in self.drop_order.get(metric_key, []):
+            if len(series) <= budget:
+                break
+            index = labelnames.index(label)
+            grouped = {}
+            for labelvalues, value in series.items():
+                key = labelvalues[:index] + ('',) + labelvalues[index + 1:]
+                grouped.setdefault(key, []).append(value)
+            series = {key: combine(values) for key, values in grouped.items()}
+            dropped.append(label)
+
+        overflow = 0
+        if len(series) > budget:
+            # Still over budget: keep the first budget - 1 series and fold the
+            # rest into a single overflow series.
+            keys = sorted(series)
+            kept = {key: series[key] for key in keys[:budget - 1]}
+            rest = [series[key] for key in keys[budget - 1:]]
+            kept[tuple(OVERFLOW_VALUE for _ in labelnames)] = combine(rest)
+            overflow = len(rest)
+            series = kept
+
+        self.report[metric_key].update(series_after=len(series), dropped_labels=dropped, overflow=overflow)
+        return series
+
+    def reduced(self, metric_key):
+        report = self.report.get(metric_key)
+        return bool(report) and report['series_after'] != report['series_before']
+
+    def record_metrics(self, metrics):
+        for metric_key, report in self.report.items():
+            metrics['metric_series'].labels(metric=metric_key).set(report['series_after'])
+            metrics['cardinality_aggregated_series'].labels(metric=metric_key).set(
+                report['series_before'] - report['series_after']
+            )
+            for label in self.drop_order.get(metric_key, []):
+                metrics['cardinality_dropped_label'].labels(metric=metric_key, label=label).set(
+                    1 if label in report['dropped_labels'] else 0
+                )
+            if report['dropped_labels'] or report['overflow']:
+                print(f"Cardinality budget for {metric_key}: {report['series_before']} series reduced to "
+                      f"{report['series_after']} (dropped labels: {', '.join(report['dropped_labels']) or 'none'}, "
+                      f"{report['overflow']} series folded into overflow)")
+
+def sync_series(metric, series):
+    # Make the metric hold exactly these series: remove series that are no
+    # longer present (for registries that outlive a run) and set every value.
+    # Removing first means only the previous series are collected, which
+    # costs nothing on a fresh registry.
+    for family in metric.collect():
+        for sample in family.samples:
+            labelvalues = tuple(sample.labels.values())
+            if labelvalues not in series:
+                metric.remove(*labelvalues)
+    for labelvalues, value in series.items():
+        metric.labels(*labelvalues).set(value)
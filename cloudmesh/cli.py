@@ -0,0 +1,688 @@
+import argparse
+import sys
+import time
+from dataclasses import asdict
+from datetime import datetime
+
+from cloudmesh import tracing
+from cloudmesh.defaults import (
+    DEFAULT_FORMATS, DEFAULT_HISTORY_DIR, DEFAULT_MAX_STALENESS, HISTORY_BUCKETS, SUPPORTED_FORMATS,
+)
+from cloudmesh.shard import DEFAULT_SHARD_DIR, SHARD_KEYS, merge_shards, owns, parse_shard, shard_path, write_shard
+
+# Subcommands import what they use inside their functions, so `collect` never
+# loads prometheus_client and `health` gets to its first API call without
+# the collector's report and metrics stack. Without a subcommand, `run` does
+# everything: collect, match, report and push.
+COMMANDS = ('run', 'collect', 'health', 'report', 'push', 'history')
+# Secrets each command cannot do without, see cloudmesh.config.load_config.
+REQUIRES = {
+    'run': ('cloudflare', 'hetzner', 'pushgateway'),
+    'collect': ('cloudflare', 'hetzner'),
+    'health': ('hetzner', 'pushgateway'),
+    'report': (),
+    'push': ('pushgateway',),
+    'history': (),
+}
+# Health checks of the report command: reports do not show probe results.
+NO_HEALTH_CHECKS = {'default': [], 'labels': {}}
+
+def _common_options():
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument(
+        '--max-staleness', type=float, default=None, metavar='SECONDS',
+        help="When fetching from the API fails, serve cached inventory up to this many seconds old instead of "
+             "failing; 0 disables the fallback. Cache hits are not bounded by it: cached data is used until its "
+             f"per-resource TTL is up (default: CACHE_MAX_STALENESS or {DEFAULT_MAX_STALENESS})"
+    )
+    parser.add_argument('--no-cache', action='store_true', help="Always fetch the full inventory from the APIs")
+    parser.add_argument(
+        '--trace', default=None, metavar='FILE',
+        help="Append the spans of each run (stages, zones, API requests) to this file (default: TRACE_FILE)"
+    )
+    parser.add_argument(
+        '--trace-format', default=None, choices=tracing.TRACE_FORMATS,
+        help="Trace file format: one JSON object per span, or OTLP/JSON as written by the OpenTelemetry "
+             "collector's file exporter (default: TRACE_FORMAT or json)"
+    )
+    parser.add_argument(
+        '--profile', nargs='?', const='cloudmesh.pstats', default=None, metavar='FILE',
+        help="Run under cProfile and write the stats to FILE (default: cloudmesh.pstats); "
+             "inspect with python -m pstats"
+    )
+    return parser
+
+def _report_options(parser):
+    parser.add_argument(
+        '--formats', default=None, metavar='LIST',
+        help=f"Comma-separated report formats out of {', '.join(SUPPORTED_FORMATS)} "
+             f"(default: REPORT_FORMATS or {','.join(DEFAULT_FORMATS)})"
+    )
+    parser.add_argument(
+        '--pdf-workers', type=int, default=None, metavar='N',
+        help="Number of PDF chunks rendered in parallel (default: REPORT_PDF_WORKERS or the CPU count)"
+    )
+    parser.add_argument(
+        '--incremental', action='store_true',
+        help="Diff against the previous run's snapshot, append the changes to the change log "
+             "and only re-render report sections of changed domains"
+    )
+    parser.add_argument(
+        '--dns-check', action='store_true',
+        help="Resolve every configured name and flag records whose live answers differ from Cloudflare's "
+             "configuration (default: DNS_CHECK)"
+    )
+
+def _inventory_option(parser):
+    parser.add_argument(
+        '--inventory', nargs='+', default=None, metavar='PATH',
+        help=f"Shard files written by collect, or directories of them (default: SHARD_DIR or {DEFAULT_SHARD_DIR})"
+    )
+
+def build_parser():
+    common = _common_options()
+    parser = argparse.ArgumentParser(
+        description="Map Cloudflare DNS records to Hetzner Cloud servers.",
+        epilog="Without a command, run is assumed."
+    )
+    commands = parser.add_subparsers(dest='command', metavar='COMMAND')
+
+    run = commands.add_parser(
+        'run', parents=[common], help="Collect, match, write the reports and push the metrics (the default)"
+    )
+    _report_options(run)
+    run.add_argument(
+        '--daemon', action='store_true',
+        help="Run as a long-lived service that serves /metrics and refreshes each data source on its own interval"
+    )
+    run.add_argument(
+        '--metrics-port', type=int, default=None, metavar='PORT',
+        help="Port for the /metrics endpoint in daemon mode (default: METRICS_PORT or 9914)"
+    )
+    run.add_argument(
+        '--merge', nargs='+', default=None, metavar='PATH',
+        help="Build the mapping, reports and metrics from shard files (or directories of them) instead of the APIs"
+    )
+
+    collect = commands.add_parser(
+        'collect', parents=[common], help="Fetch the inventory and write it to a shard file; no reports or metrics"
+    )
+    collect.add_argument(
+        '--shard', default='1/1', metavar='N/COUNT',
+        help="Only collect shard N of COUNT (default: 1/1, everything)"
+    )
+    collect.add_argument(
+        '--shard-by', default=None, choices=SHARD_KEYS,
+        help="Spread Cloudflare work over shards by account or by zone (default: SHARD_BY or account)"
+    )
+    collect.add_argument(
+        '--shard-dir', default=None, metavar='DIR',
+        help=f"Where shards are written (default: SHARD_DIR or {DEFAULT_SHARD_DIR})"
+    )
+
+    commands.add_parser(
+        'health', parents=[common],
+        help="Probe every server's health checks and push only the health metrics"
+    )
+
+    report = commands.add_parser('report', parents=[common], help="Write the reports from collected shards")
+    _inventory_option(report)
+    _report_options(report)
+
+    push = commands.add_parser('push', parents=[common], help="Push the metrics of collected shards")
+    _inventory_option(push)
+
+    history = commands.add_parser('history', help="Query the history of past runs")
+    queries = history.add_subparsers(dest='query', metavar='QUERY', required=True)
+    span = argparse.ArgumentParser(add_help=False)
+    span.add_argument('--days', type=float, default=None, help="Only the last N days (default: 90)")
+    span.add_argument('--since', default=None, metavar='DATE', help="From this date or time (ISO 8601, UTC)")
+    span.add_argument('--until', default=None, metavar='DATE', help="Up to this date or time (ISO 8601, UTC)")
+    span.add_argument(
+        '--history-dir', default=None, metavar='DIR',
+        help=f"Where the history is stored (default: HISTORY_DIR or {DEFAULT_HISTORY_DIR})"
+    )
+    span.add_argument('--json', action='store_true', help="Print JSON instead of a table")
+    costs = queries.add_parser('costs', parents=[span], help="Monthly cost and resource count per project")
+    costs.add_argument('--project', default=None, help="Only this project")
+    costs.add_argument(
+        '--bucket', default='day', choices=HISTORY_BUCKETS, help="One line per project and run, day, week or month"
+    )
+    record = queries.add_parser(
+        'record', parents=[span], help="What a domain's records pointed at, and since when"
+    )
+    record.add_argument('domain')
+    record.add_argument('--subdomain', default=None, help="Only this record name")
+    address = queries.add_parser('ip', parents=[span], help="Resources and records that had an address")
+    address.add_argument('ip')
+    queries.add_parser('runs', parents=[span], help="Summary of each recorded run")
+    return parser
+
+def parse_args(argv=None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    if not argv or (argv[0] not in COMMANDS and argv[0] not in ('-h', '--help')):
+        argv.insert(0, 'run')
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command == 'run' and args.merge and args.daemon:
+        parser.error("--merge cannot be combined with --daemon")
+    if args.command == 'collect':
+        try:
+            parse_shard(args.shard)
+        except ValueError as e:
+            parser.error(str(e))
+    return args
+
+def _tracer(config, metrics=None):
+    tracer = tracing.Tracer(metrics, config.tracing.file, config.tracing.format)
+    tracing.set_tracer(tracer)
+    return tracer
+
+def _setup_api(config, metrics=None):
+    from cloudmesh import api, client
+
+    cache = config.cache.open()
+    api.set_cache(cache)
+    api.set_api_urls(config.api.hetzner_url, config.api.cloudflare_url)
+    client.set_client(client.ApiClient(metrics=metrics, **config.api.client_options()))
+    return cache
+
+def _load_pricing(config):
+    return config.pricing.load(config.hetzner_projects, use_cache=not config.cache.disabled)
+
+def _collect(config, cloudflare_tokens, hetzner_projects, zone_filter=None):
+    # (hetzner_results, zone_records, network_resources, server_usage) from
+    # the APIs, the same shapes merge_shards returns.
+    from cloudmesh.collector import collect_inventory, collect_usage
+
+    limits = config.collector.limits
+    hetzner_results, zone_records, network_resources = collect_inventory(
+        cloudflare_tokens, hetzner_projects, limits, config.collector.network_resources, zone_filter
+    )
+    server_usage = None
+    if config.collector.metrics_window:
+        server_usage = collect_usage(hetzner_projects, hetzner_results, limits, config.collector.metrics_window)
+    return hetzner_results, zone_records, network_resources, server_usage
+
+def _merge(config, paths):
+    with tracing.span('merge_shards'):
+        return merge_shards(paths or [config.shard.dir])
+
+def _build(config, inventory, metrics, health_config, snapshot=None):
+    from cloudmesh.mapping import build_mappings
+
+    hetzner_results, zone_records, network_resources, server_usage = inventory
+    return build_mappings(
+        hetzner_results, zone_records, metrics, health_config, snapshot, config.metrics.options(), network_resources,
+        _load_pricing(config), server_usage, config.dns_check.resolver()
+    )
+
+def _save_reports(config, result, snapshot=None):
+    from cloudmesh.report import save_reports
+
+    return save_reports(
+        result.mapping_by_domain, result.unique_domains, result.total_a_records, result.matched_server_ips,
+        datetime.now().strftime("%Y%m%d_%H%M%S"), asdict(config.report), snapshot, result.reverse_index,
+        result.dns_checks
+    )
+
+def _load_snapshot(config):
+    from cloudmesh.diff import MappingSnapshot
+
+    if not config.incremental.enabled:
+        return None
+    return MappingSnapshot.load(config.incremental.snapshot_path)
+
+def _save_snapshot(config, snapshot):
+    from cloudmesh.diff import write_change_log
+
+    path = config.incremental.change_log_path
+    changes = write_change_log(snapshot.diff, datetime.utcnow().isoformat() + 'Z', path)
+    snapshot.save(config.incremental.snapshot_path)
+    print(f"{changes} changes since the previous run written to {path}: {snapshot.summary()}")
+
+def _record_history(config, result):
+    # History is a by-product: a run still succeeds when it cannot be written.
+    import sqlite3
+
+    from cloudmesh.history import HistoryStore
+
+    if not config.history.enabled:
+        return
+    try:
+        with tracing.span('record_history'):
+            HistoryStore(config.history.dir).record(result)
+    except (sqlite3.Error, OSError, ValueError) as e:
+        print(f"Error recording the run in {config.history.dir}: {e}")
+
+def _deliver(config, report_paths, result):
+    # Starts sending the reports to Slack, see cloudmesh.slack.deliver.
+    # Returns None when Slack is not configured.
+    from cloudmesh.model import total_spending
+    from cloudmesh.slack import deliver, unmatched_lines
+
+    slack = config.slack
+    if not slack.enabled:
+        return None
+    files = [report_paths[kind] for kind in slack.files if kind in report_paths]
+    summary = (f"CloudMesh Report: {len(result.unique_domains)} domains, {result.total_a_records} records, "
+               f"{len(result.matched_server_ips)} matched servers, {len(result.unmatched_ips)} unmatched IPs, "
+               f"{total_spending(result.mapping_by_domain):.2f} EUR/month")
+    unmatched = unmatched_lines(result.mapping_by_domain) if slack.unmatched_thread else ()
+    if unmatched:
+        summary += "\nUnmatched IPs and the records pointing at them are in the thread."
+    return deliver(
+        slack.bot_token, slack.channel_ids, files, "CloudMesh Weekly Report - Server and Cloudflare monitoring",
+        summary, unmatched, slack.workers, slack.attempts
+    )
+
+def _push(config, job, registry):
+    from cloudmesh.push import push_groups, summarize
+
+    try:
+        with tracing.span('push'):
+            pushed, deleted = push_groups(config.pushgateway_url, job, registry, **config.push.options())
+    except Exception as e:
+        print(f"Error pushing metrics to Prometheus: {e}")
+        return
+    line, failed = summarize(pushed, deleted)
+    if failed:
+        print(f"Error pushing metrics to Prometheus: {len(failed)} groups failed, "
+              f"first {failed[0].path}: {failed[0].error}")
+        print(f"Metrics partly pushed to Prometheus: {line}.")
+    else:
+        print(f"Metrics pushed to Prometheus successfully: {line}.")
+
+def _print_summary(result, cache=None):
+    print(f"Processing complete. {len(result.unique_domains)} domains, {result.total_a_records} A records, "
+          f"{len(result.matched_server_ips)} matched servers.")
+    reverse_index = result.reverse_index
+    unused = sum(count for count, _ in reverse_index.unused.values())
+    unused_cost = sum(cost for _, cost in reverse_index.unused.values())
+    unassigned = sum(count for count, _ in reverse_index.unassigned.values())
+    unassigned_cost = sum(cost for _, cost in reverse_index.unassigned.values())
+    print(f"{unused} resources without records ({unused_cost:.2f} EUR/month), "
+          f"{unassigned} unassigned IPs ({unassigned_cost:.2f} EUR/month), "
+          f"{len(reverse_index.stopped_targets)} records pointing at stopped resources, "
+          f"{len(reverse_index.unassigned_targets)} at unassigned IPs, "
+          f"{len(reverse_index.shared_ips)} addresses used by several zones.")
+    if result.dns_checks is not None:
+        counts = {}
+        for check in result.dns_checks:
+            counts[check.status] = counts.get(check.status, 0) + 1
+        print("DNS cross-check: " + ', '.join(f"{count} {status}" for status, count in sorted(counts.items())) + ".")
+    if cache is not None:
+        print(f"Inventory cache: {cache.stats['hits']} hits, {cache.stats['misses']} misses, "
+              f"{cache.stats['not_modified']} not modified, {cache.stats['stale']} served stale.")
+
+# run
+def run(args, config):
+    if args.daemon:
+        run_daemon(config)
+        return
+    from cloudmesh.metrics import setup_prometheus_metrics
+
+    registry, metrics = setup_prometheus_metrics()
+    tracer = _tracer(config, metrics)
+    with tracer.span('run'):
+        _run_once(args, config, registry, metrics)
+    spans = tracer.flush()
+    if spans:
+        print(f"{spans} spans written to {tracer.path}")
+
+def _run_once(args, config, registry, metrics):
+    from cloudmesh.metrics import set_summary_metrics
+
+    start_time = time.time()
+    delivery = None
+    try:
+        cache = _setup_api(config, metrics)
+        snapshot = _load_snapshot(config)
+        if args.merge:
+            inventory = _merge(config, args.merge)
+        else:
+            inventory = _collect(config, config.cloudflare_tokens, config.hetzner_projects)
+        result = _build(config, inventory, metrics, asdict(config.health), snapshot)
+
+        report_paths = _save_reports(config, result, snapshot)
+        if snapshot is not None:
+            _save_snapshot(config, snapshot)
+        _record_history(config, result)
+        delivery = _deliver(config, report_paths, result)
+
+        set_summary_metrics(metrics, *result[1:5])
+        _print_summary(result, cache)
+
+    except Exception as e:
+        print(f"Error during processing: {e}")
+        metrics['error_counter'].inc()
+        raise
+
+    finally:
+        metrics['run_duration'].set(time.time() - start_time)
+        metrics['run_counter'].inc()
+        _push(config, 'cloudmesh', registry)
+        # Slack delivery runs in the background while the metrics are pushed.
+        if delivery is not None:
+            delivery.wait()
+
+def run_daemon(config):
+    import signal
+
+    from prometheus_client import start_http_server
+
+    from cloudmesh.collector import collect_servers, collect_usage, collect_zones
+    from cloudmesh.diff import MappingSnapshot
+    from cloudmesh.mapping import build_mappings
+    from cloudmesh.metrics import set_summary_metrics, setup_prometheus_metrics
+    from cloudmesh.scheduler import IntervalScheduler
+
+    registry, metrics = setup_prometheus_metrics()
+    cloudflare_tokens = config.cloudflare_tokens
+    hetzner_projects = config.hetzner_projects
+    collector_limits = config.collector.limits
+    network_resources = config.collector.network_resources
+    server_metrics_window = config.collector.metrics_window
+    health_config = asdict(config.health)
+    metrics_config = config.metrics.options()
+    daemon_config = config.daemon
+    _setup_api(config, metrics)
+    tracer = _tracer(config, metrics)
+    # The registry lives as long as the process, so the snapshot diff is what
+    # removes the series of records and servers that have disappeared.
+    snapshot = _load_snapshot(config) or MappingSnapshot()
+    # One resolver for the process, so its cache carries over between
+    # rebuilds.
+    dns_resolver = config.dns_check.resolver()
+    state = {}
+
+    def rebuild():
+        # Nothing to build until both the servers and the DNS records have
+        # been collected once.
+        if not all(key in state for key in ('hetzner_results', 'zone_records', 'pricing')):
+            return
+        start_time = time.time()
+        try:
+            state['result'] = build_mappings(
+                state['hetzner_results'], state['zone_records'], metrics, health_config, snapshot, metrics_config,
+                state['network_resources'], state['pricing'], state.get('server_usage'), dns_resolver
+            )
+            set_summary_metrics(metrics, *state['result'][1:5])
+            if config.incremental.enabled:
+                _save_snapshot(config, snapshot)
+        finally:
+            metrics['run_duration'].set(time.time() - start_time)
+            metrics['run_counter'].inc()
+
+    def traced(name, func):
+        # Each scheduled task is one trace, written out when it finishes. A
+        # failed fetch counts as an error just like a failed rebuild.
+        def run():
+            try:
+                with tracer.span(name):
+                    func()
+            except Exception:
+                metrics['error_counter'].inc()
+                raise
+            finally:
+                tracer.flush()
+        return run
+
+    def refresh_pricing():
+        # The catalog is reloaded once its TTL has passed, not on every run.
+        if 'pricing' not in state or state['pricing'].expired:
+            state['pricing'] = _load_pricing(config)
+
+    def refresh_usage():
+        if server_metrics_window:
+            state['server_usage'] = collect_usage(
+                hetzner_projects, state['hetzner_results'], collector_limits, server_metrics_window
+            )
+
+    def refresh_servers():
+        state['hetzner_results'], state['network_resources'] = collect_servers(
+            hetzner_projects, collector_limits, network_resources
+        )
+        refresh_usage()
+        refresh_pricing()
+        rebuild()
+
+    def refresh_dns():
+        state['zone_records'] = collect_zones(cloudflare_tokens, collector_limits)
+        rebuild()
+
+    def write_report():
+        if 'result' not in state:
+            raise RuntimeError("No inventory collected yet")
+        # Rendered in full: the snapshot is re-diffed on every rebuild, so by
+        # now its diff only holds the last refresh's changes and any cached
+        # section may predate earlier ones. The cached sections are dropped
+        # for the same reason.
+        snapshot.sections = {}
+        paths = _save_reports(config, state['result'])
+        _record_history(config, state['result'])
+        delivery = _deliver(config, paths, state['result'])
+        if delivery is not None:
+            delivery.wait()
+
+    # Served from the start, so that a failing first collection shows up in
+    # the error counter instead of ending the process. It is retried on the
+    # source's next interval like any other failed refresh.
+    start_http_server(daemon_config.metrics_port, addr=daemon_config.metrics_addr, registry=registry)
+    print(f"Serving metrics on {daemon_config.metrics_addr}:{daemon_config.metrics_port}/metrics")
+
+    scheduler = IntervalScheduler()
+    scheduler.add('servers', daemon_config.servers_interval, traced('refresh_servers', refresh_servers))
+    scheduler.add('dns', daemon_config.dns_interval, traced('refresh_dns', refresh_dns))
+    # A report due before there is anything to report on is retried once
+    # the sources have had another chance, not a whole report interval later.
+    scheduler.add('report', daemon_config.report_interval, traced('write_report', write_report),
+                  retry_interval=min(daemon_config.servers_interval, daemon_config.dns_interval))
+    signal.signal(signal.SIGTERM, lambda signum, frame: scheduler.stop())
+    signal.signal(signal.SIGINT, lambda signum, frame: scheduler.stop())
+    scheduler.run()
+    print("Daemon stopped.")
+
+# collect
+def collect(args, config):
+    spec = parse_shard(args.shard, config.shard.by)
+    tracer = _tracer(config)
+    with tracer.span('run', command='collect', shard=args.shard):
+        _setup_api(config)
+        projects = [project for project in config.hetzner_projects if owns(spec, project['project_name'])]
+        accounts = config.cloudflare_accounts
+        if spec.by == 'account':
+            tokens = [account['api_token'] for account in accounts if owns(spec, account['account_name'])]
+            zone_filter = None
+        else:
+            tokens = [account['api_token'] for account in accounts]
+            zone_filter = lambda zone: owns(spec, zone['name'])
+        hetzner_results, zone_records, network_resources, server_usage = _collect(
+            config, tokens, projects, zone_filter
+        )
+
+        with tracing.span('write_shard'):
+            path = write_shard(
+                shard_path(spec, config.shard.dir), spec, hetzner_results, zone_records, network_resources,
+                server_usage
+            )
+    tracer.flush()
+    print(f"Shard {args.shard}: {len(projects)} projects, {len(hetzner_results)} servers, "
+          f"{len(zone_records)} zones written to {path}")
+
+# health
+def health(args, config):
+    from cloudmesh.collector import collect_servers
+    from cloudmesh.health import probe_servers, record_probe_metrics
+    from cloudmesh.model import public_address
+
+    tracer = _tracer(config)
+    with tracer.span('run', command='health'):
+        _setup_api(config)
+        hetzner_results, _ = collect_servers(config.hetzner_projects, config.collector.limits, network_resources=False)
+        targets = []
+        for _, server in hetzner_results:
+            ip = public_address(server['public_net'])
+            if ip:
+                targets.append({'server_name': server['name'], 'ip': ip, 'labels': server.get('labels', {})})
+        with tracing.span('health_checks', targets=len(targets)):
+            results = probe_servers(targets, asdict(config.health))
+
+        from cloudmesh.metrics import setup_health_metrics
+
+        registry, metrics = setup_health_metrics()
+        record_probe_metrics(metrics, results)
+        _push(config, 'cloudmesh_health', registry)
+    tracer.flush()
+    checked = [server for server in results if server['healthy'] is not None]
+    healthy = sum(server['healthy'] for server in checked)
+    line = f"Health checks complete. {healthy} of {len(checked)} servers healthy"
+    if len(checked) < len(results):
+        line += f", {len(results) - len(checked)} without checks"
+    print(line + ".")
+
+# report
+def report(args, config):
+    from cloudmesh.metrics import setup_prometheus_metrics
+
+    # The mapping sets metrics as it goes; this registry is never pushed.
+    _, metrics = setup_prometheus_metrics()
+    tracer = _tracer(config, metrics)
+    with tracer.span('run', command='report'):
+        _setup_api(config, metrics)
+        snapshot = _load_snapshot(config)
+        result = _build(config, _merge(config, args.inventory), metrics, NO_HEALTH_CHECKS, snapshot)
+        paths = _save_reports(config, result, snapshot)
+        if snapshot is not None:
+            _save_snapshot(config, snapshot)
+        _record_history(config, result)
+        delivery = _deliver(config, paths, result)
+        if delivery is not None:
+            delivery.wait()
+    tracer.flush()
+    _print_summary(result)
+    for path in paths.values():
+        print(f"Report written to {path}")
+
+# push
+def push(args, config):
+    from cloudmesh.metrics import set_summary_metrics, setup_prometheus_metrics
+
+    registry, metrics = setup_prometheus_metrics()
+    tracer = _tracer(config, metrics)
+    start_time = time.time()
+    with tracer.span('run', command='push'):
+        _setup_api(config, metrics)
+        result = _build(config, _merge(config, args.inventory), metrics, asdict(config.health))
+        set_summary_metrics(metrics, *result[1:5])
+        metrics['run_duration'].set(time.time() - start_time)
+        metrics['run_counter'].inc()
+        _push(config, 'cloudmesh', registry)
+    tracer.flush()
+    _print_summary(result)
+
+# history
+def _timestamp(value):
+    from datetime import timezone
+
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+def _format_time(millis):
+    from cloudmesh.history import from_millis
+
+    return from_millis(millis).strftime('%Y-%m-%d %H:%M')
+
+def history(args, config):
+    import json
+
+    from cloudmesh.history import HistoryStore, to_millis, unmatched_since
+
+    until = to_millis(_timestamp(args.until) if args.until else time.time())
+    if args.since:
+        since = to_millis(_timestamp(args.since))
+    else:
+        since = until - to_millis((args.days or 90) * 86400)
+    store = HistoryStore(config.history.dir)
+    if not store.partitions(since, until):
+        sys.exit(f"No history in {config.history.dir} between {_format_time(since)} and {_format_time(until)}")
+
+    if args.query == 'costs':
+        costs = store.project_costs(since, until, args.project, args.bucket)
+        if args.json:
+            print(json.dumps([
+                {'bucket': bucket, 'project': project, 'resources': count, 'price_monthly': price}
+                for bucket, projects in costs.items() for project, (count, price) in sorted(projects.items())
+            ], indent=2))
+            return
+        for bucket, projects in costs.items():
+            label = _format_time(bucket) if args.bucket == 'run' else bucket
+            for project, (count, price) in sorted(projects.items()):
+                print(f"{label:<16} {project:<30} {count:>6} resources {price:>12.2f} EUR/month")
+
+    elif args.query in ('record', 'ip'):
+        if args.query == 'record':
+            resources, records = [], store.record_history(args.domain, args.subdomain, since, until)
+        else:
+            resources, records = store.ip_history(args.ip, since, until)
+        if args.json:
+            print(json.dumps({'resources': resources, 'records': records}, indent=2))
+            return
+        for version in resources:
+            print(f"{_format_time(version['first_seen'])} - {_format_time(version['last_seen'])}  "
+                  f"{version['project']}/{version['server_name']} {version['ip']} {version['status']} "
+                  f"{version['server_type']} {version['price_monthly']:.2f} EUR/month")
+        for version in sorted(records, key=lambda version: (version['domain'], version['subdomain'],
+                                                             version['first_seen'])):
+            print(f"{_format_time(version['first_seen'])} - {_format_time(version['last_seen'])}  "
+                  f"{version['subdomain']} {version['record_type']} {version['ip']} -> "
+                  f"{version['project']}/{version['server_name']}")
+        for (subdomain, record_type), (started, last_seen) in sorted(unmatched_since(records).items()):
+            print(f"{subdomain} {record_type} points to No match since {_format_time(started)} "
+                  f"(last seen {_format_time(last_seen)})")
+
+    else:
+        runs = store.runs(since, until)
+        if args.json:
+            print(json.dumps(runs, indent=2))
+            return
+        for run in runs:
+            print(f"{_format_time(run['run_at'])}  {run['domains']:>6} domains {run['records']:>8} records "
+                  f"{run['matched_ips']:>6} matched {run['unmatched_ips']:>6} unmatched IPs "
+                  f"{run['resources']:>6} resources {run['spending']:>12.2f} EUR/month")
+
+HANDLERS = {
+    'run': run,
+    'collect': collect,
+    'health': health,
+    'report': report,
+    'push': push,
+    'history': history,
+}
+
+def main(argv=None):
+    from cloudmesh.config import ConfigError, load_config
+
+    args = parse_args(argv)
+    requires = REQUIRES[args.command]
+    if args.command == 'run' and args.merge:
+        requires = tuple(name for name in requires if name != 'cloudflare')
+    try:
+        config = load_config(args, requires)
+    except ConfigError as e:
+        sys.exit(str(e))
+
+    handler = HANDLERS[args.command]
+    if getattr(args, 'profile', None):
+        import cProfile
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.runcall(handler, args, config)
+        finally:
+            profiler.dump_stats(args.profile)
+            print(f"Profile written to {args.profile}")
+        return
+    handler(args, config)
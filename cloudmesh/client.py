@@ -0,0 +1,283 @@
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+import requests
+
+from cloudmesh import tracing
+from cloudmesh.cache import token_fingerprint
+from cloudmesh.defaults import DEFAULT_BREAKER_RESET, DEFAULT_BREAKER_THRESHOLD, DEFAULT_MAX_RETRIES
+
+# Token buckets per provider and API token, from the published limits:
+# Hetzner allows 3600 requests per hour per project, refilled at one per
+# second; Cloudflare 1200 requests per five minutes; Slack's
+# chat.postMessage about one message per second.
+DEFAULT_RATE_LIMITS = {
+    'hetzner': {'rate': 1.0, 'burst': 3600},
+    'cloudflare': {'rate': 4.0, 'burst': 1200},
+    'slack': {'rate': 1.0, 'burst': 1},
+}
+PROVIDER_HOSTS = {
+    'api.hetzner.cloud': 'hetzner',
+    'api.cloudflare.com': 'cloudflare',
+    'slack.com': 'slack',
+}
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 60.0
+# Retry-After values above this are treated as a failed request.
+MAX_RETRY_AFTER = 300.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Statuses where the server is known not to have acted on the request, so
+# POSTs can be retried as well.
+UNSAFE_RETRY_STATUSES = {429, 503}
+# Methods that can be repeated whatever the server did with the first try.
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'PUT', 'DELETE')
+
+class CircuitOpenError(requests.ConnectionError):
+    pass
+
+def provider_for(url):
+    host = urlsplit(url).hostname or ''
+    for suffix, provider in PROVIDER_HOSTS.items():
+        if host == suffix or host.endswith('.' + suffix):
+            return provider
+    return host
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        # Reserves a token and sleeps until it is available. Returns the
+        # seconds waited.
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens -= 1
+            wait = max(-self.tokens / self.rate if self.tokens < 0 else 0.0, self.blocked_until - now)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def observe(self, remaining):
+        # Never assume more tokens than the API reports left.
+        with self.lock:
+            self._refill(time.monotonic())
+            self.tokens = min(self.tokens, float(remaining))
+
+    def block(self, seconds):
+        # A 429 for one caller holds back every caller sharing the token.
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens = min(self.tokens, 0.0)
+            self.blocked_until = max(self.blocked_until, now + seconds)
+
+class CircuitBreaker:
+    # Opens after `threshold` consecutive failures and fails fast until
+    # `reset_timeout` has passed, then lets one trial request through.
+    def __init__(self, threshold=DEFAULT_BREAKER_THRESHOLD, reset_timeout=DEFAULT_BREAKER_RESET):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.trial_thread = None
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.reset_timeout or self.trial_running:
+                return False
+            self.trial_running = True
+            self.trial_thread = threading.get_ident()
+            return True
+
+    def release_trial(self):
+        # Frees the trial this thread was let through with when its request
+        # ended without a success or failure being recorded (a 429, an
+        # exception other than a connection error), so the next request can
+        # be the trial instead of the circuit staying shut for good.
+        with self.lock:
+            if self.trial_running and self.trial_thread == threading.get_ident():
+                self.trial_running = False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self):
+        # Returns True when this failure opened the circuit.
+        with self.lock:
+            self.failures += 1
+            self.trial_running = False
+            if self.opened_at is not None:
+                self.opened_at = time.monotonic()
+                return False
+            if self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+def retry_after(response):
+    value = response.headers.get('Retry-After')
+    if value is None:
+        if response.headers.get('RateLimit-Remaining') == '0' and response.headers.get('RateLimit-Reset'):
+            # Hetzner: unix timestamp at which the bucket has tokens again.
+            return max(float(response.headers['RateLimit-Reset']) - time.time(), 0.0)
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+def backoff_delay(attempt):
+    # Full jitter: uniform over [0, min(max, base * 2^attempt)].
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+def _rewind(kwargs):
+    # File bodies were consumed by the previous attempt.
+    bodies = list((kwargs.get('files') or {}).values()) + [kwargs.get('data')]
+    for body in bodies:
+        fileobj = body[1] if isinstance(body, tuple) else body
+        if hasattr(fileobj, 'seek'):
+            fileobj.seek(0)
+
+class ApiClient:
+    # Shared request path for every API call: rate limiting per provider and
+    # token, retries with backoff for 429/5xx/connection errors, and a circuit
+    # breaker per provider. The final response is returned as is, so callers
+    # keep doing their own raise_for_status().
+    def __init__(self, rate_limits=None, max_retries=DEFAULT_MAX_RETRIES,
+                 breaker_threshold=DEFAULT_BREAKER_THRESHOLD, breaker_reset=DEFAULT_BREAKER_RESET, metrics=None):
+        self.rate_limits = {
+            provider: dict(DEFAULT_RATE_LIMITS.get(provider, {}), **limits)
+            for provider, limits in dict(DEFAULT_RATE_LIMITS, **(rate_limits or {})).items()
+        }
+        self.max_retries = max_retries
+        self.breaker_threshold = breaker_threshold
+        self.breaker_reset = breaker_reset
+        self.metrics = metrics
+        self.buckets = {}
+        self.breakers = {}
+        self.lock = threading.Lock()
+
+    def set_metrics(self, metrics):
+        self.metrics = metrics
+
+    def _count(self, key, labels, amount=1):
+        if self.metrics is not None:
+            self.metrics[key].labels(*labels).inc(amount)
+
+    def _send(self, send, method, url, kwargs):
+        host = urlsplit(url).hostname
+        started = time.perf_counter()
+        with tracing.span('http_request', method=method, host=host, path=urlsplit(url).path) as request_span:
+            response = send(method, url, **kwargs)
+            request_span.set(status=response.status_code, bytes=len(response.content))
+        if self.metrics is not None:
+            self.metrics['api_request_duration'].labels(host).observe(time.perf_counter() - started)
+            self.metrics['api_response_bytes'].labels(host).inc(len(response.content))
+        return response
+
+    def bucket(self, provider, token):
+        limits = self.rate_limits.get(provider)
+        if not limits:
+            return None
+        key = (provider, token_fingerprint(token) if token else None)
+        with self.lock:
+            if key not in self.buckets:
+                self.buckets[key] = TokenBucket(limits['rate'], limits['burst'])
+            return self.buckets[key]
+
+    def breaker(self, provider):
+        with self.lock:
+            if provider not in self.breakers:
+                self.breakers[provider] = CircuitBreaker(self.breaker_threshold, self.breaker_reset)
+            return self.breakers[provider]
+
+    def request(self, method, url, session=None, **kwargs):
+        provider = provider_for(url)
+        token = (kwargs.get('headers') or {}).get('Authorization')
+        bucket = self.bucket(provider, token)
+        breaker = self.breaker(provider)
+        retry_statuses = RETRY_STATUSES if method.upper() in IDEMPOTENT_METHODS else UNSAFE_RETRY_STATUSES
+        send = (session or requests).request
+
+        for attempt in range(self.max_retries + 1):
+            if not breaker.allow():
+                raise CircuitOpenError(f"Circuit open for {provider}, not calling {url}")
+            # Whatever ends this attempt, a trial it was let through with is
+            # not left taken.
+            try:
+                if bucket is not None:
+                    waited = bucket.acquire()
+                    if waited > 0:
+                        self._count('api_throttle_wait', (provider,), waited)
+                if attempt:
+                    _rewind(kwargs)
+
+                try:
+                    response = self._send(send, method, url, kwargs)
+                except (requests.ConnectionError, requests.Timeout):
+                    if breaker.record_failure():
+                        self._count('api_circuit_open', (provider,))
+                    if attempt == self.max_retries:
+                        raise
+                    self._count('api_retries', (provider, 'connection'))
+                    time.sleep(backoff_delay(attempt))
+                    continue
+
+                if bucket is not None and response.headers.get('RateLimit-Remaining') is not None:
+                    bucket.observe(response.headers['RateLimit-Remaining'])
+                if response.status_code not in retry_statuses:
+                    breaker.record_success()
+                    return response
+                if response.status_code != 429 and breaker.record_failure():
+                    self._count('api_circuit_open', (provider,))
+                if attempt == self.max_retries:
+                    return response
+
+                delay = retry_after(response)
+                if delay is not None and delay > MAX_RETRY_AFTER:
+                    return response
+                if delay is None:
+                    delay = backoff_delay(attempt)
+                if response.status_code == 429 and bucket is not None:
+                    bucket.block(delay)
+                    delay = 0
+                self._count('api_retries', (provider, str(response.status_code)))
+                time.sleep(delay)
+            finally:
+                breaker.release_trial()
+
+_client = ApiClient()
+
+def get_client():
+    return _client
+
+def set_client(client):
+    global _client
+    _client = client
+
+def request(method, url, session=None, **kwargs):
+    return _client.request(method, url, session, **kwargs)
@@ -0,0 +1,164 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from cloudmesh import api, tracing
+from cloudmesh.api import (
+    DEFAULT_LIMITS,
+    fetch_cloudflare_zones,
+    fetch_dns_records,
+    fetch_hetzner_floating_ips,
+    fetch_hetzner_load_balancers,
+    fetch_hetzner_primary_ips,
+    fetch_hetzner_servers,
+    fetch_hetzner_volumes,
+)
+from cloudmesh.usage import DEFAULT_METRICS_WINDOW, server_usage
+
+# Hetzner resources besides servers that can own a public address, and
+# volumes, which only add to the cost of the server they are attached to.
+NETWORK_RESOURCE_FETCHERS = {
+    'floating_ip': fetch_hetzner_floating_ips,
+    'load_balancer': fetch_hetzner_load_balancers,
+    'primary_ip': fetch_hetzner_primary_ips,
+    'volume': fetch_hetzner_volumes,
+}
+
+class Collector:
+    # zone_filter, when set, selects the zones whose DNS records are fetched
+    # (a shard's own zones, say).
+    def __init__(self, limits=None, network_resources=True, zone_filter=None):
+        self.limits = dict(DEFAULT_LIMITS, **(limits or {}))
+        self.network_resources = network_resources
+        self.zone_filter = zone_filter
+
+    async def _call(self, provider, stage, attributes, func, *args):
+        # The limits are applied to every HTTP request by cloudmesh.api, pages
+        # of a listing included. The provider semaphore here only keeps
+        # calls queued behind a busy provider from taking the threads the
+        # other provider could use. The stage span only covers the call
+        # itself, not the wait for a thread.
+        async with self.provider_semaphores[provider]:
+            with tracing.span(stage, **attributes):
+                return await self.loop.run_in_executor(self.executor, tracing.wrap_context(func), *args)
+
+    async def _fetch_project(self, project):
+        servers, project_name = await self._call(
+            'hetzner', 'fetch_servers', {'project': project['project_name']},
+            fetch_hetzner_servers, project['api_token'], project['project_name']
+        )
+        return [({'project_name': project_name}, server) for server in servers]
+
+    async def _fetch_project_resources(self, project, kind, fetcher):
+        resources = await self._call(
+            'hetzner', 'fetch_network_resources', {'project': project['project_name'], 'kind': kind},
+            fetcher, project['api_token']
+        )
+        return [({'project_name': project['project_name']}, kind, resource) for resource in resources]
+
+    async def _fetch_server_usage(self, token, project_name, server_id, window):
+        try:
+            usage = await self._call(
+                'hetzner', 'fetch_server_metrics', {'project': project_name}, server_usage, token, server_id, window
+            )
+        except requests.RequestException:
+            # A server without metrics (just deleted, say) must not fail the
+            # whole stage; collect_usage() reports how many are missing.
+            usage = None
+        return (project_name, server_id), usage
+
+    async def _fetch_zone(self, cloudflare_token, zone):
+        records = await self._call(
+            'cloudflare', 'fetch_dns', {'zone': zone['name']},
+            fetch_dns_records, cloudflare_token, zone['id'], zone.get('modified_on')
+        )
+        return zone, records
+
+    async def _fetch_account_zones(self, cloudflare_token):
+        zones = await self._call('cloudflare', 'fetch_zones', {}, fetch_cloudflare_zones, cloudflare_token)
+        return [(cloudflare_token, zone) for zone in zones]
+
+    async def _fetch_zones(self, cloudflare_tokens):
+        # Zones of every account; a zone visible to several tokens is fetched
+        # once, with the first token that lists it.
+        account_zones = await asyncio.gather(*(self._fetch_account_zones(token) for token in cloudflare_tokens))
+        zones = {}
+        for token, zone in (item for items in account_zones for item in items):
+            if zone['id'] not in zones and (self.zone_filter is None or self.zone_filter(zone)):
+                zones[zone['id']] = (token, zone)
+        return await asyncio.gather(*(self._fetch_zone(token, zone) for token, zone in zones.values()))
+
+    async def _run(self, *jobs):
+        api.set_limits(self.limits)
+        self.loop = asyncio.get_running_loop()
+        self.provider_semaphores = {
+            'hetzner': asyncio.Semaphore(self.limits['hetzner']),
+            'cloudflare': asyncio.Semaphore(self.limits['cloudflare']),
+        }
+        # A thread for every call the provider semaphores let through.
+        workers = self.limits['hetzner'] + self.limits['cloudflare']
+        with ThreadPoolExecutor(max_workers=workers) as self.executor:
+            return await asyncio.gather(*jobs)
+
+    async def _fetch_projects(self, hetzner_projects):
+        project_results = await asyncio.gather(*(self._fetch_project(project) for project in hetzner_projects))
+        return [item for result in project_results for item in result]
+
+    async def _fetch_network_resources(self, hetzner_projects):
+        if not self.network_resources:
+            return []
+        resource_results = await asyncio.gather(*(
+            self._fetch_project_resources(project, kind, fetcher)
+            for project in hetzner_projects
+            for kind, fetcher in NETWORK_RESOURCE_FETCHERS.items()
+        ))
+        return [item for result in resource_results for item in result]
+
+    def collect(self, cloudflare_tokens, hetzner_projects):
+        # Returns (hetzner_results, zone_records, network_resources) where
+        # hetzner_results has the same ({'project_name': ...}, server) shape
+        # parallel fetching always produced, zone_records is a list of
+        # (zone, records) in zone order and network_resources is a list of
+        # ({'project_name': ...}, kind, resource) for floating IPs, load
+        # balancers, primary IPs and volumes.
+        return tuple(asyncio.run(self._run(
+            self._fetch_projects(hetzner_projects),
+            self._fetch_zones(cloudflare_tokens),
+            self._fetch_network_resources(hetzner_projects),
+        )))
+
+    def collect_servers(self, hetzner_projects):
+        # Returns (hetzner_results, network_resources).
+        return tuple(asyncio.run(self._run(
+            self._fetch_projects(hetzner_projects),
+            self._fetch_network_resources(hetzner_projects),
+        )))
+
+    def collect_zones(self, cloudflare_tokens):
+        return asyncio.run(self._run(self._fetch_zones(cloudflare_tokens)))[0]
+
+    def collect_usage(self, hetzner_projects, hetzner_results, window=DEFAULT_METRICS_WINDOW):
+        # Returns {(project_name, server_id): usage} for the servers of
+        # hetzner_results, see cloudmesh.usage.aggregate() for the fields.
+        tokens = {project['project_name']: project['api_token'] for project in hetzner_projects}
+        results = asyncio.run(self._run(*(
+            self._fetch_server_usage(tokens[project['project_name']], project['project_name'], server['id'], window)
+            for project, server in hetzner_results
+        )))
+        missing = sum(1 for _, usage in results if usage is None)
+        if missing:
+            print(f"No metrics for {missing} of {len(results)} servers")
+        return {key: usage for key, usage in results if usage is not None}
+
+def collect_inventory(cloudflare_tokens, hetzner_projects, limits=None, network_resources=True, zone_filter=None):
+    return Collector(limits, network_resources, zone_filter).collect(cloudflare_tokens, hetzner_projects)
+
+def collect_servers(hetzner_projects, limits=None, network_resources=True):
+    return Collector(limits, network_resources).collect_servers(hetzner_projects)
+
+def collect_zones(cloudflare_tokens, limits=None, zone_filter=None):
+    return Collector(limits, zone_filter=zone_filter).collect_zones(cloudflare_tokens)
+
+def collect_usage(hetzner_projects, hetzner_results, limits=None, window=DEFAULT_METRICS_WINDOW):
+    return Collector(limits).collect_usage(hetzner_projects, hetzner_results, window)
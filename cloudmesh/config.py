@@ -0,0 +1,415 @@
+import json
+import os
+from dataclasses import dataclass, field, fields
+
+from cloudmesh.cardinality import CardinalityBudget
+from cloudmesh.defaults import (
+    COMPRESSIONS, DEFAULT_BREAKER_RESET, DEFAULT_BREAKER_THRESHOLD, DEFAULT_CACHE_PATH, DEFAULT_CHANGE_LOG_PATH,
+    DEFAULT_CHECKS, DEFAULT_DNS_ATTEMPTS, DEFAULT_DNS_CACHE_PATH, DEFAULT_DNS_CONCURRENCY, DEFAULT_DNS_TIMEOUT,
+    DEFAULT_FORMATS, DEFAULT_GROUP_LABELS, DEFAULT_HEALTH_CONCURRENCY, DEFAULT_HEALTH_TIMEOUT, DEFAULT_HISTORY_DIR,
+    DEFAULT_MAX_RETRIES, DEFAULT_MAX_STALENESS, DEFAULT_METRICS_WINDOW, DEFAULT_PDF_CHUNK_ROWS,
+    DEFAULT_PRICING_CACHE_PATH, DEFAULT_PRICING_TTL, DEFAULT_PUSH_STATE_PATH, DEFAULT_PUSH_TIMEOUT,
+    DEFAULT_PUSH_WORKERS, DEFAULT_REFRESH_INTERVAL, DEFAULT_SLACK_ATTEMPTS, DEFAULT_SLACK_WORKERS,
+    DEFAULT_SNAPSHOT_PATH, PRICE_FIELDS, PRICING_FALLBACK_PATH, SUPPORTED_FORMATS,
+)
+from cloudmesh.shard import DEFAULT_SHARD_DIR, SHARD_KEYS
+from cloudmesh.tracing import TRACE_FORMATS
+
+# The whole configuration, read once per process from command line options,
+# the environment (and .env) and config.json, in that order of precedence,
+# and validated before anything is fetched. Every setting is declared below
+# with its environment variable, its config.json key and its type.
+CONFIG_PATH = 'config.json'
+
+class ConfigError(RuntimeError):
+    # Every problem found in the configuration, not just the first one.
+    def __init__(self, problems):
+        self.problems = problems
+        super().__init__("Invalid configuration:\n  " + "\n  ".join(problems))
+
+def _boolean(value):
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in ('1', 'true', 'yes', 'on'):
+        return True
+    if text in ('0', 'false', 'no', 'off'):
+        return False
+    raise ValueError(f"expected true or false, got {value!r}")
+
+def _list(value):
+    # Comma-separated in the environment, a list in config.json.
+    if isinstance(value, str):
+        return [item.strip() for item in value.split(',') if item.strip()]
+    return list(value)
+
+def _optional(convert):
+    return lambda value: None if value in (None, '') else convert(value)
+
+def setting(default, convert=str, env=None, key=None, section=None, arg=None, choices=None, minimum=None):
+    # A field read from the command line option `arg`, the environment
+    # variable `env` or config.json's section.key, converted and checked.
+    # key defaults to the field name, section to the section of the class;
+    # an empty section is the top level of config.json.
+    metadata = {
+        'convert': convert, 'env': env, 'key': key, 'section': section, 'arg': arg, 'choices': choices,
+        'minimum': minimum,
+    }
+    if isinstance(default, (dict, list)):
+        return field(default_factory=lambda: type(default)(default), metadata=metadata)
+    return field(default=default, metadata=metadata)
+
+@dataclass
+class CollectorConfig:
+    SECTION = 'collector'
+    concurrency: int = setting(16, int, 'COLLECTOR_CONCURRENCY', minimum=1)
+    hetzner_concurrency: int = setting(4, int, 'COLLECTOR_HETZNER_CONCURRENCY', minimum=1)
+    cloudflare_concurrency: int = setting(8, int, 'COLLECTOR_CLOUDFLARE_CONCURRENCY', minimum=1)
+    network_resources: bool = setting(True, _boolean, 'COLLECT_NETWORK_RESOURCES')
+    # Per-server /metrics cost one API call per server (cached for the
+    # server_metrics TTL), so they are opt-in.
+    server_metrics: bool = setting(False, _boolean, 'COLLECT_SERVER_METRICS')
+    server_metrics_window: int = setting(DEFAULT_METRICS_WINDOW, int, 'SERVER_METRICS_WINDOW', minimum=60)
+
+    @property
+    def limits(self):
+        return {
+            'global': self.concurrency,
+            'hetzner': self.hetzner_concurrency,
+            'cloudflare': self.cloudflare_concurrency,
+        }
+
+    @property
+    def metrics_window(self):
+        # The /metrics window in seconds, or None when disabled.
+        return self.server_metrics_window if self.server_metrics else None
+
+@dataclass
+class ApiConfig:
+    SECTION = 'api'
+    hetzner_url: str = setting(None, _optional(str), 'HETZNER_API_URL')
+    cloudflare_url: str = setting(None, _optional(str), 'CLOUDFLARE_API_URL')
+    max_retries: int = setting(DEFAULT_MAX_RETRIES, int, 'API_MAX_RETRIES', minimum=0)
+    circuit_threshold: int = setting(DEFAULT_BREAKER_THRESHOLD, int, 'API_CIRCUIT_THRESHOLD', minimum=1)
+    circuit_reset: float = setting(DEFAULT_BREAKER_RESET, float, 'API_CIRCUIT_RESET', minimum=0)
+    # Per provider, e.g. {"hetzner": {"rate": 1.0, "burst": 3600}}.
+    rate_limits: dict = setting({}, dict, section='', key='rate_limits')
+
+    def client_options(self):
+        return {
+            'rate_limits': self.rate_limits,
+            'max_retries': self.max_retries,
+            'breaker_threshold': self.circuit_threshold,
+            'breaker_reset': self.circuit_reset,
+        }
+
+@dataclass
+class CacheConfig:
+    SECTION = 'cache'
+    disabled: bool = setting(False, _boolean, arg='no_cache')
+    path: str = setting(DEFAULT_CACHE_PATH, str, 'CACHE_PATH')
+    ttls: dict = setting({}, dict)
+    max_staleness: float = setting(
+        DEFAULT_MAX_STALENESS, float, 'CACHE_MAX_STALENESS', arg='max_staleness', minimum=0
+    )
+
+    def open(self):
+        from cloudmesh.cache import InventoryCache
+
+        if self.disabled:
+            return None
+        return InventoryCache(path=self.path, ttls=self.ttls, max_staleness=self.max_staleness)
+
+@dataclass
+class PricingConfig:
+    SECTION = 'pricing'
+    cache_path: str = setting(DEFAULT_PRICING_CACHE_PATH, _optional(str), 'PRICING_CACHE_PATH')
+    ttl: float = setting(DEFAULT_PRICING_TTL, float, 'PRICING_TTL', minimum=0)
+    offline: bool = setting(False, _boolean, 'PRICING_OFFLINE')
+    fallback_path: str = setting(PRICING_FALLBACK_PATH, str, 'PRICING_FILE', key='file')
+    price_field: str = setting('gross', str, 'PRICING_PRICE_FIELD', choices=PRICE_FIELDS)
+
+    def load(self, hetzner_projects, use_cache=True):
+        from cloudmesh.pricing import load_catalog
+
+        # Prices are the same for every project, any token will do.
+        token = hetzner_projects[0]['api_token'] if hetzner_projects else None
+        return load_catalog(
+            token, self.cache_path if use_cache else None, self.ttl, self.offline, self.fallback_path, self.price_field
+        )
+
+@dataclass
+class HealthConfig:
+    SECTION = 'health_checks'
+    concurrency: int = setting(DEFAULT_HEALTH_CONCURRENCY, int, 'HEALTH_CHECK_CONCURRENCY', minimum=1)
+    timeout: float = setting(DEFAULT_HEALTH_TIMEOUT, float, 'HEALTH_CHECK_TIMEOUT', minimum=0)
+    default: list = setting(DEFAULT_CHECKS, list)
+    labels: dict = setting({}, dict)
+
+@dataclass
+class MetricsConfig:
+    SECTION = 'metrics'
+    default_budget: int = setting(None, _optional(int), 'METRICS_CARDINALITY_BUDGET', minimum=0)
+    cardinality_budget: dict = setting({}, dict)
+    drop_labels: dict = setting({}, dict)
+    server_label_keys: list = setting([], list)
+
+    def options(self):
+        budgets = dict(self.cardinality_budget)
+        if self.default_budget is not None:
+            budgets = dict({'mapping_info_clean': self.default_budget, 'dns_ttl': self.default_budget}, **budgets)
+        return {
+            'budget': CardinalityBudget(budgets, self.drop_labels),
+            'server_label_keys': self.server_label_keys,
+        }
+
+@dataclass
+class ReportConfig:
+    SECTION = 'report'
+    formats: list = setting(DEFAULT_FORMATS, _list, 'REPORT_FORMATS', arg='formats', choices=SUPPORTED_FORMATS)
+    output_dir: str = setting('reports', str, 'REPORT_DIR')
+    pdf_workers: int = setting(None, _optional(int), 'REPORT_PDF_WORKERS', arg='pdf_workers', minimum=1)
+    pdf_chunk_rows: int = setting(DEFAULT_PDF_CHUNK_ROWS, int, 'REPORT_PDF_CHUNK_ROWS', minimum=1)
+    pdf_chunked: bool = setting(True, _boolean, 'REPORT_PDF_CHUNKED')
+
+@dataclass
+class DaemonConfig:
+    SECTION = 'daemon'
+    metrics_port: int = setting(9914, int, 'METRICS_PORT', arg='metrics_port', minimum=0)
+    metrics_addr: str = setting('0.0.0.0', str, 'METRICS_ADDR')
+    servers_interval: float = setting(60, float, 'DAEMON_SERVERS_INTERVAL', minimum=1)
+    dns_interval: float = setting(900, float, 'DAEMON_DNS_INTERVAL', minimum=1)
+    report_interval: float = setting(86400, float, 'DAEMON_REPORT_INTERVAL', minimum=1)
+
+@dataclass
+class TracingConfig:
+    SECTION = 'tracing'
+    file: str = setting(None, _optional(str), 'TRACE_FILE', arg='trace')
+    format: str = setting('json', str, 'TRACE_FORMAT', arg='trace_format', choices=TRACE_FORMATS)
+
+@dataclass
+class IncrementalConfig:
+    SECTION = 'incremental'
+    enabled: bool = setting(False, _boolean, arg='incremental')
+    snapshot_path: str = setting(DEFAULT_SNAPSHOT_PATH, str, 'SNAPSHOT_PATH')
+    change_log_path: str = setting(DEFAULT_CHANGE_LOG_PATH, str, 'CHANGE_LOG_PATH')
+
+@dataclass
+class ShardConfig:
+    SECTION = 'shard'
+    by: str = setting('account', str, 'SHARD_BY', arg='shard_by', choices=SHARD_KEYS)
+    dir: str = setting(DEFAULT_SHARD_DIR, str, 'SHARD_DIR', arg='shard_dir')
+
+@dataclass
+class HistoryConfig:
+    SECTION = 'history'
+    # Every run, report and daemon report is appended to the history store.
+    enabled: bool = setting(True, _boolean, 'HISTORY_ENABLED')
+    dir: str = setting(DEFAULT_HISTORY_DIR, str, 'HISTORY_DIR', arg='history_dir')
+
+@dataclass
+class PushConfig:
+    SECTION = 'push'
+    # Labels whose values split the pushed registry into Pushgateway groups;
+    # empty pushes everything as one group.
+    group_by: list = setting(DEFAULT_GROUP_LABELS, _list, 'PUSH_GROUP_BY')
+    # Where the digests of pushed groups are kept; empty pushes every group
+    # every time and never deletes any.
+    state_path: str = setting(DEFAULT_PUSH_STATE_PATH, _optional(str), 'PUSH_STATE_PATH')
+    refresh_interval: float = setting(DEFAULT_REFRESH_INTERVAL, float, 'PUSH_REFRESH_INTERVAL', minimum=0)
+    compression: str = setting('gzip', str, 'PUSH_COMPRESSION', choices=COMPRESSIONS)
+    workers: int = setting(DEFAULT_PUSH_WORKERS, int, 'PUSH_WORKERS', minimum=1)
+    timeout: float = setting(DEFAULT_PUSH_TIMEOUT, float, 'PUSH_TIMEOUT', minimum=0)
+
+    def options(self):
+        return {
+            'group_labels': self.group_by,
+            'state_path': self.state_path,
+            'workers': self.workers,
+            'compression': self.compression,
+            'timeout': self.timeout,
+            'refresh_interval': self.refresh_interval,
+        }
+
+@dataclass
+class SlackConfig:
+    SECTION = 'slack'
+    bot_token: str = setting(None, _optional(str), 'SLACK_BOT_TOKEN')
+    # Every report file and the summary go to each channel.
+    channel_ids: list = setting([], _list, 'SLACK_CHANNEL_ID')
+    files: list = setting(['pdf'], _list, 'SLACK_FILES', choices=SUPPORTED_FORMATS)
+    # Unmatched IPs as replies in the summary's thread.
+    unmatched_thread: bool = setting(True, _boolean, 'SLACK_UNMATCHED_THREAD')
+    workers: int = setting(DEFAULT_SLACK_WORKERS, int, 'SLACK_WORKERS', minimum=1)
+    attempts: int = setting(DEFAULT_SLACK_ATTEMPTS, int, 'SLACK_ATTEMPTS', minimum=1)
+
+    @property
+    def enabled(self):
+        return bool(self.bot_token and self.channel_ids)
+
+@dataclass
+class DnsCheckConfig:
+    SECTION = 'dns_check'
+    enabled: bool = setting(False, _boolean, 'DNS_CHECK', arg='dns_check')
+    # host, host:port or [v6]:port of a recursive resolver; empty uses the
+    # first nameserver of /etc/resolv.conf.
+    upstream: str = setting(None, _optional(str), 'DNS_UPSTREAM')
+    timeout: float = setting(DEFAULT_DNS_TIMEOUT, float, 'DNS_TIMEOUT', minimum=0)
+    attempts: int = setting(DEFAULT_DNS_ATTEMPTS, int, 'DNS_ATTEMPTS', minimum=1)
+    concurrency: int = setting(DEFAULT_DNS_CONCURRENCY, int, 'DNS_CONCURRENCY', minimum=1)
+    # Answers are kept here until their TTL runs out; empty keeps them in
+    # memory only.
+    cache_path: str = setting(DEFAULT_DNS_CACHE_PATH, _optional(str), 'DNS_CACHE_PATH')
+
+    def resolver(self):
+        # None when the cross-check is off.
+        if not self.enabled:
+            return None
+        from cloudmesh.resolver import Resolver
+        return Resolver(self.upstream, self.timeout, self.attempts, self.concurrency, self.cache_path)
+
+@dataclass
+class Config:
+    cloudflare_accounts: list
+    hetzner_projects: list
+    pushgateway_url: str
+    collector: CollectorConfig
+    api: ApiConfig
+    cache: CacheConfig
+    pricing: PricingConfig
+    health: HealthConfig
+    metrics: MetricsConfig
+    report: ReportConfig
+    daemon: DaemonConfig
+    tracing: TracingConfig
+    incremental: IncrementalConfig
+    shard: ShardConfig
+    history: HistoryConfig
+    push: PushConfig
+    slack: SlackConfig
+    dns_check: DnsCheckConfig
+
+    @property
+    def cloudflare_tokens(self):
+        return [account['api_token'] for account in self.cloudflare_accounts]
+
+SECTIONS = {
+    'collector': CollectorConfig,
+    'api': ApiConfig,
+    'cache': CacheConfig,
+    'pricing': PricingConfig,
+    'health': HealthConfig,
+    'metrics': MetricsConfig,
+    'report': ReportConfig,
+    'daemon': DaemonConfig,
+    'tracing': TracingConfig,
+    'incremental': IncrementalConfig,
+    'shard': ShardConfig,
+    'history': HistoryConfig,
+    'push': PushConfig,
+    'slack': SlackConfig,
+    'dns_check': DnsCheckConfig,
+}
+
+def read_config_file(path=CONFIG_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        try:
+            return json.load(f)
+        except ValueError as e:
+            raise ConfigError([f"{path}: {e}"]) from None
+
+def _load_section(cls, document, environ, args, problems):
+    values = {}
+    for item in fields(cls):
+        meta = item.metadata
+        section = cls.SECTION if meta['section'] is None else meta['section']
+        key = item.name if meta['key'] is None else meta['key']
+        # store_true options are False, not None, when not given.
+        value = getattr(args, meta['arg'], None) if meta['arg'] else None
+        source = f"--{meta['arg'].replace('_', '-')}" if meta['arg'] else None
+        if (value is None or value is False) and meta['env'] and environ.get(meta['env']) is not None:
+            value, source = environ[meta['env']], meta['env']
+        if value is None or value is False:
+            value = (document.get(section) or {}).get(key) if section else document.get(key)
+            source = f"{section}.{key}" if section else key
+        if value is None:
+            continue
+        try:
+            value = meta['convert'](value)
+        except (TypeError, ValueError) as e:
+            problems.append(f"{source}: {e}")
+            continue
+        if meta['choices'] is not None:
+            chosen = value if isinstance(value, list) else [value]
+            unknown = [str(choice) for choice in chosen if choice not in meta['choices']]
+            if unknown:
+                problems.append(f"{source}: unknown {', '.join(unknown)}, expected one of {', '.join(meta['choices'])}")
+                continue
+        if meta['minimum'] is not None and value is not None and value < meta['minimum']:
+            problems.append(f"{source}: must be at least {meta['minimum']}, got {value}")
+            continue
+        values[item.name] = value
+    return cls(**values)
+
+def _numbered(environ, token_prefix, name_prefix, name_key):
+    # TOKEN_1/NAME_1, TOKEN_2/NAME_2... up to the first gap.
+    entries = []
+    i = 1
+    while environ.get(f'{token_prefix}_{i}') and environ.get(f'{name_prefix}_{i}'):
+        entries.append({name_key: environ[f'{name_prefix}_{i}'], 'api_token': environ[f'{token_prefix}_{i}']})
+        i += 1
+    return entries
+
+def _cloudflare_accounts(document, environ):
+    # CLOUDFLARE_TOKEN_1/CLOUDFLARE_ACCOUNT_NAME_1..N like the Hetzner
+    # projects, else the single CLOUDFLARE_TOKEN, else config.json's
+    # cloudflare.accounts list or cloudflare.api_token.
+    accounts = _numbered(environ, 'CLOUDFLARE_TOKEN', 'CLOUDFLARE_ACCOUNT_NAME', 'account_name')
+    if not accounts and environ.get('CLOUDFLARE_TOKEN'):
+        accounts = [{'account_name': 'default', 'api_token': environ['CLOUDFLARE_TOKEN']}]
+    if not accounts:
+        section = document.get('cloudflare', {})
+        accounts = section.get('accounts', [])
+        if not accounts and section.get('api_token'):
+            accounts = [{'account_name': 'default', 'api_token': section['api_token']}]
+    return accounts
+
+def _hetzner_projects(document, environ):
+    return _numbered(environ, 'HETZNER_TOKEN', 'HETZNER_PROJECT_NAME', 'project_name') or document.get('hetzner', [])
+
+def load_config(args=None, requires=(), environ=None, path=CONFIG_PATH):
+    # requires names the secrets the caller cannot do without, out of
+    # 'cloudflare', 'hetzner' and 'pushgateway'; a missing one is reported
+    # with every other problem in one ConfigError.
+    if environ is None:
+        from dotenv import load_dotenv
+
+        load_dotenv()
+        environ = os.environ
+    document = read_config_file(path)
+    problems = []
+    sections = {name: _load_section(cls, document, environ, args, problems) for name, cls in SECTIONS.items()}
+    config = Config(
+        cloudflare_accounts=_cloudflare_accounts(document, environ),
+        hetzner_projects=_hetzner_projects(document, environ),
+        pushgateway_url=environ.get('PUSHGATEWAY_URL') or document.get('prometheus', {}).get('pushgateway_url'),
+        **sections
+    )
+    if 'cloudflare' in requires and not config.cloudflare_accounts:
+        problems.append("No Cloudflare token found in environment or config.json")
+    if 'hetzner' in requires and not config.hetzner_projects:
+        problems.append("No Hetzner projects found in environment or config.json")
+    if 'pushgateway' in requires and not config.pushgateway_url:
+        problems.append("PUSHGATEWAY_URL not set in environment or config.json")
+    for kind, entries, name_key in (
+        ('Cloudflare account', config.cloudflare_accounts, 'account_name'),
+        ('Hetzner project', config.hetzner_projects, 'project_name'),
+    ):
+        for entry in entries:
+            if not entry.get(name_key) or not entry.get('api_token'):
+                problems.append(f"{kind} {entry.get(name_key) or '(unnamed)'}: needs both {name_key} and api_token")
+    if problems:
+        raise ConfigError(problems)
+    return config
@@ -0,0 +1,82 @@
+import os
+
+# Defaults of the modules that load requests, asyncio or sqlite3, kept here
+# so the configuration (and every command's startup) can read them without
+# importing those modules. Each module imports its own defaults from here.
+
+# cloudmesh.cache
+DEFAULT_CACHE_PATH = '.cache/cloudmesh.sqlite'
+# Seconds a cached resource may still be served when refreshing it fails.
+# This is only a fallback on errors; cache hits are bounded by the TTLs.
+DEFAULT_MAX_STALENESS = 3600
+
+# cloudmesh.client
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_BREAKER_THRESHOLD = 10
+DEFAULT_BREAKER_RESET = 30.0
+
+# cloudmesh.diff
+DEFAULT_SNAPSHOT_PATH = '.cache/snapshot.json'
+DEFAULT_CHANGE_LOG_PATH = 'reports/changes.jsonl'
+
+# cloudmesh.health
+# Checks applied to servers that match no label selector; this is the plain
+# TCP connect on port 80 the script has always done.
+DEFAULT_CHECKS = [{'protocol': 'tcp', 'port': 80}]
+DEFAULT_HEALTH_CONCURRENCY = 100
+DEFAULT_HEALTH_TIMEOUT = 2.0
+
+# cloudmesh.history
+DEFAULT_HISTORY_DIR = 'history'
+# Aggregation buckets of the history queries: a strftime format per bucket,
+# None for one bucket per run.
+HISTORY_BUCKETS = {
+    'run': None,
+    'day': '%Y-%m-%d',
+    'week': '%G-W%V',
+    'month': '%Y-%m',
+}
+
+# cloudmesh.pricing
+DEFAULT_PRICING_CACHE_PATH = '.cache/pricing.json'
+# Seconds the cached catalog is used without asking the API again. Hetzner
+# changes prices a few times a year at most.
+DEFAULT_PRICING_TTL = 86400
+# Prices as shipped with the code, used when the API cannot be reached and no
+# cached catalog exists (or always, in offline mode). A cached catalog file
+# has the same format and can replace it.
+PRICING_FALLBACK_PATH = os.path.join(os.path.dirname(__file__), 'pricing_fallback.json')
+# Hetzner quotes every price net and gross (including VAT).
+PRICE_FIELDS = ('gross', 'net')
+
+# cloudmesh.push
+DEFAULT_GROUP_LABELS = ['domain', 'project']
+DEFAULT_PUSH_STATE_PATH = os.path.join('.cache', 'push_state.json')
+DEFAULT_PUSH_WORKERS = 8
+DEFAULT_PUSH_TIMEOUT = 30.0
+# Unchanged groups are pushed again after this long, so a Pushgateway that
+# lost its data is refilled and push_time_seconds stays recent.
+DEFAULT_REFRESH_INTERVAL = 3600.0
+COMPRESSIONS = ('gzip', 'none')
+
+# cloudmesh.report
+DEFAULT_FORMATS = ['html', 'pdf']
+SUPPORTED_FORMATS = ['html', 'pdf', 'csv', 'json']
+# Rows per PDF chunk; domains are grouped into chunks of about this size.
+DEFAULT_PDF_CHUNK_ROWS = 2000
+
+# cloudmesh.resolver
+DEFAULT_DNS_TIMEOUT = 2.0
+DEFAULT_DNS_ATTEMPTS = 2
+# Queries in flight at once. Local forwarders drop beyond about this many
+# (dnsmasq forwards 150 at a time by default).
+DEFAULT_DNS_CONCURRENCY = 128
+DEFAULT_DNS_CACHE_PATH = os.path.join('.cache', 'dns.json')
+
+# cloudmesh.slack
+DEFAULT_SLACK_ATTEMPTS = 3
+DEFAULT_SLACK_WORKERS = 4
+
+# cloudmesh.usage
+# Seconds of /metrics history aggregated per server.
+DEFAULT_METRICS_WINDOW = 3600
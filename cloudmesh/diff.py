@@ -0,0 +1,120 @@
+import json
+import os
+
+from cloudmesh.defaults import DEFAULT_CHANGE_LOG_PATH, DEFAULT_SNAPSHOT_PATH
+from cloudmesh.model import to_json
+
+def server_key(server):
+    return f"{server['project']}:{server['server_name']}:{server['ip']}"
+
+def diff_entries(previous, current):
+    added = {key: current[key] for key in current.keys() - previous.keys()}
+    removed = {key: previous[key] for key in previous.keys() - current.keys()}
+    changed = {
+        key: (previous[key], current[key])
+        for key in current.keys() & previous.keys()
+        if previous[key] != current[key]
+    }
+    return {'added': added, 'removed': removed, 'changed': changed}
+
+class MappingSnapshot:
+    # The previous run's mappings, servers, per-domain stats and rendered
+    # report sections, keyed so that a new run can be diffed against it.
+    # Mappings are keyed by (domain, subdomain, ip, project, server_name)
+    # tuples and stored as [key, mapping] pairs, JSON has no tuple keys.
+    def __init__(self, mappings=None, servers=None, domain_stats=None, sections=None):
+        self.mappings = mappings or {}
+        self.servers = servers or {}
+        self.domain_stats = domain_stats or {}
+        self.sections = sections or {}
+        self.diff = None
+        # True once the metrics registry holds this snapshot's series, so the
+        # next run only has to apply the diff to it.
+        self.metrics_warm = False
+
+    @classmethod
+    def load(cls, path=DEFAULT_SNAPSHOT_PATH):
+        if not os.path.exists(path):
+            return cls()
+        with open(path, 'r') as f:
+            data = json.load(f)
+        mappings = data.get('mappings')
+        # Snapshots from before tuple keys are dicts; they are simply diffed
+        # as if empty.
+        mappings = {tuple(key): mapping for key, mapping in mappings} if isinstance(mappings, list) else {}
+        return cls(mappings, data.get('servers'), data.get('domain_stats'), data.get('sections'))
+
+    def save(self, path=DEFAULT_SNAPSHOT_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({
+                'mappings': list(self.mappings.items()),
+                'servers': self.servers,
+                'domain_stats': self.domain_stats,
+                'sections': self.sections,
+            }, f, default=to_json)
+        os.replace(tmp_path, path)
+
+    def update(self, mappings, servers, domain_stats):
+        # Diff the new state against the stored one, then make it current.
+        self.diff = {
+            'mappings': diff_entries(self.mappings, mappings),
+            'servers': diff_entries(self.servers, servers),
+            'domain_stats': diff_entries(self.domain_stats, domain_stats),
+        }
+        self.mappings = mappings
+        self.servers = servers
+        self.domain_stats = domain_stats
+        return self.diff
+
+    def changed_domains(self):
+        if self.diff is None:
+            return None
+        domains = set()
+        for entries in self.diff['mappings'].values():
+            domains.update(key[0] for key in entries)
+        domains.update(key for entries in self.diff['domain_stats'].values() for key in entries)
+        return domains
+
+    def summary(self):
+        if self.diff is None:
+            return {}
+        return {
+            kind: {op: len(entries) for op, entries in ops.items()}
+            for kind, ops in self.diff.items()
+        }
+
+def _field_changes(before, after):
+    return {
+        field: [before.get(field), after.get(field)]
+        for field in sorted(before.keys() | after.keys())
+        if before.get(field) != after.get(field)
+    }
+
+def write_change_log(diff, timestamp, path=DEFAULT_CHANGE_LOG_PATH):
+    # One JSON object per line; changed entries carry only the fields that
+    # changed as [before, after] pairs.
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    count = 0
+    with open(path, 'a') as f:
+        for kind in ('servers', 'mappings'):
+            entries = diff[kind]
+            for key in sorted(entries['added']):
+                f.write(json.dumps({'ts': timestamp, 'kind': kind, 'op': 'added', 'key': key,
+                                    'after': entries['added'][key]}, default=to_json) + '\n')
+                count += 1
+            for key in sorted(entries['removed']):
+                f.write(json.dumps({'ts': timestamp, 'kind': kind, 'op': 'removed', 'key': key,
+                                    'before': entries['removed'][key]}, default=to_json) + '\n')
+                count += 1
+            for key in sorted(entries['changed']):
+                before, after = entries['changed'][key]
+                f.write(json.dumps({'ts': timestamp, 'kind': kind, 'op': 'changed', 'key': key,
+                                    'changes': _field_changes(before, after)}) + '\n')
+                count += 1
+    return count
@@ -0,0 +1,134 @@
+import ipaddress
+from collections import namedtuple
+
+from cloudmesh.records import ADDRESS_RECORD_TYPES, subdomain_for
+from cloudmesh.resolver import normalize_address
+
+# Cloudflare's configuration against what the public resolves, per name:
+#   match       live addresses are the configured ones
+#   mismatch    live addresses differ (a zone not delegated to Cloudflare,
+#               an edit not propagated yet, another server answering)
+#   unresolved  the name does not resolve (NXDOMAIN, no data, SERVFAIL,
+#               timeout)
+#   external    a CNAME leaving the fetched zones; there is nothing to
+#               compare with, but where it lands is checked against Hetzner
+#   proxied     behind Cloudflare's proxy and resolving into Cloudflare's
+#               ranges; a proxied name resolving elsewhere is a mismatch,
+#               one not resolving at all unresolved
+STATUSES = ('match', 'mismatch', 'unresolved', 'external', 'proxied')
+FLAGGED_STATUSES = ('mismatch', 'unresolved', 'external')
+
+# Cloudflare's published ranges (https://www.cloudflare.com/ips/), where the
+# public resolves proxied names.
+CLOUDFLARE_NETWORKS = tuple(ipaddress.ip_network(network) for network in (
+    '173.245.48.0/20', '103.21.244.0/22', '103.22.200.0/22', '103.31.4.0/22', '141.101.64.0/18',
+    '108.162.192.0/18', '190.93.240.0/20', '188.114.96.0/20', '197.234.240.0/22', '198.41.128.0/17',
+    '162.158.0.0/15', '104.16.0.0/13', '104.24.0.0/14', '172.64.0.0/13', '131.0.72.0/22',
+    '2400:cb00::/32', '2606:4700::/32', '2803:f800::/32', '2405:b500::/32', '2405:8100::/32', '2a06:98c0::/29',
+    '2c0f:f248::/32',
+))
+
+# configured and live are sorted address tuples; off_hetzner the live
+# addresses no Hetzner resource has; detail a short explanation.
+DnsCheck = namedtuple('DnsCheck', [
+    'domain', 'subdomain', 'status', 'configured', 'live', 'off_hetzner', 'configured_ttl', 'live_ttl', 'detail'
+])
+
+def _configured_names(zone_records, records):
+    # {name: [zone, types, proxied, addresses, ttl]} from the raw zone
+    # records (types, proxy flag) and the address records, which already
+    # carry the addresses in-zone CNAMEs lead to.
+    names = {}
+    for zone, zone_entries in zone_records:
+        for record in zone_entries:
+            if record['type'] not in ADDRESS_RECORD_TYPES and record['type'] != 'CNAME':
+                continue
+            name = record['name'].rstrip('.').lower()
+            entry = names.setdefault(name, [zone['name'], set(), False, set(), None])
+            entry[1].add(record['type'])
+            entry[2] = entry[2] or bool(record.get('proxied'))
+            ttl = record.get('ttl')
+            if ttl and (entry[4] is None or ttl < entry[4]):
+                entry[4] = ttl
+    for record in records:
+        name = (record.domain if record.subdomain == '@' else f"{record.subdomain}.{record.domain}").lower()
+        if name in names:
+            names[name][3].add(normalize_address(record.ip))
+    return names
+
+def _queries(types):
+    if 'CNAME' in types:
+        return ADDRESS_RECORD_TYPES
+    return tuple(record_type for record_type in ADDRESS_RECORD_TYPES if record_type in types)
+
+def _outside(addresses, networks):
+    outside = []
+    for address in addresses:
+        try:
+            parsed = ipaddress.ip_address(address)
+        except ValueError:
+            outside.append(address)
+            continue
+        if not any(parsed.version == network.version and parsed in network for network in networks):
+            outside.append(address)
+    return tuple(sorted(outside))
+
+def cross_check(zone_records, records, address_index, resolver, proxy_networks=CLOUDFLARE_NETWORKS):
+    # One DnsCheck per A/AAAA/CNAME name. Every name is resolved once per
+    # record type it needs, all concurrently; comparisons are set lookups.
+    names = _configured_names(zone_records, records)
+    answers = resolver.resolve(
+        (name, record_type)
+        for name, (_, types, _, _, _) in names.items()
+        for record_type in _queries(types)
+    )
+
+    checks = []
+    for name, (zone, types, proxied, configured, configured_ttl) in names.items():
+        subdomain = subdomain_for(name, zone)
+        results = [answers[(name, record_type)] for record_type in _queries(types)]
+        live = {normalize_address(address) for answer in results for address in answer.addresses}
+        live_ttl = min((answer.ttl for answer in results if answer.status == 'ok'), default=None)
+        if proxied:
+            # The origin is hidden behind Cloudflare, so only the proxy's own
+            # addresses can be checked.
+            outside = _outside(live, proxy_networks)
+            if not live:
+                status = 'unresolved'
+                detail = ', '.join(sorted({answer.status for answer in results}))
+            elif outside:
+                status = 'mismatch'
+                detail = f"proxied, but resolves outside Cloudflare: {', '.join(outside)}"
+            else:
+                status = 'proxied'
+                detail = ''
+            checks.append(DnsCheck(
+                zone, subdomain, status, tuple(sorted(configured)), tuple(sorted(live)), (), configured_ttl,
+                live_ttl, detail
+            ))
+            continue
+        off_hetzner = tuple(sorted(address for address in live if not address_index.lookup(address)))
+        if not live:
+            status = 'unresolved'
+            detail = ', '.join(sorted({answer.status for answer in results}))
+        elif not configured:
+            status = 'external'
+            detail = 'CNAME outside the fetched zones'
+        elif live == configured:
+            status = 'match'
+            detail = ''
+        else:
+            status = 'mismatch'
+            parts = []
+            if live - configured:
+                parts.append(f"not configured: {', '.join(sorted(live - configured))}")
+            if configured - live:
+                parts.append(f"not resolved: {', '.join(sorted(configured - live))}")
+            detail = '; '.join(parts)
+        if off_hetzner and status != 'match':
+            detail = '; '.join(part for part in (detail, f"not on Hetzner: {', '.join(off_hetzner)}") if part)
+        checks.append(DnsCheck(
+            zone, subdomain, status, tuple(sorted(configured)), tuple(sorted(live)), off_hetzner, configured_ttl,
+            live_ttl, detail
+        ))
+    return checks
@@ -0,0 +1,123 @@
+import asyncio
+import ssl
+import time
+
+from cloudmesh.cardinality import sync_series
+from cloudmesh.defaults import DEFAULT_CHECKS
+from cloudmesh.defaults import DEFAULT_HEALTH_CONCURRENCY as DEFAULT_CONCURRENCY
+from cloudmesh.defaults import DEFAULT_HEALTH_TIMEOUT as DEFAULT_TIMEOUT
+
+def _selector_matches(selector, labels):
+    key, _, value = selector.partition('=')
+    if key not in labels:
+        return False
+    return not value or labels[key] == value
+
+def checks_for_server(labels, health_config):
+    checks = []
+    for selector, selector_checks in health_config.get('labels', {}).items():
+        if _selector_matches(selector, labels):
+            checks.extend(check for check in selector_checks if check not in checks)
+    return checks or health_config.get('default', DEFAULT_CHECKS)
+
+def _tls_context():
+    # Probes connect by IP, so the certificate cannot be verified against a
+    # hostname; only the handshake itself is checked.
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    return context
+
+async def _close(writer):
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except OSError:
+        pass
+
+async def _probe_tcp(ip, check):
+    _, writer = await asyncio.open_connection(ip, check['port'])
+    await _close(writer)
+
+async def _probe_tls(ip, check):
+    _, writer = await asyncio.open_connection(
+        ip, check['port'], ssl=_tls_context(), server_hostname=check.get('server_name', '')
+    )
+    await _close(writer)
+
+async def _probe_http(ip, check):
+    reader, writer = await asyncio.open_connection(ip, check['port'])
+    try:
+        host = check.get('host', ip)
+        path = check.get('path', '/')
+        writer.write(f"HEAD {path} HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n\r\n".encode())
+        await writer.drain()
+        status_line = await reader.readline()
+    finally:
+        await _close(writer)
+    parts = status_line.split()
+    if len(parts) < 2 or not parts[0].startswith(b'HTTP/') or int(parts[1]) >= 500:
+        raise ConnectionError(f"unhealthy HTTP response: {status_line!r}")
+
+PROBES = {
+    'tcp': _probe_tcp,
+    'tls': _probe_tls,
+    'http': _probe_http,
+}
+
+async def _run_check(semaphore, ip, check, timeout):
+    probe = PROBES[check['protocol']]
+    async with semaphore:
+        # The whole probe is timed, not just the connect: a tls check
+        # includes the handshake and an http check the request.
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(probe(ip, check), timeout)
+            return {'protocol': check['protocol'], 'port': check['port'], 'healthy': 1,
+                    'duration': time.perf_counter() - start}
+        except (asyncio.TimeoutError, OSError, ValueError):
+            return {'protocol': check['protocol'], 'port': check['port'], 'healthy': 0, 'duration': None}
+
+async def _probe_all(targets, health_config):
+    semaphore = asyncio.Semaphore(health_config.get('concurrency', DEFAULT_CONCURRENCY))
+    timeout = health_config.get('timeout', DEFAULT_TIMEOUT)
+    jobs = []
+    for index, target in enumerate(targets):
+        for check in checks_for_server(target['labels'], health_config):
+            jobs.append((index, _run_check(semaphore, target['ip'], check, timeout)))
+    results = await asyncio.gather(*(job for _, job in jobs))
+
+    servers = [
+        {'server_name': target['server_name'], 'ip': target['ip'], 'checks': []}
+        for target in targets
+    ]
+    for (index, _), result in zip(jobs, results):
+        servers[index]['checks'].append(result)
+    for server in servers:
+        # None for a server without checks: nothing says it is healthy.
+        server['healthy'] = int(all(check['healthy'] for check in server['checks'])) if server['checks'] else None
+    return servers
+
+def probe_servers(targets, health_config=None):
+    # targets: dicts with server_name, ip and the server's raw label dict.
+    # Every check runs concurrently, capped at health_config['concurrency']
+    # in flight, each bounded by health_config['timeout'] seconds.
+    return asyncio.run(_probe_all(targets, health_config or {}))
+
+def record_probe_metrics(metrics, results):
+    health = {}
+    status = {}
+    for server in results:
+        if server['healthy'] is not None:
+            health[(server['server_name'], server['ip'])] = server['healthy']
+        for check in server['checks']:
+            status[(server['server_name'], server['ip'], check['protocol'], str(check['port']))] = check['healthy']
+            if check['duration'] is not None:
+                metrics['probe_duration'].labels(
+                    protocol=check['protocol'],
+                    port=str(check['port'])
+                ).observe(check['duration'])
+    # sync_series also drops series of servers or checks that are gone, for
+    # registries that live across runs.
+    sync_series(metrics['server_health'], health)
+    sync_series(metrics['server_probe_status'], status)
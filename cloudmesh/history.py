@@ -0,0 +1,248 @@
+import glob
+import os
+import sqlite3
+import time
+from datetime import datetime, timezone
+
+from cloudmesh.defaults import DEFAULT_HISTORY_DIR
+from cloudmesh.defaults import HISTORY_BUCKETS as BUCKETS
+from cloudmesh.model import total_spending
+
+# One SQLite file per calendar month (UTC): a query over a date range only
+# opens the months it covers, and old months are archived or deleted as
+# files.
+PARTITION_FORMAT = '%Y-%m'
+
+# Rows are stored as versions: a row identical in consecutive runs is one
+# version whose last_seen moves forward, so a year of hourly runs of a
+# stable estate costs little more than its changes. Timestamps are epoch
+# milliseconds (UTC) and double as run ids.
+RESOURCE_COLUMNS = ('project', 'server_name', 'ip', 'status', 'created', 'server_type', 'labels', 'price_monthly')
+MAPPING_COLUMNS = ('domain', 'subdomain', 'ip', 'record_type', 'project', 'server_name')
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS runs ('
+    ' run_at INTEGER PRIMARY KEY,'
+    ' domains INTEGER NOT NULL,'
+    ' records INTEGER NOT NULL,'
+    ' matched_ips INTEGER NOT NULL,'
+    ' unmatched_ips INTEGER NOT NULL,'
+    ' resources INTEGER NOT NULL,'
+    ' spending REAL NOT NULL)',
+    # Per-run aggregates written with the run, so cost trends never scan
+    # the versions.
+    'CREATE TABLE IF NOT EXISTS project_costs ('
+    ' run_at INTEGER NOT NULL,'
+    ' project TEXT NOT NULL,'
+    ' resources INTEGER NOT NULL,'
+    ' price_monthly REAL NOT NULL,'
+    ' PRIMARY KEY (run_at, project))',
+    'CREATE TABLE IF NOT EXISTS resources ('
+    ' id INTEGER PRIMARY KEY,'
+    + ''.join(f' {column},' for column in RESOURCE_COLUMNS) +
+    ' first_seen INTEGER NOT NULL,'
+    ' last_seen INTEGER NOT NULL)',
+    'CREATE TABLE IF NOT EXISTS mappings ('
+    ' id INTEGER PRIMARY KEY,'
+    + ''.join(f' {column},' for column in MAPPING_COLUMNS) +
+    ' first_seen INTEGER NOT NULL,'
+    ' last_seen INTEGER NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS resources_project ON resources (project)',
+    'CREATE INDEX IF NOT EXISTS resources_ip ON resources (ip)',
+    'CREATE INDEX IF NOT EXISTS resources_last_seen ON resources (last_seen)',
+    'CREATE INDEX IF NOT EXISTS mappings_domain ON mappings (domain, subdomain)',
+    'CREATE INDEX IF NOT EXISTS mappings_ip ON mappings (ip)',
+    'CREATE INDEX IF NOT EXISTS mappings_project ON mappings (project)',
+    'CREATE INDEX IF NOT EXISTS mappings_last_seen ON mappings (last_seen)',
+)
+
+def to_millis(timestamp):
+    return int(timestamp * 1000)
+
+def from_millis(millis):
+    return datetime.fromtimestamp(millis / 1000, timezone.utc)
+
+class HistoryStore:
+    def __init__(self, directory=DEFAULT_HISTORY_DIR):
+        self.directory = directory
+
+    def _path(self, partition):
+        return os.path.join(self.directory, f"{partition}.sqlite")
+
+    def _connect(self, path):
+        conn = sqlite3.connect(path)
+        conn.execute('PRAGMA journal_mode=WAL')
+        for statement in SCHEMA:
+            conn.execute(statement)
+        return conn
+
+    def partitions(self, since=None, until=None):
+        # Existing partition files overlapping [since, until] (epoch ms), in
+        # order.
+        first = None if since is None else from_millis(since).strftime(PARTITION_FORMAT)
+        last = None if until is None else from_millis(until).strftime(PARTITION_FORMAT)
+        paths = []
+        for path in sorted(glob.glob(os.path.join(self.directory, '*.sqlite'))):
+            partition = os.path.basename(path)[:-len('.sqlite')]
+            if (first is None or partition >= first) and (last is None or partition <= last):
+                paths.append(path)
+        return paths
+
+    def record(self, result, run_at=None):
+        # Appends one run: its summary, per-project costs and the versions of
+        # its resources and mappings. Runs must be recorded in time order.
+        run_at = to_millis(time.time() if run_at is None else run_at)
+        os.makedirs(self.directory, exist_ok=True)
+        conn = self._connect(self._path(from_millis(run_at).strftime(PARTITION_FORMAT)))
+        try:
+            with conn:
+                previous = conn.execute('SELECT MAX(run_at) FROM runs').fetchone()[0]
+                if previous is not None and previous >= run_at:
+                    raise ValueError(f"History is append-only: a run at {from_millis(previous).isoformat()} "
+                                     f"is already recorded")
+                resources = {tuple(row[column] for column in RESOURCE_COLUMNS) for row in result.resources}
+                mappings = {
+                    (row.domain,) + tuple(row[column] for column in MAPPING_COLUMNS[1:])
+                    for rows in result.mapping_by_domain.values() for row in rows
+                }
+                self._append(conn, 'resources', RESOURCE_COLUMNS, resources, previous, run_at)
+                self._append(conn, 'mappings', MAPPING_COLUMNS, mappings, previous, run_at)
+
+                costs = {}
+                for row in result.resources:
+                    count, price = costs.get(row['project'], (0, 0.0))
+                    costs[row['project']] = (count + 1, price + row['price_monthly'])
+                conn.executemany(
+                    'INSERT INTO project_costs (run_at, project, resources, price_monthly) VALUES (?, ?, ?, ?)',
+                    ((run_at, project, count, round(price, 2)) for project, (count, price) in costs.items())
+                )
+                conn.execute(
+                    'INSERT INTO runs (run_at, domains, records, matched_ips, unmatched_ips, resources, spending)'
+                    ' VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (run_at, len(result.unique_domains), result.total_a_records, len(result.matched_server_ips),
+                     len(result.unmatched_ips), len(result.resources),
+                     round(total_spending(result.mapping_by_domain), 2))
+                )
+        finally:
+            conn.close()
+        return run_at
+
+    def _append(self, conn, table, columns, rows, previous, run_at):
+        # Versions still open at the previous run are extended to this one
+        # when the row is unchanged and closed otherwise; new rows open new
+        # versions.
+        names = ', '.join(columns)
+        open_versions = {}
+        if previous is not None:
+            for row in conn.execute(f'SELECT id, {names} FROM {table} WHERE last_seen = ?', (previous,)):
+                open_versions[row[1:]] = row[0]
+            conn.execute(f'UPDATE {table} SET last_seen = ? WHERE last_seen = ?', (run_at, previous))
+            conn.executemany(
+                f'UPDATE {table} SET last_seen = ? WHERE id = ?',
+                ((previous, version_id) for row, version_id in open_versions.items() if row not in rows)
+            )
+        conn.executemany(
+            f'INSERT INTO {table} ({names}, first_seen, last_seen) VALUES ({", ".join("?" * (len(columns) + 2))})',
+            (row + (run_at, run_at) for row in rows if row not in open_versions)
+        )
+
+    def _query(self, sql, params, since=None, until=None):
+        # (partition bounds, rows) of each partition in the range.
+        for path in self.partitions(since, until):
+            conn = self._connect(path)
+            try:
+                bounds = conn.execute('SELECT MIN(run_at), MAX(run_at) FROM runs').fetchone()
+                yield bounds, conn.execute(sql, params).fetchall()
+            finally:
+                conn.close()
+
+    def _versions(self, table, columns, where, params, since=None, until=None):
+        # Versions matching `where`, as dicts with first_seen and last_seen.
+        # A version open at the end of one month and continued by the first
+        # run of the next is returned once.
+        since = 0 if since is None else since
+        until = to_millis(time.time()) if until is None else until
+        sql = (f'SELECT {", ".join(columns)}, first_seen, last_seen FROM {table}'
+               f' WHERE {where} AND last_seen >= ? AND first_seen <= ? ORDER BY first_seen')
+        versions = []
+        open_versions = {}
+        for (first_run, last_run), rows in self._query(sql, params + (since, until), since, until):
+            continued = {}
+            for row in rows:
+                content, first_seen, last_seen = row[:-2], row[-2], row[-1]
+                version = open_versions.get(content)
+                if version is not None and first_seen == first_run:
+                    version['last_seen'] = last_seen
+                else:
+                    version = dict(zip(columns, content), first_seen=first_seen, last_seen=last_seen)
+                    versions.append(version)
+                if last_seen == last_run:
+                    continued[content] = version
+            open_versions = continued
+        return versions
+
+    def runs(self, since=None, until=None):
+        sql = ('SELECT run_at, domains, records, matched_ips, unmatched_ips, resources, spending FROM runs'
+               ' WHERE run_at BETWEEN ? AND ? ORDER BY run_at')
+        fields = ('run_at', 'domains', 'records', 'matched_ips', 'unmatched_ips', 'resources', 'spending')
+        bounds = (since or 0, to_millis(time.time()) if until is None else until)
+        return [dict(zip(fields, row)) for _, rows in self._query(sql, bounds, since, until) for row in rows]
+
+    def project_costs(self, since=None, until=None, project=None, bucket='day'):
+        # {bucket: {project: (resources, price_monthly)}} as of the last run
+        # of each bucket ('run', 'day', 'week' or 'month', UTC).
+        if bucket not in BUCKETS:
+            raise ValueError(f"Unknown bucket {bucket!r}, expected one of {', '.join(BUCKETS)}")
+        sql = 'SELECT run_at, project, resources, price_monthly FROM project_costs WHERE run_at BETWEEN ? AND ?'
+        params = (since or 0, to_millis(time.time()) if until is None else until)
+        if project is not None:
+            sql += ' AND project = ?'
+            params += (project,)
+        costs_by_run = {}
+        for _, rows in self._query(sql, params, since, until):
+            for run_at, name, count, price in rows:
+                costs_by_run.setdefault(run_at, {})[name] = (count, price)
+
+        costs = {}
+        for run_at in sorted(costs_by_run):
+            key = run_at if BUCKETS[bucket] is None else from_millis(run_at).strftime(BUCKETS[bucket])
+            costs[key] = costs_by_run[run_at]
+        return costs
+
+    def record_history(self, domain, subdomain=None, since=None, until=None):
+        # Every version of the domain's records (or one subdomain's), i.e.
+        # what each pointed at and from when to when.
+        where, params = 'domain = ?', (domain,)
+        if subdomain is not None:
+            where, params = where + ' AND subdomain = ?', params + (subdomain,)
+        return self._versions('mappings', MAPPING_COLUMNS, where, params, since, until)
+
+    def ip_history(self, ip, since=None, until=None):
+        # (resource versions, record versions) of an address.
+        return (
+            self._versions('resources', RESOURCE_COLUMNS, 'ip = ?', (ip,), since, until),
+            self._versions('mappings', MAPPING_COLUMNS, 'ip = ?', (ip,), since, until),
+        )
+
+def unmatched_since(versions):
+    # {(subdomain, record_type): (since, last_seen)} of the records whose
+    # latest versions point at nothing: since is when they started pointing
+    # to "No match", after the last version that matched a resource.
+    by_record = {}
+    for version in versions:
+        by_record.setdefault((version['subdomain'], version['record_type']), []).append(version)
+    unmatched = {}
+    for key, record_versions in by_record.items():
+        last_seen = max(version['last_seen'] for version in record_versions)
+        current = [version for version in record_versions if version['last_seen'] == last_seen]
+        if any(version['server_name'] != 'No match' for version in current):
+            continue
+        last_matched = max(
+            (version['last_seen'] for version in record_versions if version['server_name'] != 'No match'), default=-1
+        )
+        since = min(
+            version['first_seen'] for version in record_versions
+            if version['server_name'] == 'No match' and version['first_seen'] > last_matched
+        )
+        unmatched[key] = (since, last_seen)
+    return unmatched
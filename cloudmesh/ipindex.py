@@ -0,0 +1,56 @@
+import ipaddress
+
+from cloudmesh.model import IPV6_FLAG, ip_version, pack_ip
+
+class AddressIndex:
+    # Maps IPv4/IPv6 addresses and networks to the resources behind them.
+    # Addresses are packed into ints (see cloudmesh.model.pack_ip). Exact
+    # addresses are a dict lookup; networks (e.g. a server's IPv6 /64) are
+    # grouped by prefix length, so a lookup costs one dict probe per distinct
+    # prefix length in the index.
+    def __init__(self):
+        self.exact = {}
+        self.networks = {}
+
+    @staticmethod
+    def _append(bucket, key, resource):
+        resources = bucket.setdefault(key, [])
+        if not any(existing is resource for existing in resources):
+            resources.append(resource)
+
+    def add(self, address, resource):
+        if not address:
+            return
+        if '/' in address:
+            network = ipaddress.ip_network(address, strict=False)
+            if network.prefixlen == network.max_prefixlen:
+                self._append(self.exact, pack_ip(str(network.network_address)), resource)
+                return
+            prefixes = self.networks.setdefault((network.version, network.prefixlen), {})
+            self._append(prefixes, int(network.network_address) >> (network.max_prefixlen - network.prefixlen), resource)
+        else:
+            packed = pack_ip(address)
+            if packed is None:
+                raise ValueError(f"{address!r} does not appear to be an IPv4 or IPv6 address")
+            self._append(self.exact, packed, resource)
+
+    def lookup(self, address):
+        packed = pack_ip(address)
+        if packed is None:
+            return []
+        resources = self.exact.get(packed, [])
+        if not self.networks:
+            return resources
+        resources = list(resources)
+        version = ip_version(packed)
+        value, max_prefixlen = (packed & ~IPV6_FLAG, 128) if version == 6 else (packed, 32)
+        for (network_version, prefixlen), prefixes in self.networks.items():
+            if network_version != version:
+                continue
+            for resource in prefixes.get(value >> (max_prefixlen - prefixlen), []):
+                if not any(existing is resource for existing in resources):
+                    resources.append(resource)
+        return resources
+
+    def __contains__(self, address):
+        return bool(self.lookup(address))
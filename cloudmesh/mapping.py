@@ -0,0 +1,234 @@
+import collections
+from collections import namedtuple
+from datetime import datetime
+
+from cloudmesh import tracing
+from cloudmesh.diff import server_key
+from cloudmesh.dnscheck import cross_check
+from cloudmesh.health import probe_servers, record_probe_metrics
+from cloudmesh.ipindex import AddressIndex
+from cloudmesh.metrics import emit_dns_metrics, emit_mapping_metrics, emit_reverse_metrics, emit_server_metrics
+from cloudmesh.model import NO_MATCH, MappingRow, ResourceRow, public_address
+from cloudmesh.pricing import load_catalog
+from cloudmesh.records import address_records
+from cloudmesh.reverse import UNASSIGNED, build_reverse_index
+from cloudmesh.usage import traffic_mb
+
+# What build_mappings returns. resources holds every server and network
+# resource, whether or not a record points at it; reverse_index is a
+# cloudmesh.reverse.ReverseIndex; dns_checks the cloudmesh.dnscheck.DnsCheck
+# list, None unless a resolver was given.
+MappingResult = namedtuple('MappingResult', [
+    'mapping_by_domain', 'unique_domains', 'total_a_records', 'matched_server_ips', 'unmatched_ips', 'resources',
+    'reverse_index', 'dns_checks'
+])
+
+# Fields of cloudmesh.usage.aggregate() -> (metric, direction label).
+USAGE_SERIES = {
+    'disk_iops_read': ('server_disk_iops', 'read'),
+    'disk_iops_write': ('server_disk_iops', 'write'),
+    'disk_bandwidth_read': ('server_disk_bandwidth', 'read'),
+    'disk_bandwidth_write': ('server_disk_bandwidth', 'write'),
+    'network_bandwidth_in': ('server_network_bandwidth', 'in'),
+    'network_bandwidth_out': ('server_network_bandwidth', 'out'),
+    'network_pps_in': ('server_network_packets', 'in'),
+    'network_pps_out': ('server_network_packets', 'out'),
+    'cpu_avg': ('server_cpu', 'avg'),
+    'cpu_max': ('server_cpu', 'max'),
+}
+
+def build_mappings(hetzner_results, zone_records, metrics, health_config=None, snapshot=None, metrics_config=None,
+                   network_resources=None, pricing=None, server_usage=None, dns_resolver=None):
+    metrics_config = metrics_config or {}
+    pricing = pricing or load_catalog(offline=True)
+    server_label_keys = set(metrics_config.get('server_label_keys', []))
+    now = datetime.utcnow()
+    all_servers = []
+    probe_targets = []
+    server_series = {key: {} for key in (
+        'server_uptime', 'server_info', 'server_running', 'server_price', 'server_price_hourly', 'server_traffic',
+        'server_included_traffic', 'server_created', 'server_label_info', 'server_cpu', 'server_disk_iops',
+        'server_disk_bandwidth', 'server_network_bandwidth', 'server_network_packets'
+    )}
+    # Every public address (and IPv6 /64) of servers, floating IPs, primary
+    # IPs and load balancers, mapped to the inventory entries behind it.
+    address_index = AddressIndex()
+    servers_by_id = {}
+    unpriced_types = set()
+    # Volumes and assigned floating IPs are billed on top of the server they
+    # are attached to.
+    attached_costs = collections.Counter()
+    for project, kind, resource in network_resources or []:
+        if kind in ('volume', 'floating_ip') and resource.get('server') is not None:
+            attached_costs[(project['project_name'], resource['server'])] += pricing.resource_cost(kind, resource)
+
+    for project, server in hetzner_results:
+        project_name = project['project_name']
+        public_net = server['public_net']
+        ipv4 = (public_net.get('ipv4') or {}).get('ip')
+        ipv6 = (public_net.get('ipv6') or {}).get('ip')
+        ip = public_address(public_net)
+        created = server['created']
+        uptime_seconds = 0
+        created_timestamp = 0
+        if created:
+            try:
+                created_dt = datetime.fromisoformat(created.replace('Z', '+00:00'))
+                created_timestamp = created_dt.timestamp()
+                if server['status'] == 'running':
+                    uptime_seconds = (now - created_dt).total_seconds()
+            except Exception:
+                uptime_seconds = 0
+        server_type = server['server_type']['name']
+        if server_type not in pricing.server_types:
+            unpriced_types.add(server_type)
+        price_hourly, price_monthly = pricing.server_cost(server, attached_costs[(project_name, server.get('id'))])
+        price_monthly = round(price_monthly, 2)
+        identity = (project_name, server['name'])
+        server_series['server_uptime'][(server['name'], project_name, ip)] = uptime_seconds
+        server_series['server_info'][(project_name, server['name'], ip, server_type)] = 1
+        server_series['server_running'][identity] = 1 if server['status'] == 'running' else 0
+        server_series['server_price'][identity] = price_monthly
+        if price_hourly is not None:
+            server_series['server_price_hourly'][identity] = price_hourly
+        traffic = traffic_mb(server.get('outgoing_traffic'))
+        server_series['server_traffic'][identity] = traffic
+        if server.get('included_traffic') is not None:
+            server_series['server_included_traffic'][identity] = traffic_mb(server['included_traffic'])
+        usage = (server_usage or {}).get((project_name, server.get('id'))) or {}
+        for field, value in usage.items():
+            if field in USAGE_SERIES:
+                metric_key, label = USAGE_SERIES[field]
+                server_series[metric_key][identity + (label,)] = value
+        server_series['server_created'][identity] = created_timestamp
+        for key, value in server.get('labels', {}).items():
+            if key in server_label_keys:
+                server_series['server_label_info'][identity + (key, value)] = 1
+        if ip:
+            probe_targets.append({
+                'server_name': server['name'],
+                'ip': ip,
+                'labels': server.get('labels', {})
+            })
+        server_entry = ResourceRow(
+            project_name,
+            server['name'],
+            ip,
+            server['status'],
+            created,
+            server_type,
+            ",".join([f"{k}={v}" for k, v in server.get("labels", {}).items()]),
+            price_monthly,
+            traffic,
+            round(usage['cpu_avg'], 1) if 'cpu_avg' in usage else None
+        )
+        all_servers.append(server_entry)
+        servers_by_id[(project_name, server.get('id'))] = server_entry
+        address_index.add(ipv4, server_entry)
+        address_index.add(ipv6, server_entry)
+
+    if unpriced_types:
+        print(f"No price in the {pricing.source or 'pricing'} catalog for server types: {', '.join(sorted(unpriced_types))}")
+
+    for project, kind, resource in network_resources or []:
+        if kind == 'volume':
+            continue
+        project_name = project['project_name']
+        if kind == 'load_balancer':
+            addresses = [
+                (resource['public_net'].get('ipv4') or {}).get('ip'),
+                (resource['public_net'].get('ipv6') or {}).get('ip'),
+            ]
+            owner = None
+            resource_type = resource['load_balancer_type']['name']
+            status = 'running' if resource['public_net'].get('enabled', True) else 'disabled'
+        else:
+            addresses = [resource['ip']]
+            if kind == 'floating_ip':
+                owner = resource.get('server')
+            else:
+                owner = resource.get('assignee_id') if resource.get('assignee_type') == 'server' else None
+            resource_type = kind.replace('_', '-')
+            status = UNASSIGNED
+
+        if owner is not None and (project_name, owner) in servers_by_id:
+            # Assigned addresses resolve to the server they are routed to.
+            entry = servers_by_id[(project_name, owner)]
+        else:
+            entry = ResourceRow(
+                project_name,
+                resource.get('name') or resource['ip'],
+                next((address for address in addresses if address), ''),
+                status,
+                resource.get('created') or 'N/A',
+                resource_type,
+                ",".join([f"{k}={v}" for k, v in resource.get("labels", {}).items()]),
+                round(pricing.resource_cost(kind, resource), 2),
+                0
+            )
+            all_servers.append(entry)
+        for address in addresses:
+            address_index.add(address, entry)
+
+    emit_server_metrics(metrics, server_series)
+    with tracing.span('health_checks', targets=len(probe_targets)):
+        record_probe_metrics(metrics, probe_servers(probe_targets, health_config))
+
+    with tracing.span('matching'):
+        result = _match_records(
+            zone_records, address_index, all_servers, metrics, snapshot, metrics_config.get('budget')
+        )
+    if dns_resolver is None:
+        return result
+    # What the public resolves, against the configuration and the inventory.
+    with tracing.span('dns_check'):
+        dns_checks = cross_check(zone_records, address_records(zone_records), address_index, dns_resolver)
+    emit_dns_metrics(metrics, dns_checks)
+    return result._replace(dns_checks=dns_checks)
+
+def _match_records(zone_records, address_index, all_servers, metrics, snapshot=None, budget=None):
+    records = list(address_records(zone_records))
+    # Join: every record against the resources behind its address, looked up
+    # once per distinct address. An address can sit in front of several
+    # resources (a load balancer and the targets sharing its /64, say): one
+    # mapping row per resource.
+    resources_by_ip = {ip: address_index.lookup(ip) or [NO_MATCH] for ip in {record.ip for record in records}}
+
+    mapping_by_domain = {}
+    # Tuple keys, which are also the mapping_info_clean label values.
+    unique_mappings = {}
+    for record in records:
+        for resource in resources_by_ip[record.ip]:
+            row = MappingRow(record.domain, record.subdomain, record.ip, record.record_type, resource)
+            key = row.key
+            # Only add if we haven't seen this exact mapping before
+            if key not in unique_mappings:
+                unique_mappings[key] = row
+                mapping_by_domain.setdefault(record.domain, []).append(row)
+
+    # Aggregations over the joined columns.
+    matched_server_ips = {ip for ip, resources in resources_by_ip.items() if resources[0] is not NO_MATCH}
+    unmatched_ips = resources_by_ip.keys() - matched_server_ips
+    totals = collections.Counter(record.domain for record in records)
+    matched = collections.Counter(record.domain for record in records if record.ip in matched_server_ips)
+    costs = collections.Counter()
+    for record in records:
+        for resource in resources_by_ip[record.ip]:
+            costs[record.domain] += resource.price_monthly
+    domain_stats = {
+        domain: {'matched': matched[domain], 'total': total, 'cost': costs[domain]}
+        for domain, total in totals.items()
+    }
+    dns_ttls = {(record.domain, record.subdomain, record.ip): record.ttl for record in records}
+
+    if snapshot is not None:
+        servers_by_key = {server_key(server): server for server in all_servers}
+        snapshot.update(unique_mappings, servers_by_key, domain_stats)
+    emit_mapping_metrics(metrics, unique_mappings, domain_stats, dns_ttls, snapshot, budget)
+    reverse_index = build_reverse_index(unique_mappings.values(), all_servers)
+    emit_reverse_metrics(metrics, reverse_index)
+
+    return MappingResult(
+        mapping_by_domain, set(totals), len(records), matched_server_ips, set(unmatched_ips), all_servers,
+        reverse_index, None
+    )
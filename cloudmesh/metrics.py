@@ -0,0 +1,341 @@
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram
+
+from cloudmesh.cardinality import sync_series
+from cloudmesh.dnscheck import FLAGGED_STATUSES
+from cloudmesh.dnscheck import STATUSES as DNS_CHECK_STATUSES
+from cloudmesh.tracing import STAGE_BUCKETS
+
+def _health_metrics(registry):
+    # Also the whole registry of the health command, pushed on its own.
+    return {
+        'server_health': Gauge(
+            'cloudmesh_server_health_status',
+            'Server health status (1=healthy, 0=unreachable)',
+            ['server_name', 'ip'],
+            registry=registry
+        ),
+        'server_probe_status': Gauge(
+            'cloudmesh_server_probe_status',
+            'Per-check probe status (1=healthy, 0=unreachable)',
+            ['server_name', 'ip', 'protocol', 'port'],
+            registry=registry
+        ),
+        'probe_duration': Histogram(
+            'cloudmesh_server_probe_duration_seconds',
+            'Health probe duration in seconds: the connect, plus the TLS handshake or HTTP request',
+            ['protocol', 'port'],
+            buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0),
+            registry=registry
+        ),
+    }
+
+def setup_health_metrics():
+    registry = CollectorRegistry()
+    return registry, _health_metrics(registry)
+
+def setup_prometheus_metrics():
+    registry = CollectorRegistry()
+    metrics = {
+        'run_counter': Counter('cloudmesh_script_runs_total', 'Total script runs', registry=registry),
+        'run_duration': Gauge('cloudmesh_script_run_duration_seconds', 'Script run duration (seconds)', registry=registry),
+        'domains': Gauge('cloudmesh_domains_total', 'Total domains processed', registry=registry),
+        'a_records': Gauge('cloudmesh_a_records_total', 'Total A records processed', registry=registry),
+        'matched_servers': Gauge('cloudmesh_matched_servers_total', 'Total matched servers', registry=registry),
+        'unmatched_ips': Gauge('cloudmesh_unmatched_ips_total', 'Total unmatched IPs', registry=registry),
+        'error_counter': Counter('cloudmesh_script_errors_total', 'Total script errors', registry=registry),
+        'server_uptime': Gauge(
+            'cloudmesh_server_uptime_seconds',
+            'Server uptime in seconds',
+            ['server_name', 'project', 'ip'],
+            registry=registry
+        ),
+        'dns_ttl': Gauge(
+            'cloudmesh_dns_ttl_seconds',
+            'DNS TTL in seconds',
+            ['domain', 'subdomain', 'ip'],
+            registry=registry
+        ),
+        **_health_metrics(registry),
+        'server_info': Gauge(
+            'cloudmesh_server_info',
+            'Hetzner server identity (always 1)',
+            ['project', 'server_name', 'ip', 'server_type'],
+            registry=registry
+        ),
+        'server_running': Gauge(
+            'cloudmesh_server_running',
+            'Server status (1=running, 0=any other status)',
+            ['project', 'server_name'],
+            registry=registry
+        ),
+        'server_price': Gauge(
+            'cloudmesh_server_price_monthly_euros',
+            'Server monthly price in EUR, including backups, primary IPs, volumes and floating IPs',
+            ['project', 'server_name'],
+            registry=registry
+        ),
+        'server_price_hourly': Gauge(
+            'cloudmesh_server_price_hourly_euros',
+            'Server hourly price in EUR (server type and backups)',
+            ['project', 'server_name'],
+            registry=registry
+        ),
+        'server_traffic': Gauge(
+            'cloudmesh_server_traffic_megabytes',
+            'Outgoing server traffic in MB in the current billing period',
+            ['project', 'server_name'],
+            registry=registry
+        ),
+        'server_included_traffic': Gauge(
+            'cloudmesh_server_included_traffic_megabytes',
+            'Outgoing traffic in MB included in the server price',
+            ['project', 'server_name'],
+            registry=registry
+        ),
+        'server_cpu': Gauge(
+            'cloudmesh_server_cpu_usage_percent',
+            'Server CPU usage over the metrics window (avg or max)',
+            ['project', 'server_name', 'aggregate'],
+            registry=registry
+        ),
+        'server_disk_iops': Gauge(
+            'cloudmesh_server_disk_iops',
+            'Average disk operations per second over the metrics window',
+            ['project', 'server_name', 'direction'],
+            registry=registry
+        ),
+        'server_disk_bandwidth': Gauge(
+            'cloudmesh_server_disk_bytes_per_second',
+            'Average disk throughput over the metrics window',
+            ['project', 'server_name', 'direction'],
+            registry=registry
+        ),
+        'server_network_bandwidth': Gauge(
+            'cloudmesh_server_network_bytes_per_second',
+            'Average network throughput over the metrics window',
+            ['project', 'server_name', 'direction'],
+            registry=registry
+        ),
+        'server_network_packets': Gauge(
+            'cloudmesh_server_network_packets_per_second',
+            'Average network packets per second over the metrics window',
+            ['project', 'server_name', 'direction'],
+            registry=registry
+        ),
+        'server_created': Gauge(
+            'cloudmesh_server_created_timestamp_seconds',
+            'Server creation time as a Unix timestamp',
+            ['project', 'server_name'],
+            registry=registry
+        ),
+        'server_label_info': Gauge(
+            'cloudmesh_server_label_info',
+            'Hetzner server labels whose key is in the configured allow-list (always 1)',
+            ['project', 'server_name', 'key', 'value'],
+            registry=registry
+        ),
+        'domain_records': Gauge(
+            'cloudmesh_domain_records',
+            'A records per domain',
+            ['domain'],
+            registry=registry
+        ),
+        'domain_matched_records': Gauge(
+            'cloudmesh_domain_matched_records',
+            'A records per domain that point at a Hetzner server',
+            ['domain'],
+            registry=registry
+        ),
+        'domain_cost': Gauge(
+            'cloudmesh_domain_monthly_cost_euros',
+            'Monthly cost in EUR of the servers matched by a domain',
+            ['domain'],
+            registry=registry
+        ),
+        'mapping_info_clean': Gauge(
+            'cloudmesh_domain_mapping_info_clean',
+            'Deduplicated domain to server mapping (number of records per label set)',
+            ['domain', 'subdomain', 'ip', 'project', 'server_name'],
+            registry=registry
+        ),
+        'unreferenced_resources': Gauge(
+            'cloudmesh_unreferenced_resources',
+            'Servers and network resources no DNS record points at',
+            ['project'],
+            registry=registry
+        ),
+        'unreferenced_cost': Gauge(
+            'cloudmesh_unreferenced_monthly_cost_euros',
+            'Monthly cost in EUR of the resources no DNS record points at',
+            ['project'],
+            registry=registry
+        ),
+        'stopped_target_records': Gauge(
+            'cloudmesh_stopped_target_records',
+            'DNS records pointing at a stopped server or disabled load balancer',
+            ['project'],
+            registry=registry
+        ),
+        'unassigned_target_records': Gauge(
+            'cloudmesh_unassigned_target_records',
+            'DNS records pointing at a floating or primary IP not assigned to a server',
+            ['project'],
+            registry=registry
+        ),
+        'unassigned_cost': Gauge(
+            'cloudmesh_unassigned_ips_monthly_cost_euros',
+            'Monthly cost in EUR of the floating and primary IPs not assigned to a server',
+            ['project'],
+            registry=registry
+        ),
+        'multi_zone_ips': Gauge(
+            'cloudmesh_multi_zone_ips',
+            'Record addresses referenced from more than one zone',
+            registry=registry
+        ),
+        'dns_check_records': Gauge(
+            'cloudmesh_dns_check_records',
+            'DNS names by cross-check status (match, mismatch, unresolved, external, proxied)',
+            ['status'],
+            registry=registry
+        ),
+        'dns_check_flagged': Gauge(
+            'cloudmesh_dns_check_flagged_records',
+            'DNS names per domain that resolve elsewhere than configured, outside the zones, or not at all',
+            ['domain'],
+            registry=registry
+        ),
+        'metric_series': Gauge(
+            'cloudmesh_metric_series',
+            'Series exported per budgeted metric after cardinality reduction',
+            ['metric'],
+            registry=registry
+        ),
+        'cardinality_aggregated_series': Gauge(
+            'cloudmesh_cardinality_aggregated_series',
+            'Series merged away by the cardinality budget',
+            ['metric'],
+            registry=registry
+        ),
+        'cardinality_dropped_label': Gauge(
+            'cloudmesh_cardinality_dropped_label',
+            'Whether the cardinality budget dropped a label (1=dropped)',
+            ['metric', 'label'],
+            registry=registry
+        ),
+        'api_retries': Counter(
+            'cloudmesh_api_retries_total',
+            'API requests retried, by provider and reason (status code or connection)',
+            ['provider', 'reason'],
+            registry=registry
+        ),
+        'api_throttle_wait': Counter(
+            'cloudmesh_api_throttle_wait_seconds_total',
+            'Seconds spent waiting for the rate limiter',
+            ['provider'],
+            registry=registry
+        ),
+        'api_circuit_open': Counter(
+            'cloudmesh_api_circuit_open_total',
+            'Times the circuit breaker of a provider opened',
+            ['provider'],
+            registry=registry
+        ),
+        'api_request_duration': Histogram(
+            'cloudmesh_api_request_duration_seconds',
+            'Latency of single API requests per host',
+            ['host'],
+            registry=registry
+        ),
+        'api_response_bytes': Counter(
+            'cloudmesh_api_response_bytes_total',
+            'Response bytes received per API host',
+            ['host'],
+            registry=registry
+        ),
+        'stage_duration': Histogram(
+            'cloudmesh_stage_duration_seconds',
+            'Duration of pipeline stages (fetches, health checks, matching, reports, push)',
+            ['stage'],
+            buckets=STAGE_BUCKETS,
+            registry=registry
+        )
+    }
+    return registry, metrics
+
+def remove_series(metric, *labelvalues):
+    try:
+        metric.remove(*labelvalues)
+    except KeyError:
+        pass
+
+def emit_server_metrics(metrics, server_series):
+    for metric_key, series in server_series.items():
+        sync_series(metrics[metric_key], series)
+
+def emit_mapping_metrics(metrics, unique_mappings, domain_stats, dns_ttls, snapshot=None, budget=None):
+    sync_series(metrics['domain_records'], {(domain,): stats['total'] for domain, stats in domain_stats.items()})
+    sync_series(metrics['domain_matched_records'], {(domain,): stats['matched'] for domain, stats in domain_stats.items()})
+    sync_series(metrics['domain_cost'], {(domain,): round(stats['cost'], 2) for domain, stats in domain_stats.items()})
+
+    if budget is not None:
+        dns_ttls = budget.reduce('dns_ttl', ['domain', 'subdomain', 'ip'], dns_ttls, aggregate='min')
+    sync_series(metrics['dns_ttl'], dns_ttls)
+
+    # Mapping keys are the label values, one series per deduplicated mapping.
+    mapping_series = dict.fromkeys(unique_mappings, 1)
+    labelnames = ['domain', 'subdomain', 'ip', 'project', 'server_name']
+    if budget is not None:
+        mapping_series = budget.reduce('mapping_info_clean', labelnames, mapping_series)
+        budget.record_metrics(metrics)
+
+    if budget is not None and budget.reduced('mapping_info_clean'):
+        # Aggregated series do not line up with the diff's keys.
+        sync_series(metrics['mapping_info_clean'], mapping_series)
+        if snapshot is not None:
+            snapshot.metrics_warm = False
+    elif snapshot is None or not snapshot.metrics_warm:
+        sync_series(metrics['mapping_info_clean'], mapping_series)
+        if snapshot is not None:
+            snapshot.metrics_warm = True
+    else:
+        # The registry already holds the previous run's series: only replace
+        # the ones the diff touched.
+        diff = snapshot.diff['mappings']
+        for unique_key in diff['removed']:
+            remove_series(metrics['mapping_info_clean'], *unique_key)
+        for unique_key in diff['added']:
+            metrics['mapping_info_clean'].labels(*unique_key).set(1)
+
+def emit_reverse_metrics(metrics, reverse_index):
+    # Labelled by project only, whatever the size of the inventory.
+    stopped = dict.fromkeys(reverse_index.unused, 0)
+    for row in reverse_index.stopped_targets:
+        stopped[row['project']] = stopped.get(row['project'], 0) + 1
+    unassigned = dict.fromkeys(reverse_index.unused, 0)
+    for row in reverse_index.unassigned_targets:
+        unassigned[row['project']] = unassigned.get(row['project'], 0) + 1
+    unused = reverse_index.unused.items()
+    sync_series(metrics['unreferenced_resources'], {(project,): count for project, (count, _) in unused})
+    sync_series(metrics['unreferenced_cost'], {(project,): cost for project, (_, cost) in unused})
+    sync_series(metrics['stopped_target_records'], {(project,): count for project, count in stopped.items()})
+    sync_series(metrics['unassigned_target_records'], {(project,): count for project, count in unassigned.items()})
+    sync_series(metrics['unassigned_cost'], {
+        (project,): cost for project, (_, cost) in reverse_index.unassigned.items()
+    })
+    metrics['multi_zone_ips'].set(len(reverse_index.shared_ips))
+
+def emit_dns_metrics(metrics, dns_checks):
+    statuses = dict.fromkeys(DNS_CHECK_STATUSES, 0)
+    flagged = {}
+    for check in dns_checks:
+        statuses[check.status] += 1
+        flagged[(check.domain,)] = flagged.get((check.domain,), 0) + (check.status in FLAGGED_STATUSES)
+    sync_series(metrics['dns_check_records'], {(status,): count for status, count in statuses.items()})
+    sync_series(metrics['dns_check_flagged'], flagged)
+
+def set_summary_metrics(metrics, unique_domains, total_a_records, matched_server_ips, unmatched_ips):
+    metrics['domains'].set(len(unique_domains))
+    metrics['a_records'].set(total_a_records)
+    metrics['matched_servers'].set(len(matched_server_ips))
+    metrics['unmatched_ips'].set(len(unmatched_ips))
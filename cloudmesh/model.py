@@ -0,0 +1,144 @@
+import ipaddress
+import socket
+import sys
+from collections.abc import Mapping
+
+# Compact rows for the inventory and the record -> resource mappings. Rows
+# use __slots__ and interned strings, and a mapping row references its
+# resource instead of copying the resource's fields, so the 200k-record
+# case holds one small object per record. Both row types are read-only
+# Mappings, so the report, diff and metrics stages keep indexing them like
+# the dicts they replace.
+
+# IPv6 addresses are packed above this bit so both families share one key
+# space: pack_ip('::') != pack_ip('0.0.0.0').
+IPV6_FLAG = 1 << 128
+
+RESOURCE_FIELDS = (
+    'project', 'server_name', 'ip', 'status', 'created', 'server_type', 'labels', 'price_monthly', 'traffic_mb',
+    'cpu_percent'
+)
+MAPPING_FIELDS = (
+    'subdomain', 'ip', 'record_type', 'project', 'server_name', 'status', 'created', 'server_type',
+    'price_monthly', 'traffic_mb', 'cpu_percent', 'labels'
+)
+_MAPPING_RECORD_FIELDS = frozenset(('subdomain', 'ip', 'record_type'))
+
+intern = sys.intern
+
+def pack_ip(address):
+    # Returns the address as an int (IPv6 with IPV6_FLAG set), or None when it
+    # is not an IP address.
+    try:
+        return int.from_bytes(socket.inet_pton(socket.AF_INET, address), 'big')
+    except (OSError, TypeError):
+        pass
+    try:
+        return int.from_bytes(socket.inet_pton(socket.AF_INET6, address), 'big') | IPV6_FLAG
+    except (OSError, TypeError):
+        return None
+
+def ip_version(packed):
+    return 6 if packed & IPV6_FLAG else 4
+
+def public_address(public_net):
+    # The address a server is labelled and probed on: its IPv4 address, or
+    # for IPv6-only servers the ::1 address of their /64, which is what
+    # Hetzner configures by default. '' when it has neither.
+    ipv4 = (public_net.get('ipv4') or {}).get('ip')
+    ipv6 = (public_net.get('ipv6') or {}).get('ip')
+    return ipv4 or (str(ipaddress.ip_network(ipv6, strict=False)[1]) if ipv6 else '')
+
+class ResourceRow(Mapping):
+    # A server, floating IP, primary IP or load balancer that records can
+    # point at.
+    __slots__ = RESOURCE_FIELDS
+
+    def __init__(self, project, server_name, ip, status, created, server_type, labels, price_monthly, traffic_mb,
+                 cpu_percent=None):
+        self.project = intern(project)
+        self.server_name = server_name
+        self.ip = ip
+        self.status = intern(status)
+        self.created = created
+        self.server_type = intern(server_type)
+        self.labels = intern(labels)
+        self.price_monthly = price_monthly
+        self.traffic_mb = traffic_mb
+        # Average CPU usage over the metrics window, None unless collected.
+        self.cpu_percent = cpu_percent
+
+    def __getitem__(self, field):
+        if field not in RESOURCE_FIELDS:
+            raise KeyError(field)
+        return getattr(self, field)
+
+    def __iter__(self):
+        return iter(RESOURCE_FIELDS)
+
+    def __len__(self):
+        return len(RESOURCE_FIELDS)
+
+    def __repr__(self):
+        return f"ResourceRow({dict(self)!r})"
+
+# What records that match nothing in the inventory map to.
+NO_MATCH = ResourceRow('N/A', 'No match', 'N/A', 'N/A', 'N/A', 'N/A', 'N/A', 0.0, 0)
+
+class MappingRow(Mapping):
+    # One address record of a domain joined to one resource (or NO_MATCH).
+    __slots__ = ('domain', 'subdomain', 'ip', 'record_type', 'resource')
+
+    def __init__(self, domain, subdomain, ip, record_type, resource):
+        self.domain = domain
+        self.subdomain = subdomain
+        self.ip = ip
+        self.record_type = record_type
+        self.resource = resource
+
+    @property
+    def matched(self):
+        return self.resource is not NO_MATCH
+
+    @property
+    def key(self):
+        # Deduplication key, also the label values of mapping_info_clean.
+        return (self.domain, self.subdomain, self.ip, self.resource.project, self.resource.server_name)
+
+    def __getitem__(self, field):
+        if field in _MAPPING_RECORD_FIELDS:
+            return getattr(self, field)
+        if field not in RESOURCE_FIELDS:
+            raise KeyError(field)
+        return getattr(self.resource, field)
+
+    def __iter__(self):
+        return iter(MAPPING_FIELDS)
+
+    def __len__(self):
+        return len(MAPPING_FIELDS)
+
+    def __repr__(self):
+        return f"MappingRow({self.domain!r}, {dict(self)!r})"
+
+def to_json(value):
+    # json.dump(default=...) hook for rows.
+    if isinstance(value, Mapping):
+        return dict(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def distinct_resources(rows):
+    # Matched resources of the given mapping rows, each once.
+    resources = {}
+    for row in rows:
+        if row['server_name'] != 'No match':
+            resources[(row['project'], row['server_name'])] = row
+    return resources.values()
+
+def total_spending(mapping_by_domain):
+    # Monthly cost of every matched resource, counted once however many
+    # records point at it.
+    return sum(
+        row['price_monthly']
+        for row in distinct_resources(row for rows in mapping_by_domain.values() for row in rows)
+    )
@@ -0,0 +1,183 @@
+import json
+import os
+import time
+
+import requests
+
+from cloudmesh import api, tracing
+from cloudmesh.defaults import DEFAULT_PRICING_CACHE_PATH, DEFAULT_PRICING_TTL, PRICE_FIELDS
+from cloudmesh.defaults import PRICING_FALLBACK_PATH as FALLBACK_PATH
+
+def _amount(price, field):
+    # {'net': '3.7900000000', 'gross': '4.5101000000'} -> 4.5101
+    if not price:
+        return None
+    value = price.get(field)
+    return None if value is None else float(value)
+
+def _by_location(prices, field):
+    # Hetzner price lists -> {location: (hourly, monthly)}. Entries without a
+    # location (the fallback file) apply to every location.
+    return {
+        entry.get('location'): (_amount(entry.get('price_hourly'), field), _amount(entry.get('price_monthly'), field))
+        for entry in prices or []
+    }
+
+def _at(prices_by_location, location):
+    if not prices_by_location:
+        return None
+    if location in prices_by_location:
+        return prices_by_location[location]
+    if None in prices_by_location:
+        return prices_by_location[None]
+    # Unknown location: any location's price beats none at all.
+    return next(iter(prices_by_location.values()))
+
+def _location(resource, *path):
+    for key in path:
+        resource = (resource or {}).get(key)
+    return resource
+
+class PricingCatalog:
+    # Hetzner prices per server type, primary IP, floating IP and load
+    # balancer type and location, plus volume and backup pricing, from a
+    # catalog document:
+    #   {'fetched_at': ..., 'source': ..., 'server_types': [...], 'pricing': {...}}
+    # where server_types is the /v1/server_types listing and pricing the
+    # /v1/pricing object.
+    def __init__(self, document, price_field='gross', ttl=DEFAULT_PRICING_TTL):
+        if price_field not in PRICE_FIELDS:
+            raise ValueError(f"Unknown price field {price_field!r}, expected one of {', '.join(PRICE_FIELDS)}")
+        pricing = document.get('pricing') or {}
+        self.source = document.get('source')
+        self.fetched_at = document.get('fetched_at')
+        self.expires_at = (self.fetched_at or time.time()) + ttl
+        self.currency = pricing.get('currency', 'EUR')
+        # /v1/server_types first, /v1/pricing for anything it lacks.
+        self.server_types = {
+            item['name']: _by_location(item.get('prices'), price_field)
+            for item in pricing.get('server_types', [])
+        }
+        self.server_types.update(
+            (item['name'], _by_location(item.get('prices'), price_field))
+            for item in document.get('server_types', [])
+        )
+        self.primary_ips = {
+            item['type']: _by_location(item.get('prices'), price_field) for item in pricing.get('primary_ips', [])
+        }
+        self.floating_ips = {
+            item['type']: _by_location(item.get('prices'), price_field) for item in pricing.get('floating_ips', [])
+        }
+        self.load_balancer_types = {
+            item['name']: _by_location(item.get('prices'), price_field)
+            for item in pricing.get('load_balancer_types', [])
+        }
+        self.volume_per_gb = _amount((pricing.get('volume') or {}).get('price_per_gb_month'), price_field) or 0.0
+        self.backup_ratio = float((pricing.get('server_backup') or {}).get('percentage') or 0) / 100
+
+    @property
+    def expired(self):
+        return time.time() >= self.expires_at
+
+    def server_type(self, name, location=None):
+        # (hourly, monthly) for a server type; hourly is None when the
+        # catalog only has monthly prices, both are 0.0 for unknown types.
+        price = _at(self.server_types.get(name), location)
+        if price is None:
+            return 0.0, 0.0
+        return price[0], price[1] or 0.0
+
+    def primary_ip(self, ip_type, location=None):
+        price = _at(self.primary_ips.get(ip_type), location)
+        return (price[1] or 0.0) if price else 0.0
+
+    def floating_ip(self, ip_type, location=None):
+        price = _at(self.floating_ips.get(ip_type), location)
+        return (price[1] or 0.0) if price else 0.0
+
+    def load_balancer(self, name, location=None):
+        price = _at(self.load_balancer_types.get(name), location)
+        return (price[1] or 0.0) if price else 0.0
+
+    def volume(self, size_gb):
+        return size_gb * self.volume_per_gb
+
+    def server_cost(self, server, attached=0.0):
+        # (hourly, monthly) cost of a server: its type at its location, the
+        # backup surcharge when backups are enabled, its primary IPs and the
+        # monthly cost of anything attached to it (volumes, floating IPs).
+        location = _location(server, 'datacenter', 'location', 'name')
+        hourly, monthly = self.server_type(server['server_type']['name'], location)
+        if server.get('backup_window'):
+            monthly += monthly * self.backup_ratio
+            if hourly is not None:
+                hourly += hourly * self.backup_ratio
+        public_net = server.get('public_net') or {}
+        for ip_type in ('ipv4', 'ipv6'):
+            if public_net.get(ip_type):
+                monthly += self.primary_ip(ip_type, location)
+        return hourly, monthly + attached
+
+    def resource_cost(self, kind, resource):
+        # Monthly cost of a network resource or volume from the collector.
+        if kind == 'load_balancer':
+            return self.load_balancer(resource['load_balancer_type']['name'], _location(resource, 'location', 'name'))
+        if kind == 'floating_ip':
+            return self.floating_ip(resource['type'], _location(resource, 'home_location', 'name'))
+        if kind == 'primary_ip':
+            return self.primary_ip(resource['type'], _location(resource, 'datacenter', 'location', 'name'))
+        if kind == 'volume':
+            return self.volume(resource.get('size') or 0)
+        return 0.0
+
+def fetch_catalog(token):
+    # A catalog document straight from the API.
+    return {
+        'fetched_at': time.time(),
+        'source': api.HETZNER_API_URL,
+        'server_types': api.fetch_hetzner_server_types(token),
+        'pricing': api.fetch_hetzner_pricing(token),
+    }
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _write(path, document):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temporary = f"{path}.tmp"
+    with open(temporary, 'w') as f:
+        json.dump(document, f)
+    os.replace(temporary, path)
+
+def load_catalog(token=None, cache_path=DEFAULT_PRICING_CACHE_PATH, ttl=DEFAULT_PRICING_TTL, offline=False,
+                 fallback_path=FALLBACK_PATH, price_field='gross'):
+    # The cached catalog while younger than ttl, else a fresh one from the
+    # API (written back to the cache), else the stale cache, else the
+    # fallback file. Offline, or without a token, only the fallback file is
+    # read.
+    if offline or not token:
+        return PricingCatalog(_read(fallback_path) or {}, price_field, ttl=float('inf'))
+
+    cached = cache_path and _read(cache_path)
+    if cached and time.time() - (cached.get('fetched_at') or 0) < ttl:
+        return PricingCatalog(cached, price_field, ttl)
+
+    try:
+        with tracing.span('fetch_pricing'):
+            document = fetch_catalog(token)
+    except (requests.RequestException, KeyError, ValueError) as e:
+        if cached:
+            print(f"Error fetching Hetzner pricing, using cached catalog from {cache_path}: {e}")
+            # Retry on the next load rather than after another full TTL.
+            return PricingCatalog(dict(cached, fetched_at=time.time() - ttl), price_field, ttl)
+        print(f"Error fetching Hetzner pricing, using fallback prices from {fallback_path}: {e}")
+        return PricingCatalog(_read(fallback_path) or {}, price_field, ttl=0)
+    if cache_path:
+        _write(cache_path, document)
+    return PricingCatalog(document, price_field, ttl)
@@ -0,0 +1,172 @@
+import base64
+import gzip
+import hashlib
+import json
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+import requests
+
+from cloudmesh import client, tracing
+from cloudmesh.defaults import DEFAULT_GROUP_LABELS, DEFAULT_PUSH_STATE_PATH, DEFAULT_REFRESH_INTERVAL
+from cloudmesh.defaults import DEFAULT_PUSH_TIMEOUT as DEFAULT_TIMEOUT
+from cloudmesh.defaults import DEFAULT_PUSH_WORKERS as DEFAULT_WORKERS
+
+# The registry is pushed as one Pushgateway group per value of the first of
+# these labels a series has (…/metrics/job/cloudmesh/domain/example.com),
+# and everything else as the job's own group. A group replaces only itself,
+# so a run re-sends just the domains and projects whose series changed
+# instead of one exposition of every series.
+# The text exposition format generate_latest() writes.
+TEXT_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Per group: the URL path below the gateway, the exposition size, the bytes
+# sent (None when skipped as unchanged), seconds taken and the error if any.
+GroupResult = namedtuple('GroupResult', ['path', 'bytes', 'sent_bytes', 'seconds', 'error'])
+
+def _segment(name, value):
+    # Pushgateway path encoding: base64 for values a path cannot carry.
+    if value == '' or '/' in value:
+        return f"{name}@base64/{base64.urlsafe_b64encode(value.encode()).decode() or '='}"
+    return f"{name}/{quote(value, safe='')}"
+
+def group_path(job, grouping_key=()):
+    return 'metrics/' + '/'.join(_segment(name, value) for name, value in (('job', job),) + tuple(grouping_key))
+
+class _Group(dict):
+    # {family name: family} of one group; a collector generate_latest()
+    # accepts.
+    def collect(self):
+        return list(self.values())
+
+def split_registry(registry, job, group_labels=DEFAULT_GROUP_LABELS):
+    # {path: exposition bytes}; the job's own group is always present.
+    # prometheus_client is imported here rather than at the top, so loading
+    # the configuration does not load it.
+    from prometheus_client import generate_latest
+    from prometheus_client.metrics_core import Metric
+
+    groups = {(): _Group()}
+    for family in registry.collect():
+        for sample in family.samples:
+            grouping_key = ()
+            for label in group_labels:
+                if label in sample.labels:
+                    grouping_key = ((label, sample.labels[label]),)
+                    break
+            group = groups.get(grouping_key)
+            if group is None:
+                group = groups[grouping_key] = _Group()
+            if family.name not in group:
+                group[family.name] = Metric(family.name, family.documentation, family.type, family.unit)
+            group[family.name].samples.append(sample)
+    return {group_path(job, grouping_key): generate_latest(group) for grouping_key, group in groups.items()}
+
+def load_state(path):
+    if not path or not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_state(path, state):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+def _send(gateway, method, path, body, compression, timeout):
+    url = f"{gateway.rstrip('/')}/{path}"
+    headers = {}
+    data = None
+    if body is not None:
+        headers['Content-Type'] = TEXT_CONTENT_TYPE
+        data = body
+        if compression == 'gzip':
+            headers['Content-Encoding'] = 'gzip'
+            data = gzip.compress(body)
+    with tracing.span('push_group', group=path, method=method, bytes=len(body or b''), sent_bytes=len(data or b'')):
+        response = client.request(method, url, headers=headers, data=data, timeout=timeout)
+        response.raise_for_status()
+    return len(data or b'')
+
+def push_groups(gateway, job, registry, group_labels=DEFAULT_GROUP_LABELS, state_path=DEFAULT_PUSH_STATE_PATH,
+                workers=DEFAULT_WORKERS, compression='gzip', timeout=DEFAULT_TIMEOUT,
+                refresh_interval=DEFAULT_REFRESH_INTERVAL):
+    # Pushes the registry group by group, `workers` at a time, each with the
+    # API client's retries. With a state file, groups whose exposition is
+    # the one pushed last time (within refresh_interval) are skipped and
+    # groups that are gone are deleted from the gateway. Returns
+    # (pushed or skipped group results, deleted group results).
+    if not gateway.startswith(('http://', 'https://')):
+        gateway = f"http://{gateway}"
+    bodies = split_registry(registry, job, group_labels)
+    state_key = f"{gateway.rstrip('/')}/{group_path(job)}"
+    state = load_state(state_path)
+    previous = state.get(state_key, {})
+    now = time.time()
+
+    def push(path, force=False):
+        body = bodies[path]
+        digest = hashlib.sha256(body).hexdigest()
+        known = previous.get(path)
+        started = time.perf_counter()
+        unchanged = known and known['digest'] == digest and now - known['pushed_at'] < refresh_interval
+        if state_path and unchanged and not force:
+            return GroupResult(path, len(body), None, 0.0, None), known
+        try:
+            sent = _send(gateway, 'PUT', path, body, compression, timeout)
+        except requests.RequestException as e:
+            return GroupResult(path, len(body), 0, time.perf_counter() - started, e), known
+        return GroupResult(path, len(body), sent, time.perf_counter() - started, None), {
+            'digest': digest, 'pushed_at': now
+        }
+
+    def delete(path):
+        started = time.perf_counter()
+        try:
+            _send(gateway, 'DELETE', path, None, compression, timeout)
+        except requests.RequestException as e:
+            return GroupResult(path, 0, 0, time.perf_counter() - started, e), previous[path]
+        return GroupResult(path, 0, 0, time.perf_counter() - started, None), None
+
+    # The job's own group goes last and always: its push_time_seconds then
+    # says when the whole registry was last sent.
+    job_path = group_path(job)
+    group_paths = [path for path in bodies if path != job_path]
+    stale_paths = [path for path in previous if path not in bodies] if state_path else []
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='push') as executor:
+        pushed = list(executor.map(tracing.wrap_context(push), group_paths))
+        deleted = list(executor.map(tracing.wrap_context(delete), stale_paths))
+    pushed.append(push(job_path, force=True))
+
+    if state_path:
+        entries = {}
+        for (result, entry) in pushed + deleted:
+            if entry is not None:
+                entries[result.path] = entry
+        state[state_key] = entries
+        save_state(state_path, state)
+    return [result for result, _ in pushed], [result for result, _ in deleted]
+
+def summarize(pushed, deleted):
+    # (one line for the run output, failed group results).
+    sent = [result for result in pushed if result.sent_bytes is not None and result.error is None]
+    unchanged = sum(result.sent_bytes is None for result in pushed)
+    removed = sum(result.error is None for result in deleted)
+    failed = [result for result in pushed + deleted if result.error is not None]
+    line = (f"{len(sent)} of {len(pushed)} groups pushed ({unchanged} unchanged, {removed} removed), "
+            f"{sum(result.bytes for result in sent) / 1024:.1f} KiB sent as "
+            f"{sum(result.sent_bytes for result in sent) / 1024:.1f} KiB")
+    if sent:
+        slowest = max(sent, key=lambda result: result.seconds)
+        line += f", slowest {slowest.path} in {slowest.seconds:.3f}s"
+    return line, failed
@@ -0,0 +1,71 @@
+from collections import namedtuple
+
+from cloudmesh.model import intern
+
+ADDRESS_RECORD_TYPES = ('A', 'AAAA')
+# CNAME chains longer than this are treated as unresolvable.
+MAX_CNAME_DEPTH = 8
+
+AddressRecord = namedtuple('AddressRecord', ['domain', 'subdomain', 'ip', 'ttl', 'record_type'])
+
+def subdomain_for(name, zone_name):
+    return name.replace(f".{zone_name}", "") if name != zone_name else "@"
+
+def _normalize(name):
+    return name.rstrip('.').lower()
+
+def address_records(zone_records):
+    # Yields one AddressRecord per (record, address) for A and AAAA records,
+    # and for CNAMEs whose chain ends in A/AAAA records inside the fetched
+    # zones.
+    # CNAMEs pointing outside those zones are skipped: there is nothing in
+    # the inventory they could match.
+    addresses_by_name = {}
+    cnames = []
+    cname_targets = {}
+    for zone, records in zone_records:
+        for record in records:
+            name = _normalize(record['name'])
+            if record['type'] in ADDRESS_RECORD_TYPES:
+                addresses_by_name.setdefault(name, []).append(record['content'])
+            elif record['type'] == 'CNAME':
+                cname_targets[name] = _normalize(record['content'])
+                cnames.append((zone, record))
+
+    for zone, records in zone_records:
+        domain = intern(zone['name'])
+        for record in records:
+            if record['type'] in ADDRESS_RECORD_TYPES:
+                yield AddressRecord(
+                    domain,
+                    subdomain_for(record['name'], domain),
+                    intern(record['content']),
+                    record.get('ttl', 0),
+                    intern(record['type'])
+                )
+
+    resolved = {}
+    for zone, record in cnames:
+        name = _normalize(record['name'])
+        if name not in resolved:
+            resolved[name] = _resolve_chain(name, cname_targets, addresses_by_name)
+        for ip in resolved[name]:
+            yield AddressRecord(
+                intern(zone['name']),
+                subdomain_for(record['name'], zone['name']),
+                intern(ip),
+                record.get('ttl', 0),
+                'CNAME'
+            )
+
+def _resolve_chain(name, cname_targets, addresses_by_name):
+    seen = {name}
+    target = cname_targets[name]
+    for _ in range(MAX_CNAME_DEPTH):
+        if target in addresses_by_name:
+            return addresses_by_name[target]
+        if target not in cname_targets or target in seen:
+            return []
+        seen.add(target)
+        target = cname_targets[target]
+    return []
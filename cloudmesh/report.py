@@ -0,0 +1,394 @@
+import csv
+import importlib.util
+import json
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from html import escape
+
+from cloudmesh import tracing
+from cloudmesh.defaults import DEFAULT_FORMATS, DEFAULT_PDF_CHUNK_ROWS
+from cloudmesh.dnscheck import FLAGGED_STATUSES
+from cloudmesh.dnscheck import STATUSES as DNS_CHECK_STATUSES
+from cloudmesh.model import total_spending
+
+
+REPORT_COLUMNS = [
+    'domain', 'subdomain', 'ip', 'project', 'server_name', 'status', 'created',
+    'server_type', 'price_monthly', 'traffic_mb', 'cpu_percent', 'labels'
+]
+
+HEAD_TEMPLATE = """
+    <html>
+    <head>
+        <title>Domain to Server Mapping</title>
+        <style>
+            body { font-family: Arial, sans-serif; }
+            h1, h2 { color: #333; }
+            table { border-collapse: collapse; width: 100%; margin-bottom: 20px; }
+            th, td { border: 1px solid black; padding: 8px; text-align: left; }
+            th { background-color: #f2f2f2; }
+            .no-match { background-color: #ffcccc; }
+        </style>
+    </head>
+    <body>
+    """
+
+SUMMARY_TEMPLATE = """
+    <h1>Domain to Server Mapping</h1>
+    <h2>Summary</h2>
+    <table>
+        <tr><td>Total Domains</td><td>{total_domains}</td></tr>
+        <tr><td>Total Address Records</td><td>{total_a_records}</td></tr>
+        <tr><td>Total Matched Servers</td><td>{total_servers}</td></tr>
+        <tr><td>Total Monthly Spending (€)</td><td>{total_spending:.2f}</td></tr>
+    </table>
+    <p>Note: 'No match' indicates that the IP address does not correspond to any server in the provided Hetzner projects.</p>
+    """
+
+SECTION_TEMPLATE = """<h2>Domain: {domain} ({num_records} records)</h2>
+    <table>
+    <tr>
+        <th>Subdomain</th>
+        <th>IP</th>
+        <th>Project</th>
+        <th>Server Name</th>
+        <th>Status</th>
+        <th>Created</th>
+        <th>Server Type</th>
+        <th>Price (€/month)</th>
+        <th>Traffic (MB)</th>
+        <th>CPU (%)</th>
+        <th>Labels</th>
+    </tr>
+    """
+
+ROW_TEMPLATE = (
+    "<tr{row_class}><td>{subdomain}</td><td>{ip}</td><td>{project}</td><td>{server_name}</td>"
+    "<td>{status}</td><td>{created}</td><td>{server_type}</td><td>{price_monthly}</td>"
+    "<td>{traffic_mb}</td><td>{cpu_percent}</td><td>{labels}</td></tr>\n"
+)
+
+UNUSED_TEMPLATE = """
+    <h2>Unused Resources</h2>
+    <p>Servers and network resources no DNS record points at, and their monthly cost.</p>
+    <table>
+    <tr><th>Project</th><th>Resources</th><th>Unused Resources</th><th>Unused Spending (€/month)</th>
+    <th>Unassigned IPs</th><th>Unassigned IP Spending (€/month)</th></tr>
+    {projects}
+    </table>
+    <table>
+    <tr><th>Project</th><th>Name</th><th>IP</th><th>Status</th><th>Type</th><th>Price (€/month)</th></tr>
+    {resources}
+    </table>
+    <h2>Records Pointing at Stopped Resources ({num_stopped})</h2>
+    <table>
+    <tr><th>Domain</th><th>Subdomain</th><th>IP</th><th>Project</th><th>Server Name</th><th>Status</th></tr>
+    {stopped}
+    </table>
+    <h2>Records Pointing at Unassigned IPs ({num_unassigned})</h2>
+    <p>Floating and primary IPs that are billed but not assigned to any server.</p>
+    <table>
+    <tr><th>Domain</th><th>Subdomain</th><th>IP</th><th>Project</th><th>Name</th><th>Type</th></tr>
+    {unassigned}
+    </table>
+    <h2>Addresses Used by Several Zones ({num_shared})</h2>
+    <table>
+    <tr><th>IP</th><th>Zones</th></tr>
+    {shared}
+    </table>
+    """
+
+DNS_CHECK_TEMPLATE = """
+    <h2>DNS Cross-Check</h2>
+    <p>Cloudflare's records against live resolution: {counts}.</p>
+    <table>
+    <tr><th>Domain</th><th>Subdomain</th><th>Status</th><th>Configured</th><th>Resolved</th>
+    <th>TTL (configured/live)</th><th>Details</th></tr>
+    {rows}
+    </table>
+    """
+
+FOOT_TEMPLATE = "</body></html>"
+
+def report_rows(domain, items):
+    # Display rows of one domain, sorted by subdomain, shared by all formats.
+    for item in sorted(items, key=lambda x: x['subdomain']):
+        matched = item['server_name'] != 'No match'
+        created = item['created']
+        if created != 'N/A':
+            created = datetime.fromisoformat(created.replace('Z', '+00:00')).strftime('%Y-%m-%d')
+        yield {
+            'domain': domain,
+            'subdomain': item['subdomain'],
+            'ip': item['ip'],
+            'project': item['project'],
+            'server_name': item['server_name'],
+            'status': item['status'],
+            'created': created,
+            'server_type': item['server_type'],
+            'price_monthly': item['price_monthly'] if matched else 'N/A',
+            'traffic_mb': item['traffic_mb'] if matched else 'N/A',
+            'cpu_percent': item['cpu_percent'] if matched and item['cpu_percent'] is not None else 'N/A',
+            'labels': item['labels'],
+        }
+
+def iter_domain_section(domain, items):
+    yield SECTION_TEMPLATE.format(domain=escape(domain), num_records=len(items))
+    for row in report_rows(domain, items):
+        row_class = ' class="no-match"' if row['server_name'] == 'No match' else ''
+        yield ROW_TEMPLATE.format(row_class=row_class, **{key: escape(str(value)) for key, value in row.items()})
+    yield "</table>"
+
+def render_domain_section(domain, items):
+    return ''.join(iter_domain_section(domain, items))
+
+def render_summary(mapping_by_domain, unique_domains, total_a_records, matched_server_ips):
+    total_servers = len(matched_server_ips)
+    return SUMMARY_TEMPLATE.format(
+        total_domains=len(unique_domains),
+        total_a_records=total_a_records,
+        total_servers=total_servers,
+        total_spending=total_spending(mapping_by_domain)
+    )
+
+def _cells(*values):
+    return ''.join(f"<td>{escape(str(value))}</td>" for value in values)
+
+def render_reverse_index(reverse_index):
+    unreferenced = sorted(reverse_index.unreferenced, key=lambda row: (row['project'], row['server_name']))
+    stopped = sorted(reverse_index.stopped_targets, key=lambda row: (row.domain, row['subdomain'], row['ip']))
+    unassigned = sorted(reverse_index.unassigned_targets, key=lambda row: (row.domain, row['subdomain'], row['ip']))
+    return UNUSED_TEMPLATE.format(
+        projects=''.join(
+            "<tr>" + _cells(project, reverse_index.totals[project], count, f'{cost:.2f}',
+                            reverse_index.unassigned[project][0], f'{reverse_index.unassigned[project][1]:.2f}')
+            + "</tr>"
+            for project, (count, cost) in sorted(reverse_index.unused.items())
+        ),
+        resources=''.join(
+            "<tr>" + _cells(*(row[key] for key in ('project', 'server_name', 'ip', 'status', 'server_type',
+                                                   'price_monthly'))) + "</tr>"
+            for row in unreferenced
+        ),
+        num_stopped=len(stopped),
+        stopped=''.join(
+            "<tr>" + _cells(row.domain, *(row[key] for key in ('subdomain', 'ip', 'project', 'server_name',
+                                                               'status'))) + "</tr>"
+            for row in stopped
+        ),
+        num_unassigned=len(unassigned),
+        unassigned=''.join(
+            "<tr>" + _cells(row.domain, *(row[key] for key in ('subdomain', 'ip', 'project', 'server_name',
+                                                               'server_type'))) + "</tr>"
+            for row in unassigned
+        ),
+        num_shared=len(reverse_index.shared_ips),
+        shared=''.join(
+            f"<tr>{_cells(ip, ', '.join(sorted(zones)))}</tr>" for ip, zones in sorted(reverse_index.shared_ips.items())
+        ),
+    )
+
+def render_dns_checks(dns_checks):
+    # Only the names that need a look; the counts cover every name.
+    counts = {}
+    for check in dns_checks:
+        counts[check.status] = counts.get(check.status, 0) + 1
+    flagged = sorted(
+        (check for check in dns_checks if check.status in FLAGGED_STATUSES),
+        key=lambda check: (check.domain, check.subdomain)
+    )
+    return DNS_CHECK_TEMPLATE.format(
+        counts=', '.join(f"{counts.get(status, 0)} {status}" for status in DNS_CHECK_STATUSES),
+        rows=''.join(
+            "<tr>" + _cells(
+                check.domain, check.subdomain, check.status, ', '.join(check.configured) or 'N/A',
+                ', '.join(check.live) or 'N/A', f"{check.configured_ttl or 'N/A'}/{check.live_ttl or 'N/A'}",
+                check.detail
+            ) + "</tr>"
+            for check in flagged
+        ),
+    )
+
+def iter_html_report(mapping_by_domain, unique_domains, total_a_records, matched_server_ips, snapshot=None,
+                     reverse_index=None, dns_checks=None):
+    yield HEAD_TEMPLATE
+    yield render_summary(mapping_by_domain, unique_domains, total_a_records, matched_server_ips)
+    if reverse_index is not None:
+        yield render_reverse_index(reverse_index)
+    if dns_checks is not None:
+        yield render_dns_checks(dns_checks)
+
+    if snapshot is None:
+        for domain in sorted(mapping_by_domain.keys()):
+            yield from iter_domain_section(domain, mapping_by_domain[domain])
+    else:
+        changed_domains = snapshot.changed_domains()
+        sections = {}
+        for domain in sorted(mapping_by_domain.keys()):
+            # Sections of domains the diff did not touch are reused as rendered.
+            if changed_domains is not None and domain not in changed_domains and domain in snapshot.sections:
+                sections[domain] = snapshot.sections[domain]
+            else:
+                sections[domain] = render_domain_section(domain, mapping_by_domain[domain])
+            yield sections[domain]
+        snapshot.sections = sections
+
+    yield FOOT_TEMPLATE
+
+def generate_html_report(mapping_by_domain, unique_domains, total_a_records, matched_server_ips, snapshot=None,
+                         reverse_index=None, dns_checks=None):
+    return ''.join(iter_html_report(
+        mapping_by_domain, unique_domains, total_a_records, matched_server_ips, snapshot, reverse_index, dns_checks
+    ))
+
+def write_html_report(path, mapping_by_domain, unique_domains, total_a_records, matched_server_ips, snapshot=None,
+                      reverse_index=None, dns_checks=None):
+    with open(path, 'w') as f:
+        f.writelines(iter_html_report(
+            mapping_by_domain, unique_domains, total_a_records, matched_server_ips, snapshot, reverse_index, dns_checks
+        ))
+
+def write_csv_report(path, mapping_by_domain):
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=REPORT_COLUMNS)
+        writer.writeheader()
+        for domain in sorted(mapping_by_domain.keys()):
+            writer.writerows(report_rows(domain, mapping_by_domain[domain]))
+
+def write_json_report(path, mapping_by_domain):
+    # Written row by row so the whole document is never held in memory.
+    with open(path, 'w') as f:
+        f.write('[')
+        first = True
+        for domain in sorted(mapping_by_domain.keys()):
+            for row in report_rows(domain, mapping_by_domain[domain]):
+                f.write(('\n' if first else ',\n') + json.dumps(row))
+                first = False
+        f.write('\n]\n')
+
+def _chunk_domains(mapping_by_domain, chunk_rows):
+    chunk, rows = [], 0
+    for domain in sorted(mapping_by_domain.keys()):
+        chunk.append(domain)
+        rows += len(mapping_by_domain[domain])
+        if rows >= chunk_rows:
+            yield chunk
+            chunk, rows = [], 0
+    if chunk:
+        yield chunk
+
+def _render_pdf(paths):
+    # pdfkit is only imported once a PDF is rendered, which keeps it (and
+    # subprocess) out of the commands that never write reports.
+    import pdfkit
+
+    html_file, pdf_file = paths
+    pdfkit.from_file(html_file, pdf_file)
+    return pdf_file
+
+def _merge_pdfs(pdf_files, pdf_file):
+    from pypdf import PdfWriter
+    writer = PdfWriter()
+    for chunk_file in pdf_files:
+        writer.append(chunk_file)
+    with open(pdf_file, 'wb') as f:
+        writer.write(f)
+
+def render_pdf_chunked(pdf_file, mapping_by_domain, unique_domains, total_a_records, matched_server_ips,
+                       workers=None, chunk_rows=DEFAULT_PDF_CHUNK_ROWS, reverse_index=None, dns_checks=None):
+    # Render the summary and groups of domain sections as separate documents
+    # in parallel, then merge them. Each render is its own wkhtmltopdf
+    # process, so a thread pool is enough to keep all of them busy.
+    tmp_dir = tempfile.mkdtemp(prefix='cloudmesh-pdf-')
+    try:
+        jobs = []
+        summary_file = os.path.join(tmp_dir, 'chunk_0000.html')
+        with open(summary_file, 'w') as f:
+            f.write(HEAD_TEMPLATE)
+            f.write(render_summary(mapping_by_domain, unique_domains, total_a_records, matched_server_ips))
+            if reverse_index is not None:
+                f.write(render_reverse_index(reverse_index))
+            if dns_checks is not None:
+                f.write(render_dns_checks(dns_checks))
+            f.write(FOOT_TEMPLATE)
+        jobs.append((summary_file, os.path.join(tmp_dir, 'chunk_0000.pdf')))
+        for index, domains in enumerate(_chunk_domains(mapping_by_domain, chunk_rows), start=1):
+            html_file = os.path.join(tmp_dir, f'chunk_{index:04d}.html')
+            with open(html_file, 'w') as f:
+                f.write(HEAD_TEMPLATE)
+                for domain in domains:
+                    f.writelines(iter_domain_section(domain, mapping_by_domain[domain]))
+                f.write(FOOT_TEMPLATE)
+            jobs.append((html_file, os.path.join(tmp_dir, f'chunk_{index:04d}.pdf')))
+
+        if importlib.util.find_spec('pypdf') is None:
+            # Without pypdf to merge the chunks, wkhtmltopdf renders all chunk
+            # files into one document in a single process.
+            print("pypdf is not installed: rendering the PDF in a single wkhtmltopdf process "
+                  "instead of in parallel chunks (pip install pypdf).")
+            _render_pdf(([html_file for html_file, _ in jobs], pdf_file))
+            return
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+            pdf_files = list(executor.map(_render_pdf, jobs))
+        _merge_pdfs(pdf_files, pdf_file)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+def save_reports(mapping_by_domain, unique_domains, total_a_records, matched_server_ips, timestamp,
+                 options=None, snapshot=None, reverse_index=None, dns_checks=None):
+    options = options or {}
+    formats = options.get('formats', DEFAULT_FORMATS)
+    output_dir = options.get('output_dir', 'reports')
+    os.makedirs(output_dir, exist_ok=True)
+    paths = {}
+
+    if 'html' in formats:
+        paths['html'] = os.path.join(output_dir, 'mapping.html')
+        with tracing.span('report_html'):
+            write_html_report(
+                paths['html'], mapping_by_domain, unique_domains, total_a_records, matched_server_ips, snapshot,
+                reverse_index, dns_checks
+            )
+    elif snapshot is not None:
+        # Cached sections are only valid against the diff they were last
+        # rendered with.
+        snapshot.sections = {}
+    if 'csv' in formats:
+        paths['csv'] = os.path.join(output_dir, f'mapping_{timestamp}.csv')
+        with tracing.span('report_csv'):
+            write_csv_report(paths['csv'], mapping_by_domain)
+    if 'json' in formats:
+        paths['json'] = os.path.join(output_dir, f'mapping_{timestamp}.json')
+        with tracing.span('report_json'):
+            write_json_report(paths['json'], mapping_by_domain)
+
+    if 'pdf' in formats:
+        pdf_file = os.path.join(output_dir, f'mapping_{timestamp}.pdf')
+        try:
+            with tracing.span('report_pdf'):
+                if options.get('pdf_chunked', True):
+                    render_pdf_chunked(
+                        pdf_file, mapping_by_domain, unique_domains, total_a_records, matched_server_ips,
+                        options.get('pdf_workers'), options.get('pdf_chunk_rows', DEFAULT_PDF_CHUNK_ROWS),
+                        reverse_index, dns_checks
+                    )
+                else:
+                    html_file = paths.get('html') or os.path.join(output_dir, 'mapping.html')
+                    if 'html' not in paths:
+                        write_html_report(
+                            html_file, mapping_by_domain, unique_domains, total_a_records, matched_server_ips,
+                            reverse_index=reverse_index, dns_checks=dns_checks
+                        )
+                        paths['html'] = html_file
+                    _render_pdf((html_file, pdf_file))
+            paths['pdf'] = pdf_file
+            print(f"PDF report generated: {pdf_file}")
+        except Exception as e:
+            print(f"Error generating PDF: {e}")
+            if 'html' in paths:
+                print(f"HTML report still available at {paths['html']}")
+
+    return paths
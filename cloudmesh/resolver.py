@@ -0,0 +1,323 @@
+import asyncio
+import ipaddress
+import json
+import os
+import random
+import socket
+import struct
+import time
+from collections import namedtuple
+
+from cloudmesh.defaults import DEFAULT_DNS_ATTEMPTS as DEFAULT_ATTEMPTS
+from cloudmesh.defaults import DEFAULT_DNS_CACHE_PATH
+from cloudmesh.defaults import DEFAULT_DNS_CONCURRENCY as DEFAULT_CONCURRENCY
+from cloudmesh.defaults import DEFAULT_DNS_TIMEOUT as DEFAULT_TIMEOUT
+
+# A small stub resolver speaking DNS over UDP (and TCP for truncated
+# answers) to one recursive upstream, with asyncio, so tens of thousands of
+# names are resolved over a single socket without a thread per query and
+# without a DNS library.
+DEFAULT_UPSTREAM_PORT = 53
+FALLBACK_UPSTREAM = '1.1.1.1'
+RESOLV_CONF = '/etc/resolv.conf'
+# Negative answers (NXDOMAIN, no data, SERVFAIL) are cached this long;
+# timeouts are not cached.
+NEGATIVE_TTL = 60
+MAX_TTL = 86400
+# Advertised UDP payload size (EDNS0), the size recommended to avoid
+# fragmentation.
+UDP_PAYLOAD = 1232
+
+RECORD_TYPES = {'A': 1, 'AAAA': 28}
+TYPE_CNAME = 5
+RCODES = {0: 'ok', 2: 'servfail', 3: 'nxdomain', 5: 'refused'}
+
+# status is 'ok', 'nodata', 'nxdomain', 'servfail', 'refused', 'timeout' or
+# 'error'; addresses are the final A/AAAA addresses after any CNAMEs, ttl the
+# lowest TTL along the chain.
+Answer = namedtuple('Answer', ['status', 'addresses', 'ttl'])
+
+def default_upstream():
+    # The first nameserver of /etc/resolv.conf, like the system resolver.
+    try:
+        with open(RESOLV_CONF) as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) >= 2 and fields[0] == 'nameserver':
+                    return fields[1]
+    except OSError:
+        pass
+    return FALLBACK_UPSTREAM
+
+def parse_upstream(upstream):
+    # 'host', 'host:port', '[v6]:port' or a bare IPv6 address -> (host, port)
+    upstream = upstream or default_upstream()
+    if upstream.startswith('['):
+        host, _, port = upstream[1:].partition(']')
+        return host, int(port.lstrip(':') or DEFAULT_UPSTREAM_PORT)
+    if upstream.count(':') == 1:
+        host, port = upstream.split(':')
+        return host, int(port)
+    return upstream, DEFAULT_UPSTREAM_PORT
+
+def wire_name(name):
+    # The name as it is sent and as the question comes back: ASCII with IDN
+    # labels in punycode, lower case, without the trailing dot.
+    name = name.rstrip('.')
+    try:
+        encoded = name.encode('ascii')
+    except UnicodeEncodeError:
+        encoded = name.encode('idna')
+    return encoded.decode('ascii').lower()
+
+def encode_name(name):
+    encoded = wire_name(name).encode('ascii')
+    labels = encoded.split(b'.') if encoded else []
+    if any(not label or len(label) > 63 for label in labels):
+        raise ValueError(f"{name!r} is not a valid DNS name")
+    return b''.join(bytes((len(label),)) + label for label in labels) + b'\0'
+
+# The EDNS0 OPT record every query carries.
+OPT_RECORD = b'\0' + struct.pack('!HHIH', 41, UDP_PAYLOAD, 0, 0)
+
+def encode_question(name, record_type):
+    # Everything after the query id, built once per name and type.
+    return (struct.pack('!HHHHH', 0x0100, 1, 0, 0, 1) + encode_name(name)
+            + struct.pack('!HH', RECORD_TYPES[record_type], 1) + OPT_RECORD)
+
+def encode_query(query_id, name, record_type):
+    # Recursion desired, one question, and an EDNS0 OPT record.
+    return struct.pack('!H', query_id) + encode_question(name, record_type)
+
+def _read_name(data, offset):
+    # (lower-case name, offset after it), following compression pointers.
+    labels = []
+    end = None
+    for _ in range(128):
+        length = data[offset]
+        if length & 0xC0 == 0xC0:
+            if end is None:
+                end = offset + 2
+            offset = ((length & 0x3F) << 8) | data[offset + 1]
+        elif length == 0:
+            return '.'.join(labels).lower(), end if end is not None else offset + 1
+        else:
+            labels.append(data[offset + 1:offset + 1 + length].decode('ascii', 'replace'))
+            offset += 1 + length
+    raise ValueError("DNS name compression loop")
+
+def parse_response(data):
+    # (query id, truncated, question (name, type), Answer).
+    query_id, flags, qdcount, ancount = struct.unpack('!HHHH', data[:8])
+    offset = 12
+    question = None
+    for _ in range(qdcount):
+        name, offset = _read_name(data, offset)
+        question = (name, struct.unpack('!H', data[offset:offset + 2])[0])
+        offset += 4
+    truncated = bool(flags & 0x0200)
+    rcode = flags & 0x000F
+    if rcode != 0:
+        return query_id, truncated, question, Answer(RCODES.get(rcode, 'error'), (), NEGATIVE_TTL)
+
+    # Follow the chain from the question name, so records for other names
+    # in the answer section are ignored.
+    records = {}
+    for _ in range(ancount):
+        name, offset = _read_name(data, offset)
+        record_type, _, ttl, length = struct.unpack('!HHIH', data[offset:offset + 10])
+        offset += 10
+        rdata = data[offset:offset + length]
+        if record_type == TYPE_CNAME:
+            value = _read_name(data, offset)[0]
+        elif record_type == 1 and length == 4:
+            value = socket.inet_ntop(socket.AF_INET, rdata)
+        elif record_type == 28 and length == 16:
+            value = socket.inet_ntop(socket.AF_INET6, rdata)
+        else:
+            value = None
+        offset += length
+        if value is not None:
+            records.setdefault(name, []).append((record_type, ttl, value))
+
+    name = question[0] if question else ''
+    ttls = []
+    for _ in range(16):
+        entries = records.get(name, [])
+        cname = next((entry for entry in entries if entry[0] == TYPE_CNAME), None)
+        if cname is None:
+            addresses = tuple(sorted({value for record_type, ttl, value in entries if record_type != TYPE_CNAME}))
+            ttls.extend(ttl for record_type, ttl, _ in entries if record_type != TYPE_CNAME)
+            break
+        ttls.append(cname[1])
+        name = cname[2]
+    else:
+        addresses = ()
+    if not addresses:
+        return query_id, truncated, question, Answer('nodata', (), NEGATIVE_TTL)
+    return query_id, truncated, question, Answer('ok', addresses, min(ttls))
+
+class _Protocol(asyncio.DatagramProtocol):
+    # Hands each datagram to the query waiting for its id.
+    def __init__(self):
+        self.pending = {}
+
+    def datagram_received(self, data, addr):
+        if len(data) >= 12:
+            future = self.pending.get(int.from_bytes(data[:2], 'big'))
+            if future is not None and not future.done():
+                future.set_result(data)
+
+    def error_received(self, exc):
+        pass
+
+def _expire(future):
+    if not future.done():
+        future.set_exception(asyncio.TimeoutError())
+
+class Resolver:
+    # Resolves (name, type) pairs concurrently and caches the answers for
+    # their TTL, in memory and, with a cache_path, across runs.
+    def __init__(self, upstream=None, timeout=DEFAULT_TIMEOUT, attempts=DEFAULT_ATTEMPTS,
+                 concurrency=DEFAULT_CONCURRENCY, cache_path=DEFAULT_DNS_CACHE_PATH):
+        self.host, self.port = parse_upstream(upstream)
+        self.timeout = timeout
+        self.attempts = attempts
+        self.concurrency = concurrency
+        self.cache_path = cache_path
+        self.cache = self._load_cache()
+        self.stats = {'queries': 0, 'cached': 0, 'timeouts': 0, 'tcp': 0}
+
+    def _load_cache(self):
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return {}
+        try:
+            with open(self.cache_path) as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        now = time.time()
+        return {
+            tuple(key.rsplit(' ', 1)): (expires, Answer(status, tuple(addresses), ttl))
+            for key, (expires, status, addresses, ttl) in entries.items() if expires > now
+        }
+
+    def save_cache(self):
+        if not self.cache_path:
+            return
+        directory = os.path.dirname(self.cache_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        now = time.time()
+        entries = {
+            f"{name} {record_type}": [expires, answer.status, list(answer.addresses), answer.ttl]
+            for (name, record_type), (expires, answer) in self.cache.items() if expires > now
+        }
+        tmp_path = f"{self.cache_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(entries, f)
+        os.replace(tmp_path, self.cache_path)
+
+    def resolve(self, queries):
+        # {(name, type): Answer} for an iterable of (name, 'A' or 'AAAA').
+        now = time.time()
+        answers = {}
+        missing = []
+        for key in dict.fromkeys((name.rstrip('.').lower(), record_type) for name, record_type in queries):
+            cached = self.cache.get(key)
+            if cached is not None and cached[0] > now:
+                answers[key] = cached[1]
+                self.stats['cached'] += 1
+            else:
+                missing.append(key)
+        if missing:
+            answers.update(asyncio.run(self._resolve_all(missing)))
+            now = time.time()
+            for key in missing:
+                answer = answers[key]
+                if answer.status not in ('timeout', 'error'):
+                    self.cache[key] = (now + min(answer.ttl, MAX_TTL), answer)
+            self.save_cache()
+        return answers
+
+    async def _resolve_all(self, keys):
+        loop = asyncio.get_running_loop()
+        family = socket.AF_INET6 if ':' in self.host else socket.AF_INET
+        transport, protocol = await loop.create_datagram_endpoint(
+            _Protocol, remote_addr=(self.host, self.port), family=family
+        )
+        # `concurrency` workers share one iterator of keys, so there are as
+        # many coroutines as queries in flight, not one per name.
+        answers = {}
+        remaining = iter(keys)
+
+        async def worker():
+            for key in remaining:
+                answers[key] = await self._query(transport, protocol, *key)
+
+        try:
+            await asyncio.gather(*(worker() for _ in range(min(self.concurrency, len(keys)))))
+        finally:
+            transport.close()
+        return answers
+
+    async def _query(self, transport, protocol, name, record_type):
+        try:
+            query = encode_question(name, record_type)
+        except (ValueError, UnicodeError):
+            return Answer('error', (), 0)
+        # Answers come back for the punycode name, not an IDN's unicode one.
+        expected = (wire_name(name), RECORD_TYPES[record_type])
+        loop = asyncio.get_running_loop()
+        for _ in range(self.attempts):
+            query_id = random.getrandbits(16)
+            while query_id in protocol.pending:
+                query_id = random.getrandbits(16)
+            # A timer per query rather than wait_for(), which wraps every
+            # query in a task of its own.
+            future = loop.create_future()
+            timer = loop.call_later(self.timeout, _expire, future)
+            protocol.pending[query_id] = future
+            self.stats['queries'] += 1
+            try:
+                transport.sendto(struct.pack('!H', query_id) + query)
+                data = await future
+            except asyncio.TimeoutError:
+                self.stats['timeouts'] += 1
+                continue
+            finally:
+                timer.cancel()
+                del protocol.pending[query_id]
+            try:
+                _, truncated, question, answer = parse_response(data)
+            except (ValueError, IndexError, struct.error):
+                continue
+            # A late answer to an earlier query that had this id.
+            if question != expected:
+                continue
+            if truncated:
+                answer = await self._query_tcp(name, record_type)
+            return answer
+        return Answer('timeout', (), 0)
+
+    async def _query_tcp(self, name, record_type):
+        self.stats['tcp'] += 1
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), self.timeout)
+            try:
+                query = encode_query(random.getrandbits(16), name, record_type)
+                writer.write(struct.pack('!H', len(query)) + query)
+                length = struct.unpack('!H', await asyncio.wait_for(reader.readexactly(2), self.timeout))[0]
+                data = await asyncio.wait_for(reader.readexactly(length), self.timeout)
+            finally:
+                writer.close()
+            return parse_response(data)[3]
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError, struct.error):
+            return Answer('timeout', (), 0)
+
+def normalize_address(address):
+    # Cloudflare keeps AAAA contents as entered; answers come compressed.
+    try:
+        return ipaddress.ip_address(address).compressed
+    except ValueError:
+        return address
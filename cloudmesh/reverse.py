@@ -0,0 +1,63 @@
+from collections import namedtuple
+
+# The mapping seen from the resources' side, built in one pass over the
+# mapping rows and one over the resources (sets and dicts, no nested scans;
+# the report sorts what it shows):
+#   unreferenced        resources no record points at
+#   stopped_targets     mapping rows whose resource is not running (stopped
+#                       servers, disabled load balancers)
+#   unassigned_targets  mapping rows whose resource is an unassigned IP
+#   shared_ips          {ip: set of zones} of addresses used by several zones
+#   unused              {project: (resources, monthly cost)} of unreferenced
+#                       resources, with every project present
+#   unassigned          {project: (addresses, monthly cost)} of unassigned
+#                       IPs, referenced or not, with every project present
+#   totals              {project: resources}
+ReverseIndex = namedtuple('ReverseIndex', [
+    'unreferenced', 'stopped_targets', 'unassigned_targets', 'shared_ips', 'unused', 'unassigned', 'totals'
+])
+# Status of floating and primary IPs not routed to a server. They are billed
+# but have nothing to stop or start, so they are not stopped targets.
+UNASSIGNED = 'unassigned'
+
+def build_reverse_index(mapping_rows, resources):
+    referenced = set()
+    zones_by_ip = {}
+    stopped_targets = []
+    unassigned_targets = []
+    for row in mapping_rows:
+        zones_by_ip.setdefault(row['ip'], set()).add(row.domain)
+        if not row.matched:
+            continue
+        referenced.add((row['project'], row['server_name']))
+        if row['status'] == UNASSIGNED:
+            unassigned_targets.append(row)
+        elif row['status'] != 'running':
+            stopped_targets.append(row)
+
+    unreferenced = []
+    unused = {}
+    unassigned = {}
+    totals = {}
+    for resource in resources:
+        project = resource['project']
+        totals[project] = totals.get(project, 0) + 1
+        count, cost = unused.get(project, (0, 0.0))
+        if (project, resource['server_name']) not in referenced:
+            unreferenced.append(resource)
+            count, cost = count + 1, cost + resource['price_monthly']
+        unused[project] = (count, cost)
+        count, cost = unassigned.get(project, (0, 0.0))
+        if resource['status'] == UNASSIGNED:
+            count, cost = count + 1, cost + resource['price_monthly']
+        unassigned[project] = (count, cost)
+
+    return ReverseIndex(
+        unreferenced,
+        stopped_targets,
+        unassigned_targets,
+        {ip: zones for ip, zones in zones_by_ip.items() if len(zones) > 1},
+        {project: (count, round(cost, 2)) for project, (count, cost) in unused.items()},
+        {project: (count, round(cost, 2)) for project, (count, cost) in unassigned.items()},
+        totals,
+    )
@@ -0,0 +1,38 @@
+import threading
+import time
+
+class IntervalScheduler:
+    # Runs each task on its own interval in the calling thread until stop()
+    # is called. A failing task is reported and retried on its next interval.
+    def __init__(self):
+        self.tasks = []
+        self.stop_event = threading.Event()
+
+    def add(self, name, interval, func, run_immediately=True, retry_interval=None):
+        # retry_interval, when set, replaces the interval after a failure.
+        next_run = time.monotonic() if run_immediately else time.monotonic() + interval
+        self.tasks.append({
+            'name': name, 'interval': interval, 'func': func, 'next_run': next_run,
+            'retry_interval': retry_interval or interval,
+        })
+
+    def run(self):
+        while not self.stop_event.is_set():
+            for task in self.tasks:
+                if self.stop_event.is_set():
+                    break
+                if task['next_run'] > time.monotonic():
+                    continue
+                started = time.monotonic()
+                try:
+                    task['func']()
+                except Exception as e:
+                    print(f"Error in scheduled task {task['name']}: {e}")
+                    task['next_run'] = started + task['retry_interval']
+                else:
+                    task['next_run'] = started + task['interval']
+            wait = min(task['next_run'] for task in self.tasks) - time.monotonic()
+            self.stop_event.wait(max(wait, 0))
+
+    def stop(self):
+        self.stop_event.set()
@@ -0,0 +1,123 @@
+import glob
+import gzip
+import json
+import os
+import zlib
+from collections import namedtuple
+from datetime import datetime
+
+# Units of work spread over shards. With 'account', every Cloudflare account
+# is fetched by exactly one shard; with 'zone', every shard lists the zones
+# of all accounts and fetches the records of its own zones, which spreads
+# a few very large accounts. Hetzner projects are always spread by project.
+SHARD_KEYS = ('account', 'zone')
+DEFAULT_SHARD_DIR = 'shards'
+SHARD_FORMAT_VERSION = 1
+
+ShardSpec = namedtuple('ShardSpec', ['index', 'count', 'by'])
+
+def parse_shard(value, by='account'):
+    # "2/8" -> ShardSpec(1, 8, by): shards are numbered from 1 on the command
+    # line and from 0 internally.
+    try:
+        number, count = (int(part) for part in value.split('/'))
+    except ValueError:
+        raise ValueError(f"Invalid shard {value!r}, expected N/COUNT such as 1/4") from None
+    if not 1 <= number <= count:
+        raise ValueError(f"Invalid shard {value!r}, N must be between 1 and {count}")
+    if by not in SHARD_KEYS:
+        raise ValueError(f"Unknown shard key {by!r}, expected one of {', '.join(SHARD_KEYS)}")
+    return ShardSpec(number - 1, count, by)
+
+def shard_of(name, count):
+    # Stable across processes and hosts, unlike hash().
+    return zlib.crc32(name.encode()) % count
+
+def owns(spec, name):
+    return shard_of(name, spec.count) == spec.index
+
+def shard_path(spec, directory=DEFAULT_SHARD_DIR):
+    return os.path.join(directory, f"shard-{spec.index + 1}-of-{spec.count}.json.gz")
+
+def write_shard(path, spec, hetzner_results, zone_records, network_resources, server_usage=None):
+    # One shard's raw inventory. Matching, reports and metrics need the whole
+    # estate (a record of one account can point at a server of any project),
+    # so shards only collect and the merge does the rest.
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    document = {
+        'version': SHARD_FORMAT_VERSION,
+        'shard': spec._asdict(),
+        'created': datetime.utcnow().isoformat() + 'Z',
+        'hetzner_results': [[project['project_name'], server] for project, server in hetzner_results],
+        'zone_records': zone_records,
+        'network_resources': [
+            [project['project_name'], kind, resource] for project, kind, resource in network_resources
+        ],
+        'server_usage': [
+            [project_name, server_id, usage] for (project_name, server_id), usage in (server_usage or {}).items()
+        ],
+    }
+    tmp_path = f"{path}.tmp"
+    # Level 1 compresses repetitive JSON nearly as well as the default at a
+    # fraction of the time.
+    with gzip.open(tmp_path, 'wt', compresslevel=1) as f:
+        json.dump(document, f, separators=(',', ':'))
+    os.replace(tmp_path, path)
+    return path
+
+def read_shard(path):
+    with gzip.open(path, 'rt') as f:
+        document = json.load(f)
+    if document.get('version') != SHARD_FORMAT_VERSION:
+        raise ValueError(f"{path}: unsupported shard format {document.get('version')!r}")
+    return document
+
+def shard_files(paths):
+    # Shard files given directly or as directories holding them.
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, 'shard-*.json.gz'))))
+        else:
+            files.append(path)
+    return files
+
+def merge_shards(paths):
+    # Returns (hetzner_results, zone_records, network_resources, server_usage)
+    # of the whole estate, in the shapes the collector returns. Shards of one
+    # sharding must all be present; resources seen by several shards (a zone
+    # shared between accounts, say) are kept once.
+    files = shard_files(paths)
+    if not files:
+        raise RuntimeError(f"No shard files found in {', '.join(paths)}")
+    documents = [read_shard(path) for path in files]
+
+    layouts = {(document['shard']['count'], document['shard']['by']) for document in documents}
+    if len(layouts) > 1:
+        raise RuntimeError(f"Shard files come from different shardings: {sorted(layouts)}")
+    count, by = layouts.pop()
+    indexes = sorted(document['shard']['index'] for document in documents)
+    if indexes != list(range(count)):
+        missing = sorted(set(range(count)) - set(indexes))
+        duplicates = sorted({index for index in indexes if indexes.count(index) > 1})
+        problems = [f"missing shard {index + 1}" for index in missing]
+        problems += [f"shard {index + 1} given more than once" for index in duplicates]
+        raise RuntimeError(f"Cannot merge the {count}-way sharding by {by}: {', '.join(problems)}")
+
+    servers = {}
+    zones = {}
+    network_resources = {}
+    server_usage = {}
+    for document in documents:
+        for project_name, server in document['hetzner_results']:
+            servers[(project_name, server.get('id'))] = ({'project_name': project_name}, server)
+        for zone, records in document['zone_records']:
+            zones[zone['id']] = (zone, records)
+        for project_name, kind, resource in document['network_resources']:
+            key = (project_name, kind, resource.get('id'))
+            network_resources[key] = ({'project_name': project_name}, kind, resource)
+        for project_name, server_id, usage in document['server_usage']:
+            server_usage[(project_name, server_id)] = usage
+    return list(servers.values()), list(zones.values()), list(network_resources.values()), server_usage
@@ -0,0 +1,205 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from cloudmesh import client, tracing
+from cloudmesh.defaults import DEFAULT_SLACK_ATTEMPTS as DEFAULT_ATTEMPTS
+from cloudmesh.defaults import DEFAULT_SLACK_WORKERS as DEFAULT_WORKERS
+
+SLACK_API_URL = 'https://slack.com/api'
+CONTENT_TYPES = {
+    'pdf': 'application/pdf',
+    'html': 'text/html',
+    'csv': 'text/csv',
+    'json': 'application/json',
+}
+# Slack cuts chat.postMessage text at 40,000 characters and collapses long
+# messages; unmatched records are posted as thread replies of at most this
+# many characters each.
+MESSAGE_LIMIT = 3500
+# Errors no retry can fix.
+FATAL_ERRORS = {
+    'invalid_auth', 'not_authed', 'account_inactive', 'token_revoked', 'token_expired', 'missing_scope',
+    'channel_not_found', 'not_in_channel', 'is_archived', 'invalid_arguments', 'file_not_found',
+}
+
+class SlackError(RuntimeError):
+    def __init__(self, method, error):
+        self.method = method
+        self.error = error
+        super().__init__(f"Error in {method}: {error}")
+
+def _call(token, method, **kwargs):
+    # One Web API call; returns the response body or raises SlackError.
+    headers = {'Authorization': f'Bearer {token}'}
+    response = client.request('POST', f'{SLACK_API_URL}/{method}', headers=headers, **kwargs)
+    try:
+        body = response.json()
+    except ValueError:
+        raise SlackError(method, f"HTTP {response.status_code}, unable to decode JSON response") from None
+    if not body.get('ok'):
+        raise SlackError(method, body.get('error', 'unknown_error'))
+    return body
+
+def send_message_to_slack(token, channel_id, text, thread_ts=None):
+    data = {
+        "channel": channel_id,
+        "text": text
+    }
+    if thread_ts is not None:
+        data["thread_ts"] = thread_ts
+    return _call(token, 'chat.postMessage', json=data)
+
+class FileUpload:
+    # One file to one channel. The upload URL and file_id returned by
+    # files.getUploadURLExternal are kept across attempts: a retry re-sends
+    # the bytes to the same file, or only completes it when the bytes are
+    # already there, so a failed attempt never leaves a second copy of the
+    # report in the channel.
+    def __init__(self, token, channel_id, file_path, initial_comment):
+        self.token = token
+        self.channel_id = channel_id
+        self.file_path = file_path
+        self.initial_comment = initial_comment
+        self.filename = os.path.basename(file_path)
+        self.upload_url = None
+        self.file_id = None
+        self.uploaded = False
+        self.completed = False
+
+    def __str__(self):
+        return f"{self.filename} to {self.channel_id}"
+
+    def send(self):
+        if self.file_id is None:
+            data = {
+                "filename": self.filename,
+                "length": os.path.getsize(self.file_path)
+            }
+            body = _call(self.token, 'files.getUploadURLExternal', data=data)
+            self.upload_url, self.file_id = body['upload_url'], body['file_id']
+
+        if not self.uploaded:
+            # The file object is the request body, so the file is streamed
+            # from disk instead of being read into a multipart body.
+            extension = os.path.splitext(self.filename)[1].lstrip('.').lower()
+            headers = {'Content-Type': CONTENT_TYPES.get(extension, 'application/octet-stream')}
+            with open(self.file_path, 'rb') as file_content:
+                response = client.request('POST', self.upload_url, headers=headers, data=file_content)
+            if response.status_code != 200:
+                raise SlackError('file upload', f"HTTP {response.status_code}: {response.text[:200]}")
+            self.uploaded = True
+
+        if not self.completed:
+            data = {
+                "files": [{"id": self.file_id, "title": self.filename}],
+                "channel_id": self.channel_id,
+                "initial_comment": self.initial_comment
+            }
+            _call(self.token, 'files.completeUploadExternal', json=data)
+            self.completed = True
+
+class ThreadedMessage:
+    # A message and its replies in a thread. A retry carries on with the
+    # first reply not posted yet, under the same parent message.
+    def __init__(self, token, channel_id, text, replies):
+        self.token = token
+        self.channel_id = channel_id
+        self.text = text
+        self.replies = list(replies)
+        self.thread_ts = None
+        self.posted = 0
+
+    def __str__(self):
+        return f"message and {len(self.replies)} replies to {self.channel_id}"
+
+    def send(self):
+        if self.thread_ts is None:
+            self.thread_ts = send_message_to_slack(self.token, self.channel_id, self.text)['ts']
+        while self.posted < len(self.replies):
+            send_message_to_slack(self.token, self.channel_id, self.replies[self.posted], self.thread_ts)
+            self.posted += 1
+
+def upload_to_slack(file_path, token, channel_id, initial_comment, attempts=DEFAULT_ATTEMPTS):
+    return _send(FileUpload(token, channel_id, file_path, initial_comment), attempts)
+
+def _send(task, attempts):
+    # Sends task, retrying up to `attempts` times in all. The API client
+    # already retries rate limits and unavailable servers per request; this
+    # resumes the steps left when a request still fails. Returns None or the
+    # last error.
+    for attempt in range(attempts):
+        try:
+            with tracing.span('slack_send', task=str(task), attempt=attempt):
+                task.send()
+            return None
+        except SlackError as e:
+            error = e
+            if e.error in FATAL_ERRORS:
+                break
+        except (requests.RequestException, OSError) as e:
+            error = e
+        if attempt < attempts - 1:
+            time.sleep(client.backoff_delay(attempt + 1))
+    return error
+
+def chunk_lines(lines, limit=MESSAGE_LIMIT):
+    # Joins lines into messages of at most `limit` characters.
+    chunk, size = [], 0
+    for line in lines:
+        if chunk and size + len(line) + 1 > limit:
+            yield '\n'.join(chunk)
+            chunk, size = [], 0
+        chunk.append(line[:limit])
+        size += len(line[:limit]) + 1
+    if chunk:
+        yield '\n'.join(chunk)
+
+def unmatched_lines(mapping_by_domain):
+    # One line per unmatched IP with the records pointing at it.
+    names_by_ip = {}
+    for domain, rows in mapping_by_domain.items():
+        for row in rows:
+            if row['server_name'] == 'No match':
+                name = domain if row['subdomain'] == '@' else f"{row['subdomain']}.{domain}"
+                names_by_ip.setdefault(row['ip'], []).append(f"{name} ({row['record_type']})")
+    return [f"`{ip}`  {', '.join(sorted(names))}" for ip, names in sorted(names_by_ip.items())]
+
+class Delivery:
+    # Tasks running in the background; wait() reports how they went.
+    def __init__(self, futures):
+        self.futures = futures
+
+    def wait(self):
+        # Returns the number of failed tasks.
+        failed = 0
+        for task, future in self.futures:
+            try:
+                error = future.result()
+            except Exception as e:
+                error = e
+            if error is None:
+                print(f"Slack: sent {task}.")
+            else:
+                failed += 1
+                print(f"Slack: failed to send {task}: {error}")
+        return failed
+
+def deliver(token, channel_ids, file_paths, initial_comment, summary, unmatched=(), workers=DEFAULT_WORKERS,
+            attempts=DEFAULT_ATTEMPTS):
+    # Starts sending every file and the summary (with the unmatched lines as
+    # thread replies) to every channel, `workers` at a time, and returns
+    # without waiting. Each task retries on its own; the calls still share
+    # the client's Slack rate limit.
+    replies = list(chunk_lines(unmatched))
+    tasks = []
+    for channel_id in channel_ids:
+        tasks.extend(FileUpload(token, channel_id, path, initial_comment) for path in file_paths)
+        if summary:
+            tasks.append(ThreadedMessage(token, channel_id, summary, replies))
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='slack')
+    futures = [(task, executor.submit(tracing.wrap_context(_send), task, attempts)) for task in tasks]
+    executor.shutdown(wait=False)
+    return Delivery(futures)
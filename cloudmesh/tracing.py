@@ -0,0 +1,144 @@
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Spans with these names are also observed in the stage duration histogram;
+# everything else (e.g. single HTTP requests) only shows up in traces.
+STAGES = (
+    'run', 'fetch_servers', 'fetch_network_resources', 'fetch_server_metrics', 'fetch_zones', 'fetch_dns',
+    'fetch_pricing', 'write_shard', 'merge_shards', 'health_checks', 'matching', 'dns_check',
+    'report_html', 'report_csv', 'report_json', 'report_pdf', 'record_history', 'push',
+)
+# Stage durations range from milliseconds (matching a small inventory) to
+# minutes (PDF rendering of a large one).
+STAGE_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+TRACE_FORMATS = ('json', 'otlp')
+SERVICE_NAME = 'cloudmesh'
+
+_current_span = contextvars.ContextVar('cloudmesh_current_span', default=None)
+
+class Span:
+    def __init__(self, name, trace_id, parent_id, attributes):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.error = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def as_dict(self):
+        return {
+            'name': self.name,
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'start': self.start_ns / 1e9,
+            'duration': (self.end_ns - self.start_ns) / 1e9,
+            'attributes': self.attributes,
+            'error': self.error,
+        }
+
+    def as_otlp(self):
+        span = {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': 1,
+            'startTimeUnixNano': str(self.start_ns),
+            'endTimeUnixNano': str(self.end_ns),
+            'attributes': [_otlp_attribute(key, value) for key, value in self.attributes.items()],
+            'status': {'code': 2, 'message': self.error} if self.error else {'code': 1},
+        }
+        if self.parent_id:
+            span['parentSpanId'] = self.parent_id
+        return span
+
+def _otlp_attribute(key, value):
+    if isinstance(value, bool):
+        return {'key': key, 'value': {'boolValue': value}}
+    if isinstance(value, int):
+        return {'key': key, 'value': {'intValue': str(value)}}
+    if isinstance(value, float):
+        return {'key': key, 'value': {'doubleValue': value}}
+    return {'key': key, 'value': {'stringValue': str(value)}}
+
+class Tracer:
+    # Times named spans. Stage spans feed the stage duration histogram when
+    # metrics are set; when a trace file is set, finished spans are buffered
+    # and appended to it on flush(), either one JSON object per span ('json')
+    # or one OTLP/JSON export request per flush ('otlp', the format of the
+    # OpenTelemetry collector's file exporter).
+    def __init__(self, metrics=None, path=None, trace_format='json'):
+        if trace_format not in TRACE_FORMATS:
+            raise ValueError(f"Unknown trace format {trace_format!r}, expected one of {', '.join(TRACE_FORMATS)}")
+        self.metrics = metrics
+        self.path = path
+        self.trace_format = trace_format
+        self.finished = []
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name, **attributes):
+        parent = _current_span.get()
+        span = Span(name, parent.trace_id if parent else os.urandom(16).hex(), parent and parent.span_id, attributes)
+        token = _current_span.set(span)
+        started = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            duration = time.perf_counter() - started
+            span.end_ns = span.start_ns + int(duration * 1e9)
+            _current_span.reset(token)
+            if self.metrics is not None and name in STAGES:
+                self.metrics['stage_duration'].labels(name).observe(duration)
+            if self.path:
+                with self.lock:
+                    self.finished.append(span)
+
+    def flush(self):
+        with self.lock:
+            spans, self.finished = self.finished, []
+        if not spans or not self.path:
+            return 0
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, 'a') as f:
+            if self.trace_format == 'otlp':
+                f.write(json.dumps({'resourceSpans': [{
+                    'resource': {'attributes': [_otlp_attribute('service.name', SERVICE_NAME)]},
+                    'scopeSpans': [{'scope': {'name': SERVICE_NAME}, 'spans': [span.as_otlp() for span in spans]}],
+                }]}) + '\n')
+            else:
+                for span in spans:
+                    f.write(json.dumps(span.as_dict()) + '\n')
+        return len(spans)
+
+_tracer = Tracer()
+
+def get_tracer():
+    return _tracer
+
+def set_tracer(tracer):
+    global _tracer
+    _tracer = tracer
+
+def span(name, **attributes):
+    return _tracer.span(name, **attributes)
+
+def wrap_context(func):
+    # Run func in another thread under the caller's span. Every call gets its
+    # own copy, a context can only be entered by one thread at a time.
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.copy().run(func, *args, **kwargs)
@@ -0,0 +1,61 @@
+import math
+from datetime import datetime, timedelta, timezone
+
+from cloudmesh import api
+from cloudmesh.cache import token_fingerprint
+from cloudmesh.defaults import DEFAULT_METRICS_WINDOW
+
+# Data points requested per series; the step is the window divided by this.
+METRICS_POINTS = 60
+METRIC_TYPES = ('cpu', 'disk', 'network')
+# Hetzner counts traffic in decimal units (the included traffic is 20 TB,
+# not 20 TiB).
+BYTES_PER_MB = 1000 * 1000
+
+def traffic_mb(num_bytes):
+    return round(num_bytes / BYTES_PER_MB) if num_bytes else 0
+
+def _values(series):
+    # [[timestamp, "0.52"], ...] -> [0.52, ...] without the gaps Hetzner
+    # reports as NaN.
+    values = []
+    for _, value in series.get('values', []):
+        value = float(value)
+        if not math.isnan(value):
+            values.append(value)
+    return values
+
+def aggregate(time_series):
+    # Hetzner /metrics time series -> one flat dict per server:
+    #   cpu_avg, cpu_max (percent of one core times the core count)
+    #   disk_iops_read/_write, disk_bandwidth_read/_write (per second)
+    #   network_bandwidth_in/_out, network_pps_in/_out (per second)
+    # Per-device series (disk.0.iops.read, network.1.bandwidth.in...) are
+    # averaged over the window and summed across devices.
+    usage = {}
+    for name, series in time_series.items():
+        values = _values(series)
+        if not values:
+            continue
+        parts = name.split('.')
+        if parts[0] == 'cpu':
+            usage['cpu_avg'] = sum(values) / len(values)
+            usage['cpu_max'] = max(values)
+        elif len(parts) == 4:
+            # kind.device.metric.direction
+            key = f"{parts[0]}_{parts[2]}_{parts[3]}"
+            usage[key] = usage.get(key, 0.0) + sum(values) / len(values)
+    return usage
+
+def server_usage(token, server_id, window=DEFAULT_METRICS_WINDOW):
+    # Aggregated utilisation of a server over the last `window` seconds. The
+    # aggregate, not the raw series, is what the inventory cache keeps.
+    def fetch():
+        end = datetime.now(timezone.utc).replace(microsecond=0)
+        start = end - timedelta(seconds=window)
+        metrics = api.fetch_hetzner_server_metrics(
+            token, server_id, METRIC_TYPES, start.isoformat(), end.isoformat(), max(1, window // METRICS_POINTS)
+        )
+        return aggregate(metrics.get('time_series', {}))
+
+    return api.cached_fetch('server_metrics', f"server_metrics:{token_fingerprint(token)}:{server_id}:{window}", fetch)
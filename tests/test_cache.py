@@ -0,0 +1,109 @@
+import pytest
+import requests
+
+from cloudmesh import api, cache
+from cloudmesh.cache import InventoryCache
+
+URL = 'https://api.cloudflare.com/client/v4/zones/zone1/dns_records'
+KEY = 'dns_records:zone1'
+
+class Fetcher:
+    # Stands in for fetch_all_conditional(): answers with the queued
+    # (results, validators) or raises the queued exception, and records the
+    # validators it was called with.
+    def __init__(self):
+        self.outcomes = []
+        self.calls = []
+
+    def __call__(self, url, headers, etag=None, last_modified=None, **kwargs):
+        self.calls.append({'etag': etag, 'last_modified': last_modified})
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(cache.time, 'time', lambda: now[0])
+    return now
+
+@pytest.fixture
+def fetcher(monkeypatch):
+    fetcher = Fetcher()
+    monkeypatch.setattr(api, 'fetch_all_conditional', fetcher)
+    return fetcher
+
+@pytest.fixture
+def inventory_cache(tmp_path, monkeypatch):
+    inventory_cache = InventoryCache(str(tmp_path / 'cache.sqlite'), ttls={'dns_records': 300}, max_staleness=3600)
+    monkeypatch.setattr(api, '_cache', inventory_cache)
+    yield inventory_cache
+    inventory_cache.close()
+
+def _fetch(validator=None):
+    return api.cached_fetch_all('dns_records', KEY, URL, {}, validator=validator)
+
+def _prime(fetcher, validator=None):
+    fetcher.outcomes.append((['a'], {'etag': '"v1"', 'last_modified': None}))
+    assert _fetch(validator) == ['a']
+
+def test_entries_are_reused_until_their_ttl_is_up(clock, fetcher, inventory_cache):
+    _prime(fetcher)
+    clock[0] += 299
+    assert _fetch() == ['a']
+    assert len(fetcher.calls) == 1
+    assert inventory_cache.stats['hits'] == 1
+
+def test_expired_entries_are_revalidated(clock, fetcher, inventory_cache):
+    _prime(fetcher)
+    clock[0] += 300
+    fetcher.outcomes.append((None, {'etag': '"v1"', 'last_modified': None}))
+    assert _fetch() == ['a']
+    assert fetcher.calls[-1]['etag'] == '"v1"'
+    assert inventory_cache.stats['not_modified'] == 1
+    # A 304 renews the entry for another TTL.
+    clock[0] += 299
+    assert _fetch() == ['a']
+    assert len(fetcher.calls) == 2
+
+def test_a_new_validator_refetches_before_the_ttl(clock, fetcher, inventory_cache):
+    _prime(fetcher, validator='2026-10-01T00:00:00Z')
+    fetcher.outcomes.append((['b'], {'etag': None, 'last_modified': None}))
+    assert _fetch('2026-10-02T00:00:00Z') == ['b']
+    assert len(fetcher.calls) == 2
+
+def test_an_unchanged_validator_does_not_extend_the_ttl(clock, fetcher, inventory_cache):
+    _prime(fetcher, validator='2026-10-01T00:00:00Z')
+    clock[0] += 300
+    fetcher.outcomes.append((['b'], {'etag': None, 'last_modified': None}))
+    assert _fetch('2026-10-01T00:00:00Z') == ['b']
+
+def test_failed_refresh_serves_entries_within_max_staleness(clock, fetcher, inventory_cache):
+    _prime(fetcher)
+    clock[0] += 3599
+    fetcher.outcomes.append(requests.ConnectionError("unreachable"))
+    assert _fetch() == ['a']
+    assert inventory_cache.stats['stale'] == 1
+
+def test_failed_refresh_raises_beyond_max_staleness(clock, fetcher, inventory_cache):
+    _prime(fetcher)
+    clock[0] += 3600
+    fetcher.outcomes.append(requests.HTTPError("503 Server Error"))
+    with pytest.raises(requests.HTTPError):
+        _fetch()
+
+def test_zero_max_staleness_disables_the_fallback(clock, fetcher, inventory_cache):
+    inventory_cache.max_staleness = 0
+    _prime(fetcher)
+    clock[0] += 300
+    fetcher.outcomes.append(requests.ConnectionError("unreachable"))
+    with pytest.raises(requests.ConnectionError):
+        _fetch()
+
+def test_max_staleness_does_not_bound_cache_hits(clock, fetcher, inventory_cache):
+    inventory_cache.ttls['dns_records'] = 7200
+    _prime(fetcher)
+    clock[0] += 3601
+    assert _fetch() == ['a']
+    assert len(fetcher.calls) == 1
@@ -0,0 +1,159 @@
+import pytest
+import requests
+
+from cloudmesh import client
+from cloudmesh.client import ApiClient, CircuitBreaker, CircuitOpenError, TokenBucket, backoff_delay
+
+HETZNER_URL = 'https://api.hetzner.cloud/v1/servers'
+
+class Clock:
+    # Stands in for time.monotonic() and time.sleep(); sleeping advances it.
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(client.time, 'monotonic', clock.monotonic)
+    monkeypatch.setattr(client.time, 'sleep', clock.sleep)
+    return clock
+
+def _response(status, headers=None):
+    response = requests.Response()
+    response.status_code = status
+    response.headers.update(headers or {})
+    response._content = b'{}'
+    return response
+
+class FakeSession:
+    # Answers with the given responses in turn; an exception is raised.
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = []
+
+    def request(self, method, url, **kwargs):
+        self.calls.append(method)
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+def test_429_waits_for_retry_after_on_the_shared_bucket(clock):
+    session = FakeSession(_response(429, {'Retry-After': '7'}), _response(200))
+    api = ApiClient()
+    response = api.request('GET', HETZNER_URL, session=session, headers={'Authorization': 'Bearer a'})
+    assert response.status_code == 200
+    assert session.calls == ['GET', 'GET']
+    assert sum(clock.sleeps) == pytest.approx(7)
+    # Other callers with the same token are held back as well.
+    assert api.bucket('hetzner', 'Bearer a').blocked_until == pytest.approx(clock.now)
+
+def test_429_without_a_bucket_sleeps_retry_after(clock):
+    session = FakeSession(_response(429, {'Retry-After': '3'}), _response(200))
+    response = ApiClient().request('GET', 'https://example.com/', session=session)
+    assert response.status_code == 200
+    assert clock.sleeps == [3.0]
+
+def test_retry_after_beyond_the_maximum_is_not_waited_for(clock):
+    session = FakeSession(_response(429, {'Retry-After': str(client.MAX_RETRY_AFTER + 1)}), _response(200))
+    response = ApiClient().request('GET', 'https://example.com/', session=session)
+    assert response.status_code == 429
+    assert session.calls == ['GET']
+    assert clock.sleeps == []
+
+def test_backoff_delay_is_capped(monkeypatch):
+    monkeypatch.setattr(client.random, 'uniform', lambda low, high: high)
+    assert backoff_delay(0) == client.BACKOFF_BASE
+    assert backoff_delay(3) == client.BACKOFF_BASE * 8
+    assert backoff_delay(30) == client.BACKOFF_MAX
+
+def test_server_errors_are_retried_up_to_max_retries(clock, monkeypatch):
+    monkeypatch.setattr(client.random, 'uniform', lambda low, high: high)
+    session = FakeSession(*(_response(503) for _ in range(4)))
+    response = ApiClient(max_retries=3).request('GET', 'https://example.com/', session=session)
+    assert response.status_code == 503
+    assert len(session.calls) == 4
+    assert clock.sleeps == [0.5, 1.0, 2.0]
+
+def test_post_is_not_retried_on_statuses_it_may_have_acted_on(clock):
+    for status in (500, 502, 504):
+        assert status not in client.UNSAFE_RETRY_STATUSES
+        session = FakeSession(_response(status), _response(200))
+        response = ApiClient().request('POST', 'https://example.com/', session=session)
+        assert response.status_code == status
+        assert session.calls == ['POST']
+
+def test_post_is_retried_when_the_server_did_not_act(clock):
+    session = FakeSession(_response(503), _response(200))
+    response = ApiClient().request('POST', 'https://example.com/', session=session)
+    assert response.status_code == 200
+    assert session.calls == ['POST', 'POST']
+
+def test_breaker_opens_half_opens_and_closes(clock):
+    breaker = CircuitBreaker(threshold=2, reset_timeout=30)
+    assert breaker.allow()
+    assert not breaker.record_failure()
+    assert breaker.record_failure()
+    assert not breaker.allow()
+
+    clock.now += 30
+    # Half-open: one trial at a time.
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.allow()
+    assert breaker.allow()
+
+def test_failed_trial_opens_the_breaker_again(clock):
+    breaker = CircuitBreaker(threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock.now += 30
+    assert breaker.allow()
+    assert not breaker.record_failure()
+    assert not breaker.allow()
+    clock.now += 30
+    assert breaker.allow()
+
+def test_connection_errors_open_the_circuit(clock):
+    session = FakeSession(*(requests.ConnectionError("refused") for _ in range(3)))
+    api = ApiClient(max_retries=2, breaker_threshold=3)
+    with pytest.raises(requests.ConnectionError):
+        api.request('GET', 'https://example.com/', session=session)
+    with pytest.raises(CircuitOpenError):
+        api.request('GET', 'https://example.com/', session=FakeSession(_response(200)))
+
+def test_trial_is_released_when_the_request_raises(clock):
+    api = ApiClient(max_retries=0, breaker_threshold=1, breaker_reset=30)
+    with pytest.raises(requests.ConnectionError):
+        api.request('GET', 'https://example.com/', session=FakeSession(requests.ConnectionError("refused")))
+    clock.now += 30
+    with pytest.raises(requests.exceptions.InvalidJSONError):
+        api.request('GET', 'https://example.com/', session=FakeSession(requests.exceptions.InvalidJSONError()))
+    # Neither a success nor a failure was recorded; the next request is the
+    # trial instead of the circuit staying shut.
+    response = api.request('GET', 'https://example.com/', session=FakeSession(_response(200)))
+    assert response.status_code == 200
+
+def test_trial_is_released_after_a_429(clock):
+    api = ApiClient(max_retries=0, breaker_threshold=1, breaker_reset=30)
+    with pytest.raises(requests.ConnectionError):
+        api.request('GET', 'https://example.com/', session=FakeSession(requests.ConnectionError("refused")))
+    clock.now += 30
+    assert api.request('GET', 'https://example.com/', session=FakeSession(_response(429))).status_code == 429
+    assert api.request('GET', 'https://example.com/', session=FakeSession(_response(200))).status_code == 200
+
+def test_token_bucket_waits_for_refill(clock):
+    bucket = TokenBucket(rate=2.0, burst=2)
+    assert bucket.acquire() == 0
+    assert bucket.acquire() == 0
+    assert bucket.acquire() == pytest.approx(0.5)
+    bucket.observe(0)
+    assert bucket.acquire() == pytest.approx(0.5)
@@ -0,0 +1,45 @@
+import logging
+
+import pytest
+
+from benchmarks.fleet import generate_fleet, hetzner_projects
+from benchmarks.mock_api import MockApi
+from cloudmesh import api
+from cloudmesh.collector import collect_inventory
+
+# Small pages so every listing has several, fetched in parallel.
+PAGE_SIZES = {'hetzner': {'max': 5}, 'zones': {'max': 2}, 'dns_records': {'max': 20}}
+
+@pytest.fixture
+def mock_api(monkeypatch):
+    fleet = generate_fleet(120, 400, projects=3, zones=6)
+    with MockApi(fleet, latency=0.01, page_sizes=PAGE_SIZES) as mock:
+        monkeypatch.setattr(api, 'HETZNER_API_URL', mock.hetzner_url)
+        monkeypatch.setattr(api, 'CLOUDFLARE_API_URL', mock.cloudflare_url)
+        monkeypatch.setattr(api, '_cache', None)
+        yield mock
+    api.set_limits(api.DEFAULT_LIMITS)
+
+def _collect(mock, limits=None):
+    hetzner_results, zone_records, network_resources = collect_inventory(
+        ['any'], hetzner_projects(mock.fleet), limits
+    )
+    assert len(hetzner_results) == 120
+    assert sum(len(records) for _, records in zone_records) == 400
+    return mock.stats['max_in_flight']
+
+def test_limits_cap_requests_in_flight(mock_api):
+    peak = _collect(mock_api, {'global': 4, 'hetzner': 2, 'cloudflare': 2})
+    assert peak['hetzner'] <= 2
+    assert peak['cloudflare'] <= 2
+    assert 2 <= peak['all'] <= 4
+
+def test_global_limit_applies_across_providers(mock_api):
+    peak = _collect(mock_api, {'global': 3, 'hetzner': 3, 'cloudflare': 3})
+    assert peak['all'] <= 3
+
+def test_connection_pool_holds_every_request_in_flight(mock_api, caplog):
+    with caplog.at_level(logging.WARNING, logger='urllib3'):
+        peak = _collect(mock_api)
+    assert peak['all'] <= api.DEFAULT_LIMITS['global']
+    assert 'Connection pool is full' not in caplog.text
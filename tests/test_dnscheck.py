@@ -0,0 +1,64 @@
+from cloudmesh.dnscheck import cross_check
+from cloudmesh.records import address_records
+from cloudmesh.resolver import Answer
+
+ZONE = {'id': 'zone1', 'name': 'example.com'}
+
+def _record(name, record_type, content, proxied=False, ttl=300):
+    return {'type': record_type, 'name': name, 'content': content, 'ttl': ttl, 'proxied': proxied}
+
+class FakeResolver:
+    def __init__(self, answers):
+        self.answers = answers
+        self.queries = []
+
+    def resolve(self, queries):
+        queries = list(queries)
+        self.queries.extend(queries)
+        return {query: self.answers.get(query, Answer('nxdomain', (), 60)) for query in queries}
+
+class HetznerIndex:
+    def __init__(self, addresses):
+        self.addresses = set(addresses)
+
+    def lookup(self, address):
+        return address in self.addresses
+
+def _check(zone_entries, answers, hetzner=('192.0.2.1',)):
+    zone_records = [(ZONE, zone_entries)]
+    dns = FakeResolver(answers)
+    checks = cross_check(zone_records, list(address_records(zone_records)), HetznerIndex(hetzner), dns)
+    return {check.subdomain: check for check in checks}, dns
+
+def test_statuses():
+    checks, _ = _check([
+        _record('ok.example.com', 'A', '192.0.2.1'),
+        _record('moved.example.com', 'A', '192.0.2.1'),
+        _record('gone.example.com', 'A', '192.0.2.1'),
+        _record('out.example.com', 'CNAME', 'target.example.net'),
+    ], {
+        ('ok.example.com', 'A'): Answer('ok', ('192.0.2.1',), 300),
+        ('moved.example.com', 'A'): Answer('ok', ('198.51.100.7',), 300),
+        ('out.example.com', 'A'): Answer('ok', ('198.51.100.8',), 60),
+    })
+    assert checks['ok'].status == 'match'
+    assert checks['moved'].status == 'mismatch'
+    assert checks['moved'].off_hetzner == ('198.51.100.7',)
+    assert checks['gone'].status == 'unresolved'
+    assert checks['gone'].detail == 'nxdomain'
+    assert checks['out'].status == 'external'
+    assert 'not on Hetzner: 198.51.100.8' in checks['out'].detail
+
+def test_proxied_names_are_resolved_and_checked_against_cloudflare():
+    checks, dns = _check([
+        _record('edge.example.com', 'A', '192.0.2.1', proxied=True),
+        _record('leak.example.com', 'A', '192.0.2.1', proxied=True),
+        _record('dark.example.com', 'A', '192.0.2.1', proxied=True),
+    ], {
+        ('edge.example.com', 'A'): Answer('ok', ('104.16.1.1',), 300),
+        ('leak.example.com', 'A'): Answer('ok', ('192.0.2.1',), 300),
+    })
+    assert ('edge.example.com', 'A') in dns.queries
+    assert checks['edge'].status == 'proxied'
+    assert checks['leak'].status == 'mismatch'
+    assert checks['dark'].status == 'unresolved'
@@ -0,0 +1,91 @@
+import os
+from datetime import datetime, timezone
+
+import pytest
+
+from cloudmesh.history import HistoryStore, to_millis, unmatched_since
+from cloudmesh.mapping import MappingResult
+from cloudmesh.model import NO_MATCH, MappingRow, ResourceRow
+
+def _at(*args):
+    return datetime(*args, tzinfo=timezone.utc).timestamp()
+
+def _resource(name, ip, project='web', status='running', price=4.51):
+    return ResourceRow(project, name, ip, status, '2024-01-01T00:00:00Z', 'cx22', '', price, 0)
+
+def _result(records, resources):
+    # records: [(domain, subdomain, ip)], matched by ip against resources.
+    by_ip = {resource.ip: resource for resource in resources}
+    mapping_by_domain = {}
+    for domain, subdomain, ip in records:
+        row = MappingRow(domain, subdomain, ip, 'A', by_ip.get(ip, NO_MATCH))
+        mapping_by_domain.setdefault(domain, []).append(row)
+    matched = {ip for _, _, ip in records if ip in by_ip}
+    unmatched = {ip for _, _, ip in records if ip not in by_ip}
+    return MappingResult(
+        mapping_by_domain, set(mapping_by_domain), len(records), matched, unmatched, resources, None, None
+    )
+
+def test_unchanged_rows_extend_one_version(tmp_path):
+    store = HistoryStore(str(tmp_path))
+    web = _resource('web1', '192.0.2.1')
+    db = _resource('db1', '192.0.2.2', project='data')
+    first = store.record(_result([('example.com', 'www', '192.0.2.1')], [web, db]), _at(2024, 3, 1, 12))
+    second = store.record(_result([('example.com', 'www', '192.0.2.2')], [web, db]), _at(2024, 3, 1, 13))
+
+    # The resource did not change: one version spanning both runs.
+    resources, records = store.ip_history('192.0.2.1')
+    assert [(version['server_name'], version['first_seen'], version['last_seen']) for version in resources] == [
+        ('web1', first, second)
+    ]
+    # The record moved: its first version closes at the first run and a
+    # second one opens at the second.
+    versions = store.record_history('example.com', 'www')
+    assert [(version['ip'], version['first_seen'], version['last_seen']) for version in versions] == [
+        ('192.0.2.1', first, first), ('192.0.2.2', second, second)
+    ]
+    assert [run['run_at'] for run in store.runs()] == [first, second]
+
+def test_runs_are_append_only(tmp_path):
+    store = HistoryStore(str(tmp_path))
+    result = _result([('example.com', 'www', '192.0.2.1')], [_resource('web1', '192.0.2.1')])
+    store.record(result, _at(2024, 3, 1, 12))
+    with pytest.raises(ValueError):
+        store.record(result, _at(2024, 3, 1, 11))
+
+def test_monthly_partitions(tmp_path):
+    store = HistoryStore(str(tmp_path))
+    web = _resource('web1', '192.0.2.1')
+    result = _result([('example.com', 'www', '192.0.2.1')], [web])
+    january = store.record(result, _at(2024, 1, 31, 23))
+    february = store.record(result, _at(2024, 2, 1, 1))
+    cheaper = _result([('example.com', 'www', '192.0.2.1')], [_resource('web1', '192.0.2.1', price=3.79)])
+    later = store.record(cheaper, _at(2024, 2, 15))
+
+    assert sorted(os.listdir(tmp_path)) == ['2024-01.sqlite', '2024-02.sqlite']
+    assert [os.path.basename(path) for path in store.partitions(since=to_millis(_at(2024, 2, 10)))] == [
+        '2024-02.sqlite'
+    ]
+
+    # A version open at the end of January and continued by February's
+    # first run is returned once.
+    versions = store.record_history('example.com')
+    assert [(version['first_seen'], version['last_seen']) for version in versions] == [(january, later)]
+    resources, _ = store.ip_history('192.0.2.1')
+    assert [(version['price_monthly'], version['first_seen'], version['last_seen']) for version in resources] == [
+        (4.51, january, february), (3.79, later, later)
+    ]
+
+    assert store.project_costs(bucket='month') == {'2024-01': {'web': (1, 4.51)}, '2024-02': {'web': (1, 3.79)}}
+    assert list(store.project_costs(bucket='day')) == ['2024-01-31', '2024-02-01', '2024-02-15']
+    assert store.project_costs(since=to_millis(_at(2024, 2, 10)), bucket='run') == {later: {'web': (1, 3.79)}}
+    with pytest.raises(ValueError):
+        store.project_costs(bucket='year')
+
+def test_unmatched_since(tmp_path):
+    store = HistoryStore(str(tmp_path))
+    web = _resource('web1', '192.0.2.1')
+    store.record(_result([('example.com', 'www', '192.0.2.1')], [web]), _at(2024, 3, 1))
+    lost = store.record(_result([('example.com', 'www', '192.0.2.1')], []), _at(2024, 3, 2))
+    last = store.record(_result([('example.com', 'www', '192.0.2.1')], []), _at(2024, 3, 3))
+    assert unmatched_since(store.record_history('example.com')) == {('www', 'A'): (lost, last)}
@@ -0,0 +1,172 @@
+import gzip
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from prometheus_client import CollectorRegistry, Gauge
+
+from cloudmesh import client, push
+from cloudmesh.push import group_path, load_state, push_groups
+
+JOB = 'cloudmesh'
+
+class StubGateway:
+    # A Pushgateway stand-in recording (method, path, body) of every request;
+    # requests for (method, path) in `fail` are answered 400.
+    def __init__(self):
+        self.requests = []
+        self.fail = set()
+        gateway = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _handle(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                if self.headers.get('Content-Encoding') == 'gzip':
+                    body = gzip.decompress(body)
+                gateway.requests.append((self.command, self.path, body))
+                status = 400 if (self.command, self.path) in gateway.fail else 200
+                self.send_response(status)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            do_PUT = do_DELETE = _handle
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def take(self):
+        # (method, path) of the requests since the last call.
+        requests, self.requests = self.requests, []
+        return sorted((method, path) for method, path, _ in requests)
+
+@pytest.fixture
+def gateway(monkeypatch):
+    # No retries, so failures answer at once.
+    monkeypatch.setattr(client, '_client', client.ApiClient(max_retries=0))
+    gateway = StubGateway()
+    gateway.thread.start()
+    yield gateway
+    gateway.server.shutdown()
+    gateway.server.server_close()
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(push.time, 'time', lambda: now[0])
+    return now
+
+def _registry(domains):
+    registry = CollectorRegistry()
+    records = Gauge('cloudmesh_domain_records', 'Records per domain', ['domain'], registry=registry)
+    runs = Gauge('cloudmesh_runs', 'Runs', registry=registry)
+    runs.set(1)
+    for domain, count in domains.items():
+        records.labels(domain).set(count)
+    return registry
+
+def _path(domain=None):
+    return '/' + group_path(JOB, (('domain', domain),) if domain else ())
+
+def _push(gateway, state_path, domains, **kwargs):
+    return push_groups(gateway.url, JOB, _registry(domains), state_path=state_path, **kwargs)
+
+def test_first_push_sends_every_group(gateway, clock, tmp_path):
+    state_path = str(tmp_path / 'push_state.json')
+    pushed, deleted = _push(gateway, state_path, {'a.example': 1, 'b.example': 2})
+    assert gateway.take() == [('PUT', _path()), ('PUT', _path('a.example')), ('PUT', _path('b.example'))]
+    assert deleted == []
+    assert all(result.error is None for result in pushed)
+    state = load_state(state_path)[f"{gateway.url}/{group_path(JOB)}"]
+    assert set(state) == {group_path(JOB), group_path(JOB, (('domain', 'a.example'),)),
+                          group_path(JOB, (('domain', 'b.example'),))}
+
+def test_groups_are_sent_gzipped(gateway, clock, tmp_path):
+    _push(gateway, str(tmp_path / 'push_state.json'), {'a.example': 1})
+    bodies = {path: body for _, path, body in gateway.requests}
+    assert b'cloudmesh_domain_records{domain="a.example"} 1.0' in bodies[_path('a.example')]
+
+def test_unchanged_groups_are_skipped(gateway, clock, tmp_path):
+    state_path = str(tmp_path / 'push_state.json')
+    _push(gateway, state_path, {'a.example': 1, 'b.example': 2})
+    gateway.take()
+    clock[0] += 60
+    pushed, _ = _push(gateway, state_path, {'a.example': 1, 'b.example': 3})
+    # The job's own group is always sent.
+    assert gateway.take() == [('PUT', _path()), ('PUT', _path('b.example'))]
+    skipped = [result.path for result in pushed if result.sent_bytes is None]
+    assert skipped == [group_path(JOB, (('domain', 'a.example'),))]
+
+def test_unchanged_groups_are_pushed_again_after_the_refresh_interval(gateway, clock, tmp_path):
+    state_path = str(tmp_path / 'push_state.json')
+    _push(gateway, state_path, {'a.example': 1}, refresh_interval=600)
+    gateway.take()
+    clock[0] += 599
+    _push(gateway, state_path, {'a.example': 1}, refresh_interval=600)
+    assert gateway.take() == [('PUT', _path())]
+    clock[0] += 1
+    _push(gateway, state_path, {'a.example': 1}, refresh_interval=600)
+    assert gateway.take() == [('PUT', _path()), ('PUT', _path('a.example'))]
+
+def test_without_a_state_file_every_group_is_pushed(gateway, clock, tmp_path):
+    _push(gateway, None, {'a.example': 1})
+    gateway.take()
+    _push(gateway, None, {'a.example': 1})
+    assert gateway.take() == [('PUT', _path()), ('PUT', _path('a.example'))]
+
+def test_failed_push_keeps_the_previous_state(gateway, clock, tmp_path):
+    state_path = str(tmp_path / 'push_state.json')
+    _push(gateway, state_path, {'a.example': 1})
+    state_before = load_state(state_path)
+    gateway.take()
+
+    gateway.fail.add(('PUT', _path('a.example')))
+    pushed, _ = _push(gateway, state_path, {'a.example': 2})
+    assert [result.path for result in pushed if result.error] == [group_path(JOB, (('domain', 'a.example'),))]
+    key = f"{gateway.url}/{group_path(JOB)}"
+    group = group_path(JOB, (('domain', 'a.example'),))
+    assert load_state(state_path)[key][group] == state_before[key][group]
+    gateway.take()
+
+    # The same exposition is sent again on the next run.
+    gateway.fail.clear()
+    _push(gateway, state_path, {'a.example': 2})
+    assert ('PUT', _path('a.example')) in gateway.take()
+
+def test_failed_first_push_is_retried(gateway, clock, tmp_path):
+    state_path = str(tmp_path / 'push_state.json')
+    gateway.fail.add(('PUT', _path('a.example')))
+    _push(gateway, state_path, {'a.example': 1})
+    gateway.take()
+    gateway.fail.clear()
+    _push(gateway, state_path, {'a.example': 1})
+    assert ('PUT', _path('a.example')) in gateway.take()
+
+def test_groups_that_are_gone_are_deleted(gateway, clock, tmp_path):
+    state_path = str(tmp_path / 'push_state.json')
+    _push(gateway, state_path, {'a.example': 1, 'b.example': 2})
+    gateway.take()
+    _, deleted = _push(gateway, state_path, {'a.example': 1})
+    assert gateway.take() == [('DELETE', _path('b.example')), ('PUT', _path())]
+    assert [result.path for result in deleted] == [group_path(JOB, (('domain', 'b.example'),))]
+    # Deleted once, not again on the next run.
+    _push(gateway, state_path, {'a.example': 1})
+    assert gateway.take() == [('PUT', _path())]
+
+def test_failed_delete_is_retried_on_the_next_run(gateway, clock, tmp_path):
+    state_path = str(tmp_path / 'push_state.json')
+    _push(gateway, state_path, {'a.example': 1, 'b.example': 2})
+    gateway.take()
+    gateway.fail.add(('DELETE', _path('b.example')))
+    _, deleted = _push(gateway, state_path, {'a.example': 1})
+    assert deleted[0].error is not None
+    gateway.take()
+    gateway.fail.clear()
+    _push(gateway, state_path, {'a.example': 1})
+    assert gateway.take() == [('DELETE', _path('b.example')), ('PUT', _path())]
@@ -0,0 +1,210 @@
+import asyncio
+import socket
+import struct
+import threading
+
+import pytest
+
+from cloudmesh import resolver
+from cloudmesh.resolver import Answer, Resolver, encode_name, encode_query, parse_response
+
+TYPES = {'A': 1, 'AAAA': 28, 'CNAME': 5}
+
+def _rdata(record_type, value):
+    if record_type == 'A':
+        return socket.inet_pton(socket.AF_INET, value)
+    if record_type == 'AAAA':
+        return socket.inet_pton(socket.AF_INET6, value)
+    return encode_name(value)
+
+def build_response(query, answers=(), rcode=0, truncated=False):
+    # A response to `query` with (owner, type, ttl, value) answers. Owners
+    # equal to the question name are written as a compression pointer to it.
+    query_id = struct.unpack('!H', query[:2])[0]
+    question_name, offset = resolver._read_name(query, 12)
+    question = query[12:offset + 4]
+    flags = 0x8180 | rcode | (0x0200 if truncated else 0)
+    body = b''
+    for owner, record_type, ttl, value in answers:
+        rdata = _rdata(record_type, value)
+        name = b'\xc0\x0c' if owner == question_name else encode_name(owner)
+        body += name + struct.pack('!HHIH', TYPES[record_type], 1, ttl, len(rdata)) + rdata
+    return struct.pack('!HHHHHH', query_id, flags, 1, len(answers), 0, 0) + question + body
+
+class StubServer:
+    # A UDP and TCP DNS server on one port answering from
+    # {(name, type): answers}; names missing from it are NXDOMAIN, names in
+    # `drop` are never answered and names in `truncate` only over TCP.
+    def __init__(self, zone, drop=(), truncate=()):
+        self.zone = zone
+        self.drop = set(drop)
+        self.truncate = set(truncate)
+        self.queries = []
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+
+    def answer(self, query, tcp=False):
+        name, offset = resolver._read_name(query, 12)
+        record_type = {value: key for key, value in TYPES.items()}[struct.unpack('!H', query[offset:offset + 2])[0]]
+        self.queries.append((name, record_type, 'tcp' if tcp else 'udp'))
+        if name in self.drop:
+            return None
+        if not tcp and name in self.truncate:
+            return build_response(query, truncated=True)
+        if not any(key[0] == name for key in self.zone):
+            return build_response(query, rcode=3)
+        return build_response(query, self.zone.get((name, record_type), ()))
+
+    async def _start(self):
+        server = self
+
+        class Udp(asyncio.DatagramProtocol):
+            def connection_made(self, transport):
+                self.transport = transport
+
+            def datagram_received(self, data, addr):
+                response = server.answer(data)
+                if response is not None:
+                    self.transport.sendto(response, addr)
+
+        async def tcp(reader, writer):
+            length = struct.unpack('!H', await reader.readexactly(2))[0]
+            response = server.answer(await reader.readexactly(length), tcp=True)
+            writer.write(struct.pack('!H', len(response)) + response)
+            await writer.drain()
+            writer.close()
+
+        self.tcp_server = await asyncio.start_server(tcp, '127.0.0.1', 0)
+        self.port = self.tcp_server.sockets[0].getsockname()[1]
+        self.udp, _ = await self.loop.create_datagram_endpoint(Udp, local_addr=('127.0.0.1', self.port))
+
+    def __enter__(self):
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(self._start(), self.loop).result(5)
+        return self
+
+    def __exit__(self, *exc):
+        self.udp.close()
+        self.tcp_server.close()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(5)
+
+    @property
+    def upstream(self):
+        return f"127.0.0.1:{self.port}"
+
+ZONE = {
+    ('www.example.com', 'A'): [('www.example.com', 'A', 300, '192.0.2.1'), ('www.example.com', 'A', 300, '192.0.2.2')],
+    ('www.example.com', 'AAAA'): [('www.example.com', 'AAAA', 600, '2001:db8::1')],
+    ('alias.example.com', 'A'): [
+        ('alias.example.com', 'CNAME', 120, 'www.example.com'),
+        ('www.example.com', 'A', 300, '192.0.2.1'),
+    ],
+    ('mail.example.com', 'A'): [('mail.example.com', 'A', 60, '192.0.2.25')],
+}
+
+def test_encode_name_rejects_invalid_labels():
+    assert encode_name('www.example.com.') == b'\x03www\x07example\x03com\x00'
+    with pytest.raises(ValueError):
+        encode_name('a..b')
+    with pytest.raises(ValueError):
+        encode_name('x' * 64 + '.example.com')
+
+def test_parse_response_follows_cnames_with_the_lowest_ttl():
+    query = encode_query(7, 'alias.example.com', 'A')
+    response = build_response(query, [
+        ('alias.example.com', 'CNAME', 120, 'edge.example.net'),
+        ('edge.example.net', 'A', 300, '192.0.2.9'),
+        ('other.example.net', 'A', 5, '192.0.2.99'),
+    ])
+    query_id, truncated, question, answer = parse_response(response)
+    assert (query_id, truncated, question) == (7, False, ('alias.example.com', 1))
+    assert answer == Answer('ok', ('192.0.2.9',), 120)
+
+def test_parse_response_negative_answers():
+    query = encode_query(1, 'missing.example.com', 'A')
+    assert parse_response(build_response(query, rcode=3))[3] == Answer('nxdomain', (), resolver.NEGATIVE_TTL)
+    assert parse_response(build_response(query, rcode=2))[3] == Answer('servfail', (), resolver.NEGATIVE_TTL)
+    assert parse_response(build_response(query))[3] == Answer('nodata', (), resolver.NEGATIVE_TTL)
+    assert parse_response(build_response(query, truncated=True))[1] is True
+
+def test_resolve_against_stub_server():
+    with StubServer(ZONE) as server:
+        answers = Resolver(server.upstream, timeout=0.5, cache_path=None).resolve([
+            ('WWW.example.com.', 'A'), ('www.example.com', 'AAAA'), ('alias.example.com', 'A'),
+            ('mail.example.com', 'AAAA'), ('nowhere.example.com', 'A'),
+        ])
+    assert answers == {
+        ('www.example.com', 'A'): Answer('ok', ('192.0.2.1', '192.0.2.2'), 300),
+        ('www.example.com', 'AAAA'): Answer('ok', ('2001:db8::1',), 600),
+        ('alias.example.com', 'A'): Answer('ok', ('192.0.2.1',), 120),
+        ('mail.example.com', 'AAAA'): Answer('nodata', (), resolver.NEGATIVE_TTL),
+        ('nowhere.example.com', 'A'): Answer('nxdomain', (), resolver.NEGATIVE_TTL),
+    }
+
+def test_idn_names_are_queried_and_matched_in_punycode():
+    zone = {('xn--bcher-kva.example.com', 'A'): [('xn--bcher-kva.example.com', 'A', 300, '192.0.2.7')]}
+    with StubServer(zone) as server:
+        answers = Resolver(server.upstream, timeout=0.5, attempts=1, cache_path=None).resolve([
+            ('Bücher.example.com', 'A'),
+        ])
+    assert answers == {('bücher.example.com', 'A'): Answer('ok', ('192.0.2.7',), 300)}
+    assert server.queries == [('xn--bcher-kva.example.com', 'A', 'udp')]
+
+def test_truncated_answers_are_retried_over_tcp():
+    with StubServer(ZONE, truncate={'www.example.com'}) as server:
+        dns = Resolver(server.upstream, timeout=0.5, cache_path=None)
+        answers = dns.resolve([('www.example.com', 'A')])
+    assert answers[('www.example.com', 'A')] == Answer('ok', ('192.0.2.1', '192.0.2.2'), 300)
+    assert server.queries == [('www.example.com', 'A', 'udp'), ('www.example.com', 'A', 'tcp')]
+    assert dns.stats['tcp'] == 1
+
+def test_unanswered_queries_time_out_after_every_attempt():
+    with StubServer(ZONE, drop={'mail.example.com'}) as server:
+        dns = Resolver(server.upstream, timeout=0.1, attempts=3, cache_path=None)
+        answers = dns.resolve([('mail.example.com', 'A'), ('www.example.com', 'A')])
+    assert answers[('mail.example.com', 'A')] == Answer('timeout', (), 0)
+    assert answers[('www.example.com', 'A')].status == 'ok'
+    assert server.queries.count(('mail.example.com', 'A', 'udp')) == 3
+    # Timeouts are not cached.
+    assert ('mail.example.com', 'A') not in dns.cache
+
+def test_answers_are_cached_for_their_ttl(tmp_path, monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(resolver.time, 'time', lambda: now[0])
+    cache_path = tmp_path / 'dns.json'
+    queries = [('www.example.com', 'A'), ('mail.example.com', 'A'), ('nowhere.example.com', 'A')]
+    with StubServer(ZONE) as server:
+        first = Resolver(server.upstream, timeout=0.5, cache_path=str(cache_path))
+        answers = first.resolve(queries)
+        assert len(server.queries) == 3
+
+        # A new resolver reads the cache file: nothing is asked again.
+        second = Resolver(server.upstream, timeout=0.5, cache_path=str(cache_path))
+        assert second.resolve(queries) == answers
+        assert second.stats['cached'] == 3
+        assert len(server.queries) == 3
+
+        # Past the 60 s TTLs (mail, and the negative answer) but within the
+        # 300 s one, only the expired entries are resolved again.
+        now[0] += 61
+        second.resolve(queries)
+        assert sorted(name for name, _, _ in server.queries[3:]) == ['mail.example.com', 'nowhere.example.com']
+
+        now[0] += 300
+        assert Resolver(server.upstream, cache_path=str(cache_path)).cache == {}
+
+def test_invalid_names_are_not_sent():
+    with StubServer(ZONE) as server:
+        answers = Resolver(server.upstream, timeout=0.5, cache_path=None).resolve([('bad..example.com', 'A')])
+    assert answers == {('bad..example.com', 'A'): Answer('error', (), 0)}
+    assert server.queries == []
+
+@pytest.mark.parametrize('upstream, expected', [
+    ('192.0.2.53', ('192.0.2.53', 53)),
+    ('127.0.0.1:5353', ('127.0.0.1', 5353)),
+    ('[2001:db8::53]:5353', ('2001:db8::53', 5353)),
+    ('2001:db8::53', ('2001:db8::53', 53)),
+])
+def test_parse_upstream(upstream, expected):
+    assert resolver.parse_upstream(upstream) == expected
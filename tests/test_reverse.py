@@ -0,0 +1,55 @@
+from cloudmesh.model import NO_MATCH, MappingRow, ResourceRow
+from cloudmesh.report import render_reverse_index
+from cloudmesh.reverse import UNASSIGNED, build_reverse_index
+
+def _resource(name, ip, status='running', server_type='cx22', price=4.51, project='web'):
+    return ResourceRow(project, name, ip, status, '2024-01-01T00:00:00Z', server_type, '', price, 0)
+
+WEB = _resource('web1', '192.0.2.1')
+OLD = _resource('old1', '192.0.2.2', status='off')
+LB = _resource('lb1', '192.0.2.3', status='disabled', server_type='lb11', price=5.39)
+FLOATING = _resource('192.0.2.4', '192.0.2.4', status=UNASSIGNED, server_type='floating-ip', price=3.57)
+SPARE = _resource('spare', '192.0.2.5', status=UNASSIGNED, server_type='primary-ip', price=0.5)
+IDLE = _resource('idle1', '192.0.2.6', project='data')
+RESOURCES = [WEB, OLD, LB, FLOATING, SPARE, IDLE]
+
+def _index():
+    by_ip = {resource.ip: resource for resource in RESOURCES}
+    rows = [
+        MappingRow(domain, subdomain, ip, 'A', by_ip.get(ip, NO_MATCH))
+        for domain, subdomain, ip in [
+            ('example.com', 'www', '192.0.2.1'),
+            ('example.com', 'old', '192.0.2.2'),
+            ('example.com', 'lb', '192.0.2.3'),
+            ('example.com', 'vip', '192.0.2.4'),
+            ('example.org', 'www', '192.0.2.1'),
+            ('example.org', 'gone', '198.51.100.1'),
+        ]
+    ]
+    return build_reverse_index(rows, RESOURCES)
+
+def test_unassigned_ips_are_not_stopped_targets():
+    index = _index()
+    assert [row['subdomain'] for row in index.stopped_targets] == ['old', 'lb']
+    assert [row['subdomain'] for row in index.unassigned_targets] == ['vip']
+
+def test_unassigned_ips_are_priced_per_project_whether_referenced_or_not():
+    index = _index()
+    assert index.unassigned == {'web': (2, 4.07), 'data': (0, 0.0)}
+    # The unreferenced primary IP also counts as unused, like any resource
+    # no record points at.
+    assert [resource['server_name'] for resource in index.unreferenced] == ['spare', 'idle1']
+    assert index.unused == {'web': (1, 0.5), 'data': (1, 4.51)}
+
+def test_shared_ips_and_totals():
+    index = _index()
+    assert index.shared_ips == {'192.0.2.1': {'example.com', 'example.org'}}
+    assert index.totals == {'web': 5, 'data': 1}
+
+def test_report_lists_unassigned_targets_apart():
+    html = render_reverse_index(_index())
+    stopped, unassigned = html.split('Records Pointing at Unassigned IPs')
+    assert 'Records Pointing at Stopped Resources (2)' in stopped
+    assert '192.0.2.4' not in stopped.split('Records Pointing at Stopped Resources')[1]
+    assert unassigned.startswith(' (1)')
+    assert '<td>vip</td>' in unassigned
@@ -0,0 +1,41 @@
+import threading
+
+from cloudmesh.scheduler import IntervalScheduler
+
+def _run(scheduler, timeout=5):
+    thread = threading.Thread(target=scheduler.run, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    scheduler.stop()
+    assert not thread.is_alive()
+
+def test_failed_task_is_retried_after_its_retry_interval():
+    scheduler = IntervalScheduler()
+    calls = []
+
+    def task():
+        calls.append(len(calls))
+        if len(calls) == 1:
+            raise RuntimeError("first run fails")
+        scheduler.stop()
+
+    scheduler.add('task', 3600, task, retry_interval=0.01)
+    _run(scheduler)
+    assert calls == [0, 1]
+
+def test_failing_task_does_not_stop_the_others():
+    scheduler = IntervalScheduler()
+    calls = []
+
+    def failing():
+        calls.append('failing')
+        raise RuntimeError("collection failed")
+
+    def other():
+        calls.append('other')
+        scheduler.stop()
+
+    scheduler.add('failing', 3600, failing)
+    scheduler.add('other', 3600, other)
+    _run(scheduler)
+    assert calls == ['failing', 'other']